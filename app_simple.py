@@ -4,72 +4,143 @@ Enhanced YouTube Video Downloader - Web App
 Flask-based web application with folder selection, quality options, and optimized downloads
 """
 
-from flask import Flask, render_template, request, jsonify
-import subprocess
+from flask import Flask, Response, render_template, request, jsonify, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
+import logging
 import os
 import re
 import threading
-import time
-from datetime import datetime
 import urllib.parse
-import glob
+import unicodedata
+import uuid
+
+from extraction import USER_AGENT, ExtractionError, create_extractor
+from client_strategy import HedgedClientStrategy
+from metadata_cache import create_metadata_cache, trim_info
+from scheduler import DownloadScheduler, QueueFullError
+from quality import is_audio_only, ranker_from_env, select_quality_options
+from youtube_url import canonical_url, parse_youtube_url
+from progress import PROGRESS_ARGS, JobProgress, parse_progress_line
+from job_store import create_job_store
+from job_events import WaiterLimiter
+from output_cache import OutputCache, create_output_cache
+from governor import create_governor, priority_class, priority_rank
+from thumbnails import FORMATS as THUMBNAIL_FORMATS, SIZES as THUMBNAIL_SIZES, ThumbnailError, \
+    create_thumbnail_cache, negotiate_format
+from segmented import SCRIPT as SEGMENTED_SCRIPT, can_segment, segmented_command
+from storage import JobLock, create_storage_manager
+from supervisor import ProcessResult, ProcessSupervisor
+from toolchain import create_toolchain
+from logs import configure_logging, get_logger
+from metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, DOWNLOADED_BYTES, DOWNLOADS, REGISTRY, Counter, Gauge,
+                     stage)
+from batch import BatchManager
+from recovery import JobRecovery
+from streaming import (MediaStream, StreamLimiter, StreamSlotsExhaustedError, StreamUnavailableError,
+                       build_stream_command, select_stream_formats, stream_container)
 
 app = Flask(__name__)
+# Behind Railway's proxy the client address is the X-Forwarded-For hop that proxy appended
+TRUSTED_PROXIES = int(os.environ.get('YTDL_TRUSTED_PROXIES', 1))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=0)
+
+configure_logging()
+log = get_logger('app')
+
+# Download progress and status, shared across workers when YTDL_JOB_DB is set
+job_store = create_job_store()
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled', 'unknown')
+LONG_POLL_MAX_WAIT = 30
+SSE_HEARTBEAT = 15
+FILE_MAX_AGE = 3600
+# Thumbnails rarely change; browsers revalidate them by ETag after a week
+THUMBNAIL_MAX_AGE = 7 * 86400
+
+FFMPEG_BENCH_PATTERN = re.compile(r'bench: utime=([\d.]+)s stime=([\d.]+)s')
+
+# A yt-dlp fetch or FFmpeg merge still running after its deadline, or silent (no progress) for
+# STALL_TIMEOUT seconds, is killed together with its children
+FETCH_TIMEOUT = int(os.environ.get('YTDL_FETCH_TIMEOUT', 3600))
+MERGE_TIMEOUT = int(os.environ.get('YTDL_MERGE_TIMEOUT', 120))
+STALL_TIMEOUT = int(os.environ.get('YTDL_STALL_TIMEOUT', 120))
+# /api/stream responses get the same stall limit and their own deadline
+STREAM_TIMEOUT = int(os.environ.get('YTDL_STREAM_TIMEOUT', FETCH_TIMEOUT))
 
-# Global variables for download tracking
-download_progress = {}
-download_status = {}
+# Large single-file video formats are fetched over several Range connections (segmented.py)
+# instead of yt-dlp's one; fragmented (DASH) formats get as many concurrent fragments
+SEGMENTED_CONNECTIONS = int(os.environ.get('YTDL_SEGMENTED_CONNECTIONS', 4))
+SEGMENTED_MIN_BYTES = int(os.environ.get('YTDL_SEGMENTED_MIN_MB', 16)) * 1024 * 1024
+
+# CPU priority of FFmpeg merges and MP3 conversions, so they yield to the request threads
+MERGE_NICE = int(os.environ.get('YTDL_MERGE_NICE', 10))
+
+def limit_rate_args(rate):
+    """yt-dlp arguments for a transfer's bandwidth share (fixed for the process's lifetime, so
+    the governor must register it as a fixed transfer)"""
+    return ["--limit-rate", str(rate)] if rate else []
+
+def record_downloaded_bytes(progress):
+    """Add a finished job's per-stream byte counts to ytdl_downloaded_bytes_total"""
+    for stream, values in progress.snapshot()['streams'].items():
+        if values['downloaded_bytes']:
+            DOWNLOADED_BYTES.inc(values['downloaded_bytes'], stream=stream)
+
+def update_job(download_id, status, progress=None):
+    """Record a job's status (and optionally its progress) and wake anyone waiting on it"""
+    job_store.update(download_id, status, progress)
+
+def process_failure(what, result):
+    """Job status for a yt-dlp run that failed, was killed or was cancelled"""
+    if result.reason == 'cancelled':
+        return {'status': 'cancelled'}
+    if result.reason == 'timeout':
+        return {'status': 'error', 'error': f"{what} timed out after {FETCH_TIMEOUT}s"}
+    if result.reason == 'stalled':
+        return {'status': 'error', 'error': f"{what} stalled (no progress for {STALL_TIMEOUT}s)"}
+    return {'status': 'error', 'error': f"{what} failed: {result.stderr}"}
 
 class EnhancedYouTubeDownloader:
-    def __init__(self):
+    def __init__(self, toolchain=None, supervisor=None):
         # Use /tmp for cloud deployments, fallback to Downloads for local
         if os.path.exists('/tmp'):
             self.download_path = "/tmp"
         else:
             self.download_path = os.path.expanduser("~/Downloads")
-        self.ffmpeg_available = self.check_ffmpeg()
-        
-    def check_ffmpeg(self):
-        """Check if FFmpeg is available in the system"""
-        try:
-            # Try the standard PATH first
-            result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return True
-        except:
-            pass
-        
-        # Try common FFmpeg installation paths on Windows
-        ffmpeg_paths = [
-            r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
-            r"C:\ffmpeg\bin\ffmpeg.exe",
-            r"C:\ffmpeg-7.1.1-full_build\bin\ffmpeg.exe",
-            os.path.expanduser(r"~\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg.exe")
-        ]
-        
-        for path in ffmpeg_paths:
-            try:
-                if os.path.exists(path):
-                    result = subprocess.run([path, "-version"], capture_output=True, text=True, timeout=10)
-                    if result.returncode == 0:
-                        # Store the path for later use
-                        self.ffmpeg_path = path
-                        return True
-            except:
-                continue
-        
-        return False
+        # FFmpeg and yt-dlp are located on first use (or in the background), not at import
+        self.toolchain = toolchain or create_toolchain()
+        self.supervisor = supervisor or ProcessSupervisor()
+        self.extractor = create_extractor(toolchain=self.toolchain)
+        self.metadata_cache = create_metadata_cache()
+        self.quality_ranker = ranker_from_env()
+        self.client_strategy = HedgedClientStrategy(hedge_delay=float(os.environ.get('YTDL_HEDGE_DELAY', 3)))
+    
+    @property
+    def ffmpeg_available(self):
+        """Whether a working FFmpeg was found (waits for the toolchain to resolve)"""
+        return self.toolchain.ffmpeg is not None
     
     def is_valid_youtube_url(self, url):
-        """Check if URL is a valid YouTube URL"""
-        youtube_patterns = [
-            r'(?:https?://)?(?:www\.)?youtube\.com/watch\?v=[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtu\.be/[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+'
-        ]
-        
-        return any(re.match(pattern, url) for pattern in youtube_patterns)
+        """Check if URL is a valid YouTube video URL"""
+        parsed = parse_youtube_url(url)
+        return parsed is not None and parsed.kind == 'video'
+    
+    def is_batch_url(self, url):
+        """Check if URL is a YouTube playlist or channel"""
+        parsed = parse_youtube_url(url)
+        return parsed is not None and parsed.kind != 'video'
+    
+    def extract_video_id(self, url):
+        """Extract the 11-character video ID from a YouTube URL"""
+        parsed = parse_youtube_url(url)
+        return parsed.video_id if parsed else None
+    
+    def normalize_url(self, url):
+        """Canonical form of a YouTube URL (other URLs are returned unchanged)"""
+        parsed = parse_youtube_url(url)
+        return canonical_url(parsed) if parsed else url
     
     def sanitize_filename(self, filename):
         """Sanitize filename for safe file system usage"""
@@ -84,398 +155,581 @@ class EnhancedYouTubeDownloader:
         
         return filename.strip()
     
-    def merge_with_ffmpeg(self, video_file, audio_file, output_file):
-        """Merge video and audio files using FFmpeg"""
+    def choose_merge_container(self, video_file, audio_file):
+        """Pick an output container that can hold both streams as-is, so neither is transcoded"""
+        video_ext = os.path.splitext(video_file)[1].lower().lstrip('.')
+        audio_ext = os.path.splitext(audio_file)[1].lower().lstrip('.')
+        if video_ext in ('mp4', 'm4v') and audio_ext in ('m4a', 'mp4', 'aac'):
+            return 'mp4'
+        if video_ext == 'webm' and audio_ext in ('webm', 'opus', 'ogg'):
+            return 'webm'
+        # Matroska accepts any codec combination YouTube serves
+        return 'mkv'
+    
+    def merge_streams(self, video_file, audio_file, output_base, job_id=None):
+        """Stream-copy merge, falling back to an AAC transcode only when muxing fails
+        
+        Returns (output_file, merge_info) where merge_info records the mode and FFmpeg CPU seconds
+        """
+        container = self.choose_merge_container(video_file, audio_file)
+        output_file = f"{output_base}.{container}"
+        stats = {}
+        if self.merge_with_ffmpeg(video_file, audio_file, output_file, audio_codec="copy", stats=stats, job_id=job_id):
+            return output_file, {'mode': 'copy', 'container': container, 'cpu_seconds': stats.get('cpu_seconds')}
+        if job_id is not None and self.supervisor.cancelled(job_id):
+            return None, None
+        
+        log.warning("Stream copy merge failed, transcoding audio to AAC", extra={'output': output_base})
+        output_file = f"{output_base}.mp4"
+        if self.merge_with_ffmpeg(video_file, audio_file, output_file, audio_codec="aac", stats=stats, job_id=job_id):
+            return output_file, {'mode': 'transcode', 'container': 'mp4', 'cpu_seconds': stats.get('cpu_seconds')}
+        return None, None
+    
+    def merge_with_ffmpeg(self, video_file, audio_file, output_file, audio_codec="aac", stats=None, job_id=None):
+        """Merge video and audio files using FFmpeg
+        
+        audio_codec="copy" muxes the audio untouched; if a stats dict is given it receives
+        the CPU seconds FFmpeg spent (user + system). Cancelling job_id kills the merge.
+        """
         try:
             # First, let's check if the files exist
-            if not os.path.exists(video_file):
-                print(f"Video file not found: {video_file}")
-                return False
-            if not os.path.exists(audio_file):
-                print(f"Audio file not found: {audio_file}")
-                return False
-                
-            print(f"Video file: {video_file} (size: {os.path.getsize(video_file)} bytes)")
-            print(f"Audio file: {audio_file} (size: {os.path.getsize(audio_file)} bytes)")
+            for path in (video_file, audio_file):
+                if not os.path.exists(path):
+                    log.error("Merge input not found", extra={'path': path})
+                    return False
             
-            # Use stored FFmpeg path if available, otherwise use the specific path
-            ffmpeg_cmd = getattr(self, 'ffmpeg_path', r"C:\ffmpeg-7.1.1-full_build\bin\ffmpeg.exe")
+            ffmpeg_cmd = self.toolchain.ffmpeg
+            if not ffmpeg_cmd:
+                log.error("FFmpeg not found, cannot merge", extra={'output': output_file})
+                return False
             
             # Use a more robust FFmpeg command
             cmd = [
                 ffmpeg_cmd,
                 "-i", video_file,
                 "-i", audio_file,
+                # Optional maps: a missing stream must not fail the merge
+                "-map", "0:v:0?",
+                "-map", "1:a:0?",
                 "-c:v", "copy",
-                "-c:a", "aac",
+                "-c:a", audio_codec,
                 "-strict", "experimental",
+                "-benchmark",  # Reports utime/stime so we can account CPU per merge
                 "-y",  # Overwrite output file
                 output_file
             ]
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Running FFmpeg", extra={'cmd': ' '.join(cmd), 'video_bytes': os.path.getsize(video_file),
+                                                   'audio_bytes': os.path.getsize(audio_file)})
             
-            print(f"Running FFmpeg command: {' '.join(cmd)}")
-            
-            # Run FFmpeg with timeout
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            # FFmpeg reports progress on stderr every ~0.5s, so silence means it's stuck
+            result = self.supervisor.run(cmd, job_id=job_id, program='ffmpeg', timeout=MERGE_TIMEOUT,
+                                         stall_timeout=STALL_TIMEOUT, nice=MERGE_NICE)
+            if result.reason:
+                log.error("FFmpeg merge killed", extra={'output': output_file, 'reason': result.reason})
+                return False
             
-            print(f"FFmpeg return code: {result.returncode}")
-            if result.stdout:
-                print(f"FFmpeg stdout: {result.stdout}")
-            if result.stderr:
-                print(f"FFmpeg stderr: {result.stderr}")
+            if stats is not None:
+                match = FFMPEG_BENCH_PATTERN.search(result.stderr or '')
+                if match:
+                    stats['cpu_seconds'] = round(float(match.group(1)) + float(match.group(2)), 3)
             
             if result.returncode == 0:
                 # Check if output file was created
                 if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                    print(f"✅ Successfully merged to: {output_file}")
+                    log.debug("Merged", extra={'output': output_file, 'audio_codec': audio_codec})
                     return True
-                else:
-                    print(f"❌ Output file not created or empty: {output_file}")
-                    return False
-            else:
-                print(f"❌ FFmpeg failed with return code: {result.returncode}")
+                log.error("FFmpeg output not created or empty", extra={'output': output_file})
                 return False
-                
-        except subprocess.TimeoutExpired:
-            print("❌ FFmpeg merge timed out")
+            # Only the tail of stderr carries the error; the rest is the banner and stream listing
+            log.error("FFmpeg failed", extra={'returncode': result.returncode, 'audio_codec': audio_codec,
+                                              'stderr': (result.stderr or '')[-2000:]})
             return False
+                
         except Exception as e:
-            print(f"❌ FFmpeg merge error: {e}")
+            log.exception("FFmpeg merge error", extra={'output': output_file, 'error': str(e)})
             return False
         
+    def run_yt_dlp(self, cmd, cwd, on_output=None, job_id=None, nice=None, stall_timeout=STALL_TIMEOUT):
+        """Run a supervised yt-dlp (or segmented.py) command, passing each stdout line to on_output
+        
+        Returns a supervisor.ProcessResult; the process is killed past FETCH_TIMEOUT, after
+        stall_timeout seconds without output, or when job_id is cancelled
+        """
+        program = 'segmented' if SEGMENTED_SCRIPT in cmd else 'yt-dlp'
+        return self.supervisor.run(cmd, cwd=cwd, job_id=job_id, program=program, timeout=FETCH_TIMEOUT,
+                                   stall_timeout=stall_timeout, on_output=on_output, nice=nice)
+    
+    def fetch_streams(self, commands, cwd, on_output=None, job_id=None):
+        """Run several yt-dlp downloads concurrently, each timed as its own <name>_fetch stage
+        
+        Returns {name: ProcessResult}
+        """
+        results = {}
+        
+        def fetch(name, cmd):
+            with stage(f"{name}_fetch") as fetch_stage:
+                try:
+                    results[name] = self.run_yt_dlp(cmd, cwd, lambda output: on_output(name, output) if on_output else None,
+                                                    job_id=job_id)
+                except Exception as e:
+                    results[name] = ProcessResult(-1, '', str(e), None)
+                if results[name].returncode != 0:
+                    fetch_stage.fail()
+            if job_id is not None:
+                # The streams still running get this one's bandwidth share
+                governor.finish_transfer(job_id, name)
+        
+        threads = [threading.Thread(target=fetch, args=item, daemon=True) for item in commands.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def publish_progress(self, download_id, progress):
+        """Expose a job's aggregated progress to the progress API"""
+        update_job(download_id, {'status': 'downloading', **progress.snapshot()}, progress=progress.percent())
+    
+    def metadata_cache_key(self, url):
+        return self.extract_video_id(url) or url
+    
+    def cached_formats(self, url):
+        """Formats from already cached metadata (nothing is extracted), else an empty list"""
+        video_data = self.metadata_cache.get(self.metadata_cache_key(url))
+        return video_data.get('formats', []) if video_data else []
+    
+    def extract_with_fallback(self, url):
+        """Extract video metadata (cached by video ID), racing the web and android player clients"""
+        cache_key = self.metadata_cache_key(url)
+        video_data = self.metadata_cache.get(cache_key)
+        if video_data is not None:
+            return video_data
+        
+        # web and android clients, best performer first, hedged when the first one is slow or fails
+        with stage('extraction'):
+            video_data = self.client_strategy.extract(self.extractor.extract_info, url)
+        
+        video_data = trim_info(video_data)
+        self.metadata_cache.set(cache_key, video_data)
+        return video_data
+        
     def get_video_info(self, url):
         """Get video information using yt-dlp with enhanced quality detection"""
         try:
-            cmd = [
-                "py", "-m", "yt_dlp",
-                "--dump-json",
-                "--no-playlist",
-                "--format-sort", "res,fps,codec:h264",
-                "--no-warnings",
-                "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "--extractor-args", "youtube:player_client=web",
-                "--extractor-args", "youtube:player_skip=webpage",
-                url
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                # Try with a different approach if the first attempt fails
-                print("First attempt failed, trying alternative approach...")
-                alt_cmd = [
-                    "py", "-m", "yt_dlp",
-                    "--dump-json",
-                    "--no-playlist",
-                    "--format-sort", "res,fps,codec:h264",
-                    "--no-warnings",
-                    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "--extractor-args", "youtube:player_client=android",
-                    url
-                ]
-                
-                result = subprocess.run(alt_cmd, capture_output=True, text=True, timeout=30)
-                
-                if result.returncode != 0:
-                    raise Exception(f"yt-dlp error: {result.stderr}")
-            
-            video_data = json.loads(result.stdout)
-            
-
-            
-            # Extract quality options with better filtering
-            formats = video_data.get('formats', [])
-            quality_options = []
-            
-            # Process all formats
-            for fmt in formats:
-                height = fmt.get('height', 0)
-                filesize = fmt.get('filesize', 0)
-                fps = fmt.get('fps', 0)
-                vcodec = fmt.get('vcodec', 'none')
-                acodec = fmt.get('acodec', 'none')
-                format_id = fmt.get('format_id', '')
-                
-                # Only include formats with video
-                if vcodec != 'none':
-                    size_mb = filesize / (1024 * 1024) if filesize else 0
-                    
-                    # Create display name
-                    if height:
-                        display_name = f"{height}p"
-                        if fps and fps > 0:
-                            display_name += f"@{fps}fps"
-                    else:
-                        display_name = "Unknown quality"
-                    
-                    quality_options.append({
-                        'format_id': format_id,
-                        'height': int(height) if height else 0,
-                        'fps': int(fps) if fps else 0,
-                        'size_mb': size_mb,
-                        'display': display_name,
-                        'is_combined': acodec != 'none',
-                        'vcodec': vcodec,
-                        'acodec': acodec
-                    })
-            
-            # Add audio-only option
-            audio_formats = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
-            if audio_formats:
-                best_audio = max(audio_formats, key=lambda x: x.get('abr', 0) if x.get('abr') else 0)
-                quality_options.append({
-                    'format_id': best_audio.get('format_id', ''),
-                    'height': 0,
-                    'fps': 0,
-                    'size_mb': best_audio.get('filesize', 0) / (1024 * 1024) if best_audio.get('filesize') else 0,
-                    'display': f"Audio Only ({best_audio.get('abr', 0)}kbps)",
-                    'is_combined': False,
-                    'vcodec': 'none',
-                    'acodec': best_audio.get('acodec', 'none')
-                })
-            
-            # Remove duplicates and sort by quality (best to worst)
-            unique_qualities = {}
-            for quality in quality_options:
-                key = f"{quality['height']}_{quality['fps']}"
-                if key not in unique_qualities:
-                    unique_qualities[key] = quality
-            
-            quality_options = sorted(unique_qualities.values(), 
-                                  key=lambda x: (x['height'], x['fps']), reverse=True)
-            
-            title = video_data.get('title', 'Unknown')
-            
-            return {
-                'success': True,
-                'title': title,
-                'duration': video_data.get('duration', 0),
-                'view_count': video_data.get('view_count', 0),
-                'uploader': video_data.get('uploader', 'Unknown'),
-                'thumbnail': video_data.get('thumbnail', ''),
-                'qualities': quality_options
-            }
-            
+            return self.build_video_info(self.extract_with_fallback(url))
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def download_video(self, url, quality_format_id, download_path, download_id):
-        """Download video with exact quality and merge with audio using FFmpeg"""
+    def build_video_info(self, video_data):
+        """Turn extracted metadata into the /api/video-info response"""
+        # Best format per (height, fps) by the configured criteria, plus the best audio-only format
+        quality_options = select_quality_options(video_data.get('formats', []), self.quality_ranker)
+        
+        title = video_data.get('title', 'Unknown')
+        # Served resized from our own cache (see get_thumbnail) instead of full size from YouTube
+        thumbnail = video_data.get('thumbnail', '')
+        if thumbnail and video_data.get('id'):
+            thumbnail = f"/api/thumbnail/{video_data['id']}"
+        
+        return {
+            'success': True,
+            'title': title,
+            'duration': video_data.get('duration', 0),
+            'view_count': video_data.get('view_count', 0),
+            'uploader': video_data.get('uploader', 'Unknown'),
+            'thumbnail': thumbnail,
+            'thumbnail_source': video_data.get('thumbnail', ''),
+            'qualities': [option.to_dict() for option in quality_options]
+        }
+    
+    def estimate_download_size(self, video_data, quality_format_id):
+        """Bytes a download needs on disk while it runs (0 when YouTube doesn't report sizes)"""
+        formats = video_data.get('formats', []) if video_data else []
+        
+        def size(fmt):
+            return (fmt.get('filesize') or fmt.get('filesize_approx') or 0) if fmt else 0
+        
+        audio = max((fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')),
+                    key=lambda fmt: fmt.get('abr') or 0, default=None)
+        selected = next((fmt for fmt in formats if fmt.get('format_id') == str(quality_format_id)), None)
+        if is_audio_only(quality_format_id, formats):
+            # The MP3 is written next to the downloaded audio until conversion finishes
+            return size(selected or audio) * 2
+        video = selected
+        # Both streams and the merged file exist side by side until the streams are removed
+        return (size(video) + size(audio)) * 2
+    
+    def download_video(self, url, quality_format_id, download_path, download_id, finalize=None, priority=None):
+        """Download video with exact quality and merge with audio using FFmpeg
+        
+        download_path is the job's own working directory (see storage.StorageManager), so
+        its files are found without scanning a shared folder; the video title is only
+        used for the filename shown to the user. If given,
+        finalize(file_path, filename) is called before the job is marked completed and
+        returns the file's final location. priority is the job's governor.PRIORITY_CLASSES
+        entry, which weighs its bandwidth share and its turn for a merge slot.
+        """
+        info_file = os.path.join(download_path, f"{download_id}.info.json")
         try:
             # Set initial progress
-            download_progress[download_id] = 0
-            download_status[download_id] = {'status': 'downloading'}
+            update_job(download_id, {'status': 'downloading'}, progress=0)
             
-            # Get video title for filename using the same method as get_video_info
-            cmd = [
-                "py", "-m", "yt_dlp",
-                "--dump-json",
-                "--no-playlist",
-                "--no-warnings",
-                "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "--extractor-args", "youtube:player_client=web",
-                "--extractor-args", "youtube:player_skip=webpage",
-                url
-            ]
+            # Get video title for filename using the same metadata as get_video_info
+            try:
+                video_data = self.extract_with_fallback(url)
+                video_title = self.sanitize_filename(video_data.get('title', 'youtube_video'))
+                
+                # Hand the cached metadata to yt-dlp so the downloads don't extract again
+                with open(info_file, 'w', encoding='utf-8') as f:
+                    json.dump(video_data, f)
+                source = ["--load-info-json", info_file]
+            except ExtractionError:
+                video_data = None
+                video_title = "youtube_video"
+                source = [url]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            # Tag the title with the video ID so same-titled videos don't share a name
+            video_id = self.extract_video_id(url)
+            if video_id:
+                video_title = f"{video_title} [{video_id}]"
             
-            if result.returncode != 0:
-                # Try with android client as fallback
-                alt_cmd = [
-                    "py", "-m", "yt_dlp",
-                    "--dump-json",
-                    "--no-playlist",
-                    "--no-warnings",
-                    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "--extractor-args", "youtube:player_client=android",
-                    url
-                ]
-                
-                result = subprocess.run(alt_cmd, capture_output=True, text=True, timeout=30)
-                
-                if result.returncode != 0:
-                    video_title = "youtube_video"
-                else:
-                    video_data = json.loads(result.stdout)
-                    video_title = video_data.get('title', 'youtube_video')
-                    video_title = self.sanitize_filename(video_title)
-            else:
-                video_data = json.loads(result.stdout)
-                video_title = video_data.get('title', 'youtube_video')
-                video_title = self.sanitize_filename(video_title)
+            formats = video_data.get('formats', []) if video_data else []
+            priority = priority or priority_class(quality_format_id, formats=formats)
+            
+            # Refuse downloads that can't fit before fetching anything
+            storage.reserve(download_id, self.estimate_download_size(video_data, quality_format_id))
             
-            if quality_format_id == "0" or quality_format_id == 0:
-                # Audio only download
+            if is_audio_only(quality_format_id, formats):
+                # Audio only download: '0' picks the best audio, an audio format ID that format
+                rates = governor.start_transfers(download_id, ['audio'], priority)
                 cmd = [
-                    "py", "-m", "yt_dlp",
-                    "-f", "bestaudio",
-                    "-o", f"{video_title}.%(ext)s",
+                    *self.toolchain.yt_dlp,
+                    "-f", "bestaudio" if str(quality_format_id) == '0' else str(quality_format_id),
+                    "-o", f"{download_id}.%(ext)s",
                     "--no-playlist",
+                    "--continue", "--part",  # Resume .part files left by an interrupted run
+                    "--max-filesize", str(storage.job_max_bytes),
                     "--no-warnings",
+                    *PROGRESS_ARGS,
+                    *limit_rate_args(rates['audio'][0]),
                     "--extract-audio",
                     "--audio-format", "mp3",
                     "--audio-quality", "0",
-                    "--ffmpeg-location", "C:\\ffmpeg-7.1.1-full_build\\bin\\ffmpeg.exe",
-                    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    url
+                    *(["--ffmpeg-location", self.toolchain.ffmpeg] if self.toolchain.ffmpeg else []),
+                    "--user-agent", USER_AGENT,
+                    *source
                 ]
                 
-                print(f"Starting audio download: {' '.join(cmd)}")
+                log.info("Starting audio download", extra={'job': download_id})
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("yt-dlp command", extra={'job': download_id, 'cmd': ' '.join(cmd)})
                 
-                # Run audio download
-                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=download_path)
+                # Run audio download and monitor progress
+                progress = JobProgress(['audio'])
                 
-                # Monitor progress
-                while True:
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        print(f"Audio download: {output.strip()}")
-                        download_progress[download_id] = min(download_progress[download_id] + 10, 90)
+                def on_output(output):
+                    values = parse_progress_line(output)
+                    if values:
+                        progress.update('audio', values)
+                    elif output.startswith('[ExtractAudio]'):
+                        progress.set_stage('converting')
+                    else:
+                        return
+                    self.publish_progress(download_id, progress)
                 
-                return_code = process.wait()
+                with stage('audio_fetch') as fetch_stage:
+                    # The MP3 conversion FFmpeg that yt-dlp starts inherits the lower priority. It
+                    # prints nothing until it finishes, so only the deadline applies while it runs
+                    result = self.run_yt_dlp(cmd, download_path, on_output, job_id=download_id, nice=MERGE_NICE,
+                                             stall_timeout=lambda: None if progress.stage == 'converting' else STALL_TIMEOUT)
+                    if result.returncode != 0:
+                        fetch_stage.fail()
+                record_downloaded_bytes(progress)
                 
-                if return_code == 0:
-                    # Find the downloaded audio file
-                    files = [f for f in os.listdir(download_path) if f.startswith(video_title) and f.endswith('.mp3')]
-                    if files:
-                        latest_file = max(files, key=lambda x: os.path.getctime(os.path.join(download_path, x)))
-                        file_path = os.path.join(download_path, latest_file)
-                        
-                        download_progress[download_id] = 100
-                        download_status[download_id] = {
+                if result.returncode == 0:
+                    # Files are named after the job, so the output path is known up front
+                    file_path = os.path.join(download_path, f"{download_id}.mp3")
+                    if os.path.exists(file_path):
+                        if finalize:
+                            file_path = finalize(file_path, f"{video_title}.mp3")
+                        update_job(download_id, {
                             'status': 'completed',
                             'file_path': file_path,
-                            'filename': latest_file
-                        }
-                        print(f"✅ Audio download completed: {file_path}")
+                            'filename': f"{video_title}.mp3"
+                        }, progress=100)
+                        log.info("Audio download completed", extra={'job': download_id, 'file': file_path})
                     else:
-                        download_status[download_id] = {'status': 'error', 'error': 'No audio file found'}
+                        update_job(download_id, {'status': 'error', 'error': 'No audio file found'})
                 else:
-                    stderr_output = process.stderr.read()
-                    download_status[download_id] = {'status': 'error', 'error': f"Audio download failed: {stderr_output}"}
+                    update_job(download_id, process_failure("Audio download", result))
                 
             else:
                 # Video download with FFmpeg merging
-                print(f"Starting video download in quality {quality_format_id} with FFmpeg merging...")
+                log.info("Starting video download", extra={'job': download_id, 'format': quality_format_id})
+                
+                # Container of the selected video format decides which audio stream muxes cleanly
+                video_format = next((fmt for fmt in formats if fmt.get('format_id') == str(quality_format_id)), None)
+                video_ext = video_format.get('ext') if video_format else None
+                
+                # Share of the bandwidth limit per stream; segmented.py follows changes to it, while
+                # yt-dlp keeps its starting --limit-rate, so the governor holds that rate in reserve
+                segmented = SEGMENTED_CONNECTIONS > 1 and can_segment(video_format, SEGMENTED_MIN_BYTES)
+                rates = governor.start_transfers(download_id, ['video', 'audio'], priority, rate_dir=download_path,
+                                                 fixed=['audio'] if segmented else ['video', 'audio'])
                 
                 # Download video in exact quality
-                video_cmd = [
-                    "py", "-m", "yt_dlp",
-                    "-f", str(quality_format_id),
-                    "-o", f"{video_title}_video.%(ext)s",
-                    "--no-playlist",
-                    "--no-warnings",
-                    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    url
-                ]
+                if segmented:
+                    video_cmd = segmented_command(video_format, f"{download_id}_video.{video_ext}", SEGMENTED_CONNECTIONS,
+                                                  max_filesize=storage.job_max_bytes, headers={'User-Agent': USER_AGENT},
+                                                  rate_file=rates['video'][1] if governor.bandwidth_limit else None)
+                else:
+                    video_cmd = [
+                        *self.toolchain.yt_dlp,
+                        "-f", str(quality_format_id),
+                        "-o", f"{download_id}_video.%(ext)s",
+                        "--no-playlist",
+                        "--continue", "--part",  # Resume .part files left by an interrupted run
+                        "--max-filesize", str(storage.job_max_bytes),
+                        "--concurrent-fragments", str(max(1, SEGMENTED_CONNECTIONS)),
+                        *limit_rate_args(rates['video'][0]),
+                        "--no-warnings",
+                        *PROGRESS_ARGS,
+                        "--user-agent", USER_AGENT,
+                        *source
+                    ]
                 
-                # Download audio
+                # Download audio as-is (no MP3 extraction), preferring a codec that can be
+                # stream-copied next to the chosen video: AAC/m4a for mp4, Opus/webm for webm
                 audio_cmd = [
-                    "py", "-m", "yt_dlp",
-                    "-f", "bestaudio",
-                    "-o", f"{video_title}_audio.%(ext)s",
+                    *self.toolchain.yt_dlp,
+                    "-f", "bestaudio[ext=m4a]/bestaudio" if video_ext != 'webm' else "bestaudio[ext=webm]/bestaudio",
+                    "-o", f"{download_id}_audio.%(ext)s",
                     "--no-playlist",
+                    "--continue", "--part",  # Resume .part files left by an interrupted run
+                    "--max-filesize", str(storage.job_max_bytes),
+                    *limit_rate_args(rates['audio'][0]),
                     "--no-warnings",
-                    "--extract-audio",
-                    "--audio-format", "mp3",
-                    "--audio-quality", "0",
-                    "--ffmpeg-location", "C:\\ffmpeg-7.1.1-full_build\\bin\\ffmpeg.exe",
-                    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    url
+                    *PROGRESS_ARGS,
+                    "--user-agent", USER_AGENT,
+                    *source
                 ]
                 
-                print(f"Video command: {' '.join(video_cmd)}")
-                print(f"Audio command: {' '.join(audio_cmd)}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Fetch commands", extra={'job': download_id, 'video_cmd': ' '.join(video_cmd),
+                                                        'audio_cmd': ' '.join(audio_cmd)})
                 
-                # Download video first
-                download_progress[download_id] = 10
-                video_process = subprocess.Popen(video_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=download_path)
+                # Download video and audio concurrently; the merge starts once both are done
+                progress = JobProgress(['video', 'audio'])
                 
-                while True:
-                    output = video_process.stdout.readline()
-                    if output == '' and video_process.poll() is not None:
-                        break
-                    if output:
-                        print(f"Video download: {output.strip()}")
-                        download_progress[download_id] = min(download_progress[download_id] + 5, 40)
+                def on_output(stream, output):
+                    values = parse_progress_line(output)
+                    if values:
+                        progress.update(stream, values)
+                        self.publish_progress(download_id, progress)
                 
-                video_return = video_process.wait()
+                results = self.fetch_streams({'video': video_cmd, 'audio': audio_cmd}, download_path, on_output,
+                                             job_id=download_id)
+                record_downloaded_bytes(progress)
                 
-                if video_return == 0:
-                    # Download audio
-                    download_progress[download_id] = 45
-                    audio_process = subprocess.Popen(audio_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=download_path)
-                    
-                    while True:
-                        output = audio_process.stdout.readline()
-                        if output == '' and audio_process.poll() is not None:
-                            break
-                        if output:
-                            print(f"Audio download: {output.strip()}")
-                            download_progress[download_id] = min(download_progress[download_id] + 5, 80)
-                    
-                    audio_return = audio_process.wait()
+                if results['video'].returncode != 0:
+                    update_job(download_id, process_failure("Video download", results['video']))
+                elif results['audio'].returncode != 0:
+                    update_job(download_id, process_failure("Audio download", results['audio']))
+                else:
+                    # Find downloaded files (the working directory only holds this job's files)
+                    finished_files = [f for f in os.listdir(download_path) if not f.endswith(('.part', '.ytdl', '.rate', '.ranges'))]
+                    video_files = [f for f in finished_files if f.startswith(f"{download_id}_video")]
+                    audio_files = [f for f in finished_files if f.startswith(f"{download_id}_audio")]
                     
-                    if audio_return == 0:
-                        # Find downloaded files
-                        video_files = [f for f in os.listdir(download_path) if f.startswith(f"{video_title}_video")]
-                        audio_files = [f for f in os.listdir(download_path) if f.startswith(f"{video_title}_audio")]
+                    if video_files and audio_files:
+                        video_file = os.path.join(download_path, video_files[0])
+                        audio_file = os.path.join(download_path, audio_files[0])
                         
-                        if video_files and audio_files:
-                            video_file = os.path.join(download_path, video_files[0])
-                            audio_file = os.path.join(download_path, audio_files[0])
-                            output_file = os.path.join(download_path, f"{video_title}.mp4")
-                            
-                            print(f"Found video: {video_file}")
-                            print(f"Found audio: {audio_file}")
-                            
-                            # Merge with FFmpeg
-                            download_progress[download_id] = 85
-                            if self.merge_with_ffmpeg(video_file, audio_file, output_file):
-                                download_progress[download_id] = 100
-                                download_status[download_id] = {
-                                    'status': 'completed',
-                                    'file_path': output_file,
-                                    'filename': f"{video_title}.mp4"
-                                }
-                                print(f"✅ Video download and merge completed: {output_file}")
-                                
-                                # Clean up separate files
-                                try:
-                                    os.remove(video_file)
-                                    os.remove(audio_file)
-                                    print("✅ Cleaned up separate files")
-                                except:
-                                    pass
-                            else:
-                                download_status[download_id] = {'status': 'error', 'error': 'FFmpeg merge failed'}
+                        # Merge with FFmpeg once one of the limited merge slots is free
+                        progress.set_stage('waiting to merge')
+                        self.publish_progress(download_id, progress)
+                        with governor.merge_slot(download_id, priority,
+                                                 is_cancelled=lambda: self.supervisor.cancelled(download_id)) as granted:
+                            output_file, merge_info = None, None
+                            if granted:
+                                progress.set_stage('merging')
+                                self.publish_progress(download_id, progress)
+                                with stage('merge') as merge_stage:
+                                    output_file, merge_info = self.merge_streams(video_file, audio_file,
+                                                                                 os.path.join(download_path, download_id),
+                                                                                 job_id=download_id)
+                                    if not output_file:
+                                        merge_stage.fail()
+                        if output_file:
+                            filename = f"{video_title}{os.path.splitext(output_file)[1]}"
+                            if finalize:
+                                output_file = finalize(output_file, filename)
+                            update_job(download_id, {
+                                'status': 'completed',
+                                'file_path': output_file,
+                                'filename': filename,
+                                'merge': merge_info
+                            }, progress=100)
+                            log.info("Video download and merge completed", extra={
+                                'job': download_id, 'file': output_file, 'merge_mode': merge_info['mode']})
+                        elif self.supervisor.cancelled(download_id):
+                            update_job(download_id, {'status': 'cancelled'})
                         else:
-                            download_status[download_id] = {'status': 'error', 'error': f'Missing files. Video: {video_files}, Audio: {audio_files}'}
+                            update_job(download_id, {'status': 'error', 'error': 'FFmpeg merge failed'})
                     else:
-                        stderr = audio_process.stderr.read()
-                        download_status[download_id] = {'status': 'error', 'error': f"Audio download failed: {stderr}"}
-                else:
-                    stderr = video_process.stderr.read()
-                    download_status[download_id] = {'status': 'error', 'error': f"Video download failed: {stderr}"}
+                        update_job(download_id, {'status': 'error', 'error': f'Missing files. Video: {video_files}, Audio: {audio_files}'})
             
         except Exception as e:
-            print(f"Download exception: {str(e)}")
-            download_status[download_id] = {'status': 'error', 'error': str(e)}
+            log.exception("Download failed", extra={'job': download_id})
+            update_job(download_id, {'status': 'error', 'error': str(e)})
+        finally:
+            governor.release(download_id)
+            if os.path.exists(info_file):
+                os.remove(info_file)
+
+# FFmpeg/yt-dlp discovery runs in the background so worker boot doesn't wait on it
+toolchain = create_toolchain()
+toolchain.start()
+
+# Bandwidth shares and merge slots for the jobs running in this worker
+governor = create_governor()
+
+# yt-dlp/FFmpeg processes with drained pipes, deadlines and kill-on-cancel; a cancel recorded
+# in the job store by another worker reaches this one's processes too
+supervisor = ProcessSupervisor(is_cancelled=job_store.cancel_requested)
 
 # Initialize downloader
-downloader = EnhancedYouTubeDownloader()
+downloader = EnhancedYouTubeDownloader(toolchain, supervisor)
 
-# Show FFmpeg status
-if downloader.ffmpeg_available:
-    print("✅ FFmpeg is available - will use separate video/audio downloads with merging")
-else:
-    print("⚠️  FFmpeg not found - will download single files with audio included")
+# Finished files shared by identical requests
+output_cache = create_output_cache(downloader.download_path)
+
+# Resized thumbnails, fetched from YouTube once per video
+thumbnail_cache = create_thumbnail_cache(downloader.download_path, user_agent=USER_AGENT)
+
+# Per-job working directories under a disk quota, cleaned up by a janitor thread
+storage = create_storage_manager(downloader.download_path, output_cache)
+storage.start()
+
+# Bounded worker pool for download jobs
+scheduler = DownloadScheduler(
+    max_workers=int(os.environ.get('YTDL_MAX_CONCURRENT_DOWNLOADS', 2)),
+    max_queue=int(os.environ.get('YTDL_MAX_QUEUED_DOWNLOADS', 20)),
+    max_queue_per_client=int(os.environ.get('YTDL_MAX_QUEUED_PER_CLIENT', 5)),
+    # Queue positions shift whenever a job is queued or starts; record them for the progress API
+    on_queue_change=lambda waiting: [update_job(job_id, {'status': 'queued', 'queue_position': position})
+                                 for position, job_id in enumerate(waiting, 1)]
+)
+
+def run_download_job(url, quality_format_id, download_id, cache_key, priority=None):
+    """Run a download in its own working directory, moving the finished file into the output cache"""
+    finalize = (lambda file_path, filename: output_cache.store(cache_key, file_path, filename)) if cache_key else None
+    job_lock = None
+    try:
+        if supervisor.cancelled(download_id):
+            update_job(download_id, {'status': 'cancelled'})
+            return
+        work_dir = storage.acquire(download_id)
+        # A resumed job's directory may still be written by processes its dead worker left behind
+        job_lock = JobLock(work_dir)
+        if not job_lock.acquire():
+            update_job(download_id, {'status': 'error', 'error': 'Processes left by an interrupted run could not be stopped'})
+            return
+        supervisor.share_lock(download_id, job_lock)
+        downloader.download_video(url, quality_format_id, work_dir, download_id, finalize=finalize, priority=priority)
+    finally:
+        # Reached unless the worker died, in which case the spec lets another worker resume
+        job_store.drop_spec(download_id)
+        supervisor.forget(download_id)
+        if job_lock:
+            job_lock.release()
+        if cache_key:
+            output_cache.finish(cache_key)
+        status = (job_store.get(download_id) or {}).get('status', {})
+        DOWNLOADS.inc(result=status.get('status') if status.get('status') in ('completed', 'cancelled') else 'error')
+        # Removes the separate streams and leftovers; keeps the finished file if it's still in the
+        # working directory (too big for the output cache)
+        with stage('cleanup'):
+            storage.release(download_id, keep=status.get('file_path') if status.get('status') == 'completed' else None)
+
+def resume_download_job(download_id, spec):
+    """Requeue a job claimed from a dead worker; its partial files are picked up where they stopped"""
+    cache_key = spec.get('cache_key')
+    if cache_key and output_cache.begin(cache_key, download_id):
+        # A new request for the same output is already downloading here; finishing (or caching)
+        # this job under the key would unregister that one, so it runs without the cache
+        log.info("Resumed job runs uncached", extra={'job': download_id})
+        cache_key = None
+    priority = spec.get('priority') or priority_class(spec['quality_format_id'])
+    try:
+        scheduler.submit(spec['client_id'], download_id, run_download_job, spec['url'], spec['quality_format_id'],
+                         download_id, cache_key, priority, priority=priority_rank(priority))
+    except QueueFullError:
+        if cache_key:
+            output_cache.finish(cache_key)
+        raise
+
+# Jobs survive worker restarts: specs are leased to this process and reclaimed when it dies
+recovery = JobRecovery(
+    job_store,
+    resubmit=resume_download_job,
+    on_give_up=lambda download_id: update_job(download_id, {
+        'status': 'error', 'error': 'Download was interrupted too many times'
+    }),
+    lease=int(os.environ.get('YTDL_JOB_LEASE', 90)),
+    interval=max(1, int(os.environ.get('YTDL_JOB_LEASE', 90)) // 3),
+    claim_limit=lambda: scheduler.max_queue - scheduler.stats()['queued']
+)
+recovery.start()
+
+# Concurrent stream-while-downloading responses (each runs one FFmpeg process)
+stream_limiter = StreamLimiter(max_streams=int(os.environ.get('YTDL_MAX_STREAMS', 4)))
+
+# Each progress stream or long-poll holds a request thread (gunicorn runs 16); the rest are
+# kept for page loads, metadata and file requests
+progress_waiters = WaiterLimiter(max_waiters=int(os.environ.get('YTDL_MAX_PROGRESS_WAITERS', 8)))
+
+# Playlist/channel downloads, fed into the same queue as single downloads
+batches = BatchManager(
+    enqueue=lambda url, quality_format_id, client_id: enqueue_download(url, quality_format_id, client_id, batch=True),
+    expand=lambda url: downloader.extractor.iter_entries(url) if downloader.is_batch_url(url) else None,
+    job_store=job_store,
+    concurrency=int(os.environ.get('YTDL_BATCH_CONCURRENCY', 2)),
+    retries=int(os.environ.get('YTDL_BATCH_RETRIES', 2)),
+    max_items=int(os.environ.get('YTDL_BATCH_MAX_ITEMS', 500)),
+    cancel=lambda download_id: cancel_job(download_id)
+)
+
+def cache_lookups():
+    """{(cache, result): count} from the metadata and output caches' own counters"""
+    samples = {}
+    for name, stats in (('metadata', downloader.metadata_cache.stats()), ('output', output_cache.stats()),
+                        ('thumbnail', thumbnail_cache.stats())):
+        samples[(name, 'hit')] = stats['hits']
+        samples[(name, 'miss')] = stats['misses']
+    return samples
+
+# Scrape-time views of the components' own counters
+REGISTRY.register(Gauge('ytdl_queue_depth', 'Download jobs waiting for a worker',
+                        collect=lambda: {(): scheduler.stats()['queued']}))
+REGISTRY.register(Gauge('ytdl_jobs_running', 'Download jobs running in this worker',
+                        collect=lambda: {(): scheduler.stats()['running']}))
+REGISTRY.register(Counter('ytdl_cache_lookups_total', 'Metadata, output and thumbnail cache lookups', ['cache', 'result'],
+                          collect=cache_lookups))
+REGISTRY.register(Gauge('ytdl_streams_active', 'Open /api/stream responses',
+                        collect=lambda: {(): stream_limiter.stats()['active']}))
+REGISTRY.register(Gauge('ytdl_merges', 'FFmpeg merges holding or waiting for a merge slot', ['state'],
+                        collect=lambda: {('running',): governor.stats()['merging'],
+                                         ('waiting',): governor.stats()['merges_waiting']}))
+REGISTRY.register(Gauge('ytdl_storage_used_bytes', 'Temporary disk space in use at the last janitor sweep', ['area'],
+                        collect=lambda: {('jobs',): storage.stats()['jobs_bytes'],
+                                         ('cache',): storage.stats()['cache_bytes']}))
+REGISTRY.register(Gauge('ytdl_storage_reserved_bytes', 'Disk space reserved by running downloads',
+                        collect=lambda: {(): storage.stats()['reserved_bytes']}))
 
 @app.route('/')
 def index():
@@ -494,9 +748,82 @@ def get_video_info():
     if not downloader.is_valid_youtube_url(url):
         return jsonify({'success': False, 'error': 'Please provide a valid YouTube URL'})
     
-    result = downloader.get_video_info(url)
+    result = downloader.get_video_info(downloader.normalize_url(url))
     return jsonify(result)
 
+def enqueue_download(url, quality_format_id, client_id, batch=False):
+    """Queue a download (or reuse a cached/in-flight one); returns the API response fields
+    
+    Batch items queue behind single downloads, and audio-only downloads ahead of video ones.
+    Raises QueueFullError when the scheduler can't take another job
+    """
+    # Always use default Downloads folder
+    download_path = downloader.download_path
+    url = downloader.normalize_url(url)
+    
+    # Generate unique download ID
+    download_id = f"download_{uuid.uuid4().hex[:12]}"
+    
+    # Identical requests (same video, format and merge mode) share one cached output
+    video_id = downloader.extract_video_id(url)
+    # The page has fetched the metadata already, so an audio format's ID is recognised here
+    formats = downloader.cached_formats(url)
+    audio_only = is_audio_only(quality_format_id, formats)
+    merge_mode = 'audio-mp3' if audio_only else 'stream-copy'
+    cache_key = OutputCache.key(video_id, str(quality_format_id), merge_mode) if video_id else None
+    if cache_key:
+        cached = output_cache.lookup(cache_key)
+        if cached:
+            file_path, filename = cached
+            update_job(download_id, {
+                'status': 'completed',
+                'file_path': file_path,
+                'filename': filename,
+                'cached': True
+            }, progress=100)
+            return {'download_id': download_id, 'download_path': download_path, 'cached': True}
+        
+        running_id = output_cache.begin(cache_key, download_id)
+        if running_id:
+            return {'download_id': running_id, 'download_path': download_path, 'shared': True}
+    
+    # Persist the job before queueing it so a worker crash can't lose it
+    priority = priority_class(quality_format_id, batch, formats)
+    job_store.save_spec(download_id, {
+        'url': url,
+        'quality_format_id': quality_format_id,
+        'cache_key': cache_key,
+        'client_id': client_id,
+        'priority': priority
+    }, recovery.owner)
+    
+    # Queue the download; clients are served round-robin within its priority class so one
+    # user can't starve the rest
+    try:
+        scheduler.submit(client_id, download_id, run_download_job,
+                         url, quality_format_id, download_id, cache_key, priority, priority=priority_rank(priority))
+    except QueueFullError:
+        job_store.drop_spec(download_id)
+        if cache_key:
+            output_cache.finish(cache_key)
+        raise
+    
+    return {'download_id': download_id, 'download_path': download_path}
+
+def request_client_id():
+    """Identify the client for fair scheduling
+    
+    ProxyFix has already replaced remote_addr with the address our own proxy saw; the rest of
+    X-Forwarded-For comes from the client and can't be trusted
+    """
+    return request.remote_addr or ''
+
+def queue_full_response(error):
+    response = jsonify({'success': False, 'error': f"{error}. Please try again shortly."})
+    response.status_code = 429
+    response.headers['Retry-After'] = '30'
+    return response
+
 @app.route('/api/download', methods=['POST'])
 def start_download():
     """Start download API endpoint with default path"""
@@ -507,36 +834,299 @@ def start_download():
     if not url or quality_format_id is None:
         return jsonify({'success': False, 'error': 'Missing required parameters'})
     
-    # Always use default Downloads folder
-    download_path = downloader.download_path
+    try:
+        result = enqueue_download(url, quality_format_id, request_client_id())
+    except QueueFullError as e:
+        return queue_full_response(e)
     
-    # Generate unique download ID
-    download_id = f"download_{int(time.time())}"
+    return jsonify({'success': True, **result})
+
+def cancel_job(download_id):
+    """Cancel a queued or running download; returns (response fields, HTTP status)"""
+    job = job_store.get(download_id)
+    if job is None:
+        return {'success': False, 'error': 'Download not found'}, 404
+    if job['status'].get('status') in FINISHED_STATUSES or not job_store.request_cancel(download_id):
+        return {'success': False, 'error': f"Download already {job['status'].get('status', 'finished')}"}, 409
+    
+    queued = scheduler.cancel(download_id)
+    if queued:
+        # Never started here: running it now only records the cancellation and cleans up
+        fn, args = queued
+        fn(*args)
+    elif scheduler.is_running(download_id):
+        supervisor.cancel(download_id)
+    # Otherwise another worker has it and sees the flag within a second
+    return {'success': True, 'download_id': download_id}, 200
+
+def cancel_batch(batch_id):
+    """Ask a batch's coordinator (in whichever worker runs it) to cancel it; returns (response fields, HTTP status)"""
+    job = job_store.get(batch_id)
+    if job is None or not job['status'].get('batch'):
+        return {'success': False, 'error': 'Batch not found'}, 404
+    if job['status'].get('status') in FINISHED_STATUSES:
+        return {'success': False, 'error': f"Batch already {job['status']['status']}"}, 409
+    job_store.request_cancel(batch_id, without_spec=True)
+    return {'success': True, 'batch_id': batch_id}, 200
+
+@app.route('/api/download/<download_id>/cancel', methods=['POST'])
+def cancel_download(download_id):
+    """Cancel a queued or running download, killing its yt-dlp/FFmpeg processes and removing its files
+    
+    A cached file shared by identical requests is cancelled for all of them. A batch ID
+    cancels the whole batch, and a stream ID (X-Stream-Id from /api/stream) ends that stream.
+    """
+    if stream_limiter.cancel(download_id):
+        return jsonify({'success': True, 'stream_id': download_id})
+    job = job_store.get(download_id)
+    result, code = cancel_batch(download_id) if job and job['status'].get('batch') else cancel_job(download_id)
+    return jsonify(result), code
+
+@app.route('/api/batch/<batch_id>/cancel', methods=['POST'])
+def cancel_batch_download(batch_id):
+    """Cancel a batch: items not yet queued are dropped, queued and running ones cancelled"""
+    result, code = cancel_batch(batch_id)
+    return jsonify(result), code
+
+@app.route('/api/batch', methods=['POST'])
+def start_batch():
+    """Start a batch download from a playlist/channel URL or a list of video URLs"""
+    data = request.get_json()
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
+    quality_format_id = data.get('quality_format_id', 'bestvideo[height<=1080]')
+    
+    if not urls:
+        return jsonify({'success': False, 'error': 'Missing required parameters'})
+    
+    invalid = [url for url in urls if not (downloader.is_valid_youtube_url(url) or downloader.is_batch_url(url))]
+    if invalid:
+        return jsonify({'success': False, 'error': f"Not a YouTube video, playlist or channel URL: {invalid[0]}"})
+    urls = [downloader.normalize_url(url) for url in urls]
+    
+    try:
+        concurrency = data.get('concurrency')
+        if concurrency is not None:
+            concurrency = max(1, min(int(concurrency), 8))
+        retries = data.get('retries')
+        if retries is not None:
+            retries = max(0, min(int(retries), 5))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'concurrency and retries must be whole numbers'}), 400
+    
+    batch_id = batches.start(urls, quality_format_id, request_client_id(), concurrency=concurrency, retries=retries)
+    return jsonify({'success': True, 'batch_id': batch_id})
+
+@app.route('/api/batch/<batch_id>')
+def get_batch(batch_id):
+    """Per-item states and aggregate progress of a batch (supports ?since= long-polling)"""
+    return get_progress(batch_id)
+
+@app.route('/api/batch/<batch_id>/events')
+def stream_batch(batch_id):
+    """Server-Sent Events stream of a batch's progress"""
+    return stream_progress(batch_id)
+
+@app.route('/api/file/<download_id>')
+def get_file(download_id):
+    """Serve a finished download
+    
+    Supports Range and conditional (ETag/If-Modified-Since) requests so clients can resume or
+    seek; the file is handed to the server's file wrapper (sendfile under gunicorn), never read
+    into memory. Pass ?inline=1 to play it in the browser instead of saving it.
+    """
+    job = job_store.get(download_id)
+    status = job['status'] if job else {}
+    if status.get('status') != 'completed' or not status.get('file_path'):
+        return jsonify({'success': False, 'error': 'Download not found or not finished'}), 404
+    
+    try:
+        return send_file(
+            status['file_path'],
+            as_attachment=not request.args.get('inline'),
+            download_name=status.get('filename') or os.path.basename(status['file_path']),
+            conditional=True,
+            max_age=FILE_MAX_AGE
+        )
+    except FileNotFoundError:
+        # Evicted from the output cache or cleaned up since the job finished
+        return jsonify({'success': False, 'error': 'File is no longer available'}), 410
+
+@app.route('/api/thumbnail/<video_id>')
+def get_thumbnail(video_id):
+    """A video's thumbnail, resized and cached (?size=small|medium|large)
+    
+    WebP for browsers that accept it, JPEG otherwise (?format= picks one). Served with an
+    ETag and a long max-age so repeat page views don't fetch it again.
+    """
+    parsed = parse_youtube_url(f"https://youtu.be/{video_id}")
+    size = request.args.get('size', 'medium')
+    if parsed is None or parsed.video_id != video_id or size not in THUMBNAIL_SIZES:
+        return jsonify({'success': False, 'error': 'Thumbnail not found'}), 404
+    fmt = negotiate_format(request.headers.get('Accept'), request.args.get('format'))
+    
+    try:
+        # Metadata is usually cached from the /api/video-info call that showed this thumbnail
+        path = thumbnail_cache.get(video_id, lambda: downloader.extract_with_fallback(canonical_url(parsed)).get('thumbnail'),
+                                   size=size, fmt=fmt)
+    except ExtractionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except ThumbnailError as e:
+        log.warning("Thumbnail unavailable", extra={'video_id': video_id, 'error': str(e)})
+        return jsonify({'success': False, 'error': str(e)}), 502
+    
+    response = send_file(path, mimetype=THUMBNAIL_FORMATS[fmt][2], conditional=True, max_age=THUMBNAIL_MAX_AGE)
+    if request.args.get('format') not in THUMBNAIL_FORMATS:
+        response.vary.add('Accept')
+    return response
+
+def content_disposition(filename, inline=False):
+    """Content-Disposition value with an ASCII fallback plus the RFC 5987 UTF-8 name, as send_file does"""
+    disposition = 'inline' if inline else 'attachment'
+    simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii').replace('"', '')
+    if simple == filename:
+        return f'{disposition}; filename="{simple}"'
+    quoted = urllib.parse.quote(filename, safe="!#$&+^`|~")
+    return f"{disposition}; filename=\"{simple}\"; filename*=UTF-8''{quoted}"
+
+@app.route('/api/stream')
+def stream_video():
+    """Stream a video while it downloads, remuxed by FFmpeg straight into the response
     
-    # Start download in background thread
-    thread = threading.Thread(
-        target=downloader.download_video,
-        args=(url, quality_format_id, download_path, download_id)
-    )
-    thread.daemon = True
-    thread.start()
+    Query parameters: url and quality_format_id ('0' for audio only). No temp files are written,
+    so there is no Content-Length and no Range support; use /api/download for resumable files.
+    The X-Stream-Id response header can be passed to /api/download/<id>/cancel to stop it.
+    """
+    url = request.args.get('url', '').strip()
+    quality_format_id = request.args.get('quality_format_id', '').strip()
     
+    if not url or not quality_format_id:
+        return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
+    if not downloader.is_valid_youtube_url(url):
+        return jsonify({'success': False, 'error': 'Please provide a valid YouTube URL'}), 400
+    url = downloader.normalize_url(url)
+    if not downloader.ffmpeg_available:
+        return jsonify({'success': False, 'error': 'Streaming needs FFmpeg, which is not installed'}), 503
+    
+    try:
+        stream_limiter.acquire()
+    except StreamSlotsExhaustedError as e:
+        return queue_full_response(e)
+    
+    try:
+        video_data = downloader.extract_with_fallback(url)
+        video, audio = select_stream_formats(video_data, quality_format_id)
+        cmd = build_stream_command(toolchain.ffmpeg, video, audio, USER_AGENT, rw_timeout=STALL_TIMEOUT)
+        stream_id = uuid.uuid4().hex
+        stream = MediaStream(cmd, on_close=lambda: stream_limiter.release(stream_id), stream_id=stream_id,
+                             timeout=STREAM_TIMEOUT, stall_timeout=STALL_TIMEOUT)
+    except (ExtractionError, StreamUnavailableError) as e:
+        stream_limiter.release()
+        return jsonify({'success': False, 'error': str(e)}), 502
+    except Exception:
+        stream_limiter.release()
+        raise
+    stream_limiter.register(stream)
+    
+    extension, mimetype, _ = stream_container(video, audio)
+    filename = f"{downloader.sanitize_filename(video_data.get('title', 'youtube_video'))}.{extension}"
+    response = Response(stream, mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Disposition'] = content_disposition(filename, inline=request.args.get('inline'))
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['X-Stream-Id'] = stream.stream_id
+    return response
+
+@app.route('/api/stats')
+def get_stats():
+    """Cache statistics API endpoint"""
     return jsonify({
-        'success': True,
-        'download_id': download_id,
-        'download_path': download_path
+        'metadata_cache': downloader.metadata_cache.stats(),
+        'extractor_clients': downloader.client_strategy.stats(),
+        'scheduler': scheduler.stats(),
+        'output_cache': output_cache.stats(),
+        'thumbnails': thumbnail_cache.stats(),
+        'streams': stream_limiter.stats(),
+        'progress_waiters': progress_waiters.stats(),
+        'recovery': recovery.stats(),
+        'storage': storage.stats(),
+        'processes': supervisor.stats(),
+        'resources': governor.stats(),
+        'toolchain': toolchain.stats()
     })
 
+@app.route('/api/resources')
+def get_resources():
+    """This worker's current bandwidth shares and merge slots"""
+    return jsonify(governor.allocations())
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for this worker"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+def progress_payload(download_id):
+    """Current progress response for a job"""
+    job = job_store.get(download_id) or {'progress': 0, 'status': {'status': 'unknown'}, 'version': 0}
+    response = {
+        'progress': job['progress'],
+        'status': job['status'],
+        'version': job['version']
+    }
+    if 'queue_position' in job['status']:
+        response['queue_position'] = job['status']['queue_position']
+    return response
+
 @app.route('/api/progress/<download_id>')
 def get_progress(download_id):
-    """Get download progress API endpoint"""
-    progress = download_progress.get(download_id, 0)
-    status = download_status.get(download_id, {'status': 'unknown'})
+    """Get download progress API endpoint
     
-    return jsonify({
-        'progress': progress,
-        'status': status
-    })
+    Long-poll: pass ?since=<version> (and optionally &wait=<seconds>) to block until the job changes
+    """
+    since = request.args.get('since', type=int)
+    # Over the waiter cap a long-poll is answered right away, like a plain poll
+    if since is not None and job_store.version(download_id) and progress_waiters.try_acquire():
+        try:
+            wait = min(request.args.get('wait', 25, type=float), LONG_POLL_MAX_WAIT)
+            job_store.wait(download_id, since, wait)
+        finally:
+            progress_waiters.release()
+    
+    payload = progress_payload(download_id)
+    response = jsonify(payload)
+    response.set_etag(str(payload['version']))
+    return response.make_conditional(request)
+
+@app.route('/api/progress/<download_id>/events')
+def stream_progress(download_id):
+    """Server-Sent Events stream of download progress, sent only when the job changes
+    
+    Answers 503 when too many streams are open, and the page falls back to polling
+    """
+    if not progress_waiters.try_acquire():
+        response = jsonify({'success': False, 'error': 'Too many progress streams open; poll /api/progress instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_HEARTBEAT)
+        return response
+    
+    def events():
+        sent_version = None
+        while True:
+            payload = progress_payload(download_id)
+            if payload['version'] == sent_version:
+                yield ": keep-alive\n\n"
+            else:
+                sent_version = payload['version']
+                yield f"id: {sent_version}\ndata: {json.dumps(payload)}\n\n"
+                if payload['status']['status'] in FINISHED_STATUSES:
+                    break
+            job_store.wait(download_id, sent_version, SSE_HEARTBEAT)
+    
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(progress_waiters.release)
+    return response
 
 if __name__ == '__main__':
     # Use environment variable for port if available, otherwise default to 5001
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point: `uvicorn asgi:app`
+/api/video-info runs on the event loop, so one worker can wait on many lookups at once,
+each under a deadline and cancelled when its client disconnects. Lookups here run as yt-dlp
+processes, which cancelling kills, even where the Flask routes use the in-process backend.
+Every other route is served by the Flask app through asgiref's WSGI adapter.
+"""
+
+import asyncio
+import json
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app_simple import app as flask_app, downloader
+from metadata_cache import trim_info
+from metrics import stage
+
+# Total time for a lookup, shared by all player client attempts
+INFO_DEADLINE = float(os.environ.get('YTDL_INFO_DEADLINE', 45))
+MAX_BODY_BYTES = 64 * 1024
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+class DeadlineExceeded(Exception):
+    """A lookup ran out of its time budget"""
+
+
+async def extract_with_fallback_async(url, deadline=INFO_DEADLINE):
+    """Async twin of downloader.extract_with_fallback sharing its metadata cache"""
+    cache_key = downloader.metadata_cache_key(url)
+    video_data = downloader.metadata_cache.get(cache_key)
+    if video_data is not None:
+        return video_data
+
+    try:
+        with stage('extraction'):
+            video_data = await asyncio.wait_for(
+                downloader.client_strategy.extract_async(downloader.extractor.extract_info_async, url), deadline)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Video lookup took longer than {deadline:g}s")
+
+    video_data = trim_info(video_data)
+    downloader.metadata_cache.set(cache_key, video_data)
+    return video_data
+
+
+async def read_body(receive):
+    """Read the request body; returns None if the client disconnected first"""
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        if not message.get('more_body'):
+            return body
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def video_info(scope, receive, send):
+    """POST /api/video-info"""
+    try:
+        body = await read_body(receive)
+        if body is None:
+            return
+        url = (json.loads(body or b'{}').get('url') or '').strip()
+    except (ValueError, AttributeError):
+        await send_json(send, {'success': False, 'error': 'Invalid request body'}, status=400)
+        return
+
+    if not url:
+        await send_json(send, {'success': False, 'error': 'Please provide a URL'})
+        return
+    if not downloader.is_valid_youtube_url(url):
+        await send_json(send, {'success': False, 'error': 'Please provide a valid YouTube URL'})
+        return
+    url = downloader.normalize_url(url)
+
+    lookup = asyncio.ensure_future(extract_with_fallback_async(url))
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({lookup, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not lookup.done():
+            # Client went away: stop the extraction (subprocess backends kill yt-dlp)
+            lookup.cancel()
+            await asyncio.gather(lookup, return_exceptions=True)
+    if lookup.cancelled():
+        return
+
+    try:
+        result = downloader.build_video_info(lookup.result())
+        status = 200
+    except DeadlineExceeded as e:
+        result, status = {'success': False, 'error': str(e)}, 504
+    except Exception as e:
+        result, status = {'success': False, 'error': str(e)}, 200
+    await send_json(send, result, status)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/video-info' and scope['method'] == 'POST':
+        await video_info(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Batch downloads for playlists, channels and URL lists
+Each batch has a coordinator thread that expands its sources lazily, keeps at most
+`concurrency` items in the download queue, retries failed items and publishes the
+per-item states plus an aggregate progress as one job record
+"""
+
+import threading
+import time
+import uuid
+
+from extraction import ExtractionError
+from logs import get_logger
+from scheduler import QueueFullError
+
+log = get_logger('batch')
+
+
+class BatchManager:
+    """Starts and tracks batch downloads on top of the regular download queue"""
+
+    def __init__(self, enqueue, expand, job_store, concurrency=2, retries=2, max_items=500, poll_interval=1.0,
+                 cancel=None):
+        self.enqueue = enqueue  # (url, quality_format_id, client_id) -> {'download_id', ...}
+        self.expand = expand  # url -> iterable of video URLs, or None for a single video
+        self.cancel = cancel  # download_id -> None, cancels a queued or running item
+        self.job_store = job_store
+        self.concurrency = concurrency
+        self.retries = retries
+        self.max_items = max_items
+        self.poll_interval = poll_interval
+
+    def start(self, sources, quality_format_id, client_id, concurrency=None, retries=None):
+        """Start a batch in the background and return its ID"""
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batch = {
+            'id': batch_id,
+            'quality_format_id': quality_format_id,
+            'client_id': client_id,
+            'concurrency': max(1, concurrency or self.concurrency),
+            'retries': self.retries if retries is None else max(0, retries),
+            'items': [],
+            'expanding': True,
+            'error': None,
+        }
+        self._publish(batch)
+        threading.Thread(target=self._run, args=(batch, list(sources)),
+                         name=f"batch-{batch_id}", daemon=True).start()
+        return batch_id
+
+    def _entries(self, batch, sources):
+        """Video URLs from every source, expanded only as far as the batch has consumed"""
+        seen = set()
+        for source in sources:
+            try:
+                urls = self.expand(source) or [source]
+                for url in urls:
+                    if url not in seen:
+                        seen.add(url)
+                        yield url
+            except ExtractionError as e:
+                log.warning("Could not expand batch source", extra={'source': source, 'error': str(e)})
+                batch['error'] = f"Could not expand {source}"
+
+    def _run(self, batch, sources):
+        """Coordinate a batch until every item finishes; a crash marks the batch failed"""
+        try:
+            self._coordinate(batch, sources)
+        except Exception as e:
+            log.exception("Batch coordinator crashed", extra={'batch': batch['id']})
+            batch.update(expanding=False, crashed=True, error=f"Batch failed: {e}")
+            self._publish(batch)
+        finally:
+            # Clears a cancel request (batches have no spec of their own)
+            self.job_store.drop_spec(batch['id'])
+
+    def _coordinate(self, batch, sources):
+        entries = self._entries(batch, sources)
+        pending = []  # items waiting for a queue slot (new or being retried)
+        active = []
+        last_published = None
+
+        while True:
+            # A cancel (job_store.request_cancel) may have been recorded by any worker
+            if not batch.get('cancelled') and self.job_store.cancel_requested(batch['id']):
+                self._cancel(batch, pending, active)
+
+            # Top up the pending list from the lazy expansion, but only as far as needed
+            while batch['expanding'] and len(pending) + len(active) < batch['concurrency']:
+                url = next(entries, None)
+                if url is None or len(batch['items']) >= self.max_items:
+                    batch['expanding'] = False
+                    break
+                item = {'url': url, 'download_id': None, 'status': 'pending', 'progress': 0, 'attempts': 0}
+                batch['items'].append(item)
+                pending.append(item)
+
+            while pending and len(active) < batch['concurrency']:
+                item = pending[0]
+                try:
+                    result = self.enqueue(item['url'], batch['quality_format_id'], batch['client_id'])
+                except QueueFullError:
+                    break  # try again on the next tick
+                except Exception as e:
+                    pending.pop(0)
+                    item.update(status='error', error=str(e))
+                    continue
+                pending.pop(0)
+                item['attempts'] += 1
+                item.update(download_id=result['download_id'], status='queued', error=None)
+                active.append(item)
+
+            for item in list(active):
+                self._refresh(item)
+                if item['status'] == 'completed':
+                    active.remove(item)
+                elif item['status'] == 'cancelled':
+                    active.remove(item)
+                elif item['status'] == 'error':
+                    active.remove(item)
+                    if item['attempts'] <= batch['retries'] and not batch.get('cancelled'):
+                        item['status'] = 'retrying'
+                        pending.append(item)
+
+            last_published = self._publish(batch, last_published)
+            if not (active or pending or batch['expanding']):
+                return
+            time.sleep(self.poll_interval)
+
+    def _cancel(self, batch, pending, active):
+        """Stop expanding, drop items not yet queued and cancel the queued and running ones"""
+        log.info("Cancelling batch", extra={'batch': batch['id'], 'pending': len(pending), 'active': len(active)})
+        batch.update(cancelled=True, expanding=False)
+        for item in pending:
+            item['status'] = 'cancelled'
+        pending.clear()
+        for item in active:
+            if self.cancel:
+                self.cancel(item['download_id'])
+
+    def _refresh(self, item):
+        job = self.job_store.get(item['download_id'])
+        if job is None:
+            # Expired or lost (e.g. the worker restarted) - treat as a failed attempt
+            item.update(status='error', error='Download record disappeared')
+            return
+        item['progress'] = job['progress']
+        status = job['status']
+        item['status'] = status.get('status', 'unknown')
+        if item['status'] == 'error':
+            item['error'] = status.get('error')
+        elif item['status'] == 'completed':
+            item['filename'] = status.get('filename')
+
+    def _publish(self, batch, last_published=None):
+        """Write the batch record if anything changed; returns what was written"""
+        items = [dict(item) for item in batch['items']]
+        completed = sum(1 for item in items if item['status'] == 'completed')
+        failed = sum(1 for item in items if item['status'] in ('error', 'cancelled'))
+        finished = not batch['expanding'] and completed + failed == len(items)
+        record = {
+            'status': ('error' if items and failed == len(items) else 'completed') if finished else 'running',
+            'batch': True,
+            'items': items,
+            'total': len(items),
+            'completed': completed,
+            'failed': failed,
+            'expanding': batch['expanding'],
+        }
+        if batch['error']:
+            record['error'] = batch['error']
+        if finished and not items:
+            record.update(status='error', error=batch['error'] or 'No videos found')
+        if batch.get('crashed'):
+            record['status'] = 'error'
+        elif finished and batch.get('cancelled'):
+            record['status'] = 'cancelled'
+        progress = sum(100 if item['status'] == 'completed' else item['progress'] for item in items) // len(items) if items else 0
+        if (record, progress) != last_published:
+            self.job_store.update(batch['id'], record, progress)
+        return record, progress
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end download jobs through the HTTP API, fully offline
+The app runs in a local server with its extractor swapped for FakeYouTube (recorded extractor
+JSON whose formats are served by a local fixture server), so /api/video-info, /api/download
+and /api/progress exercise the real pipeline: metadata cache, scheduler, yt-dlp downloads,
+merge, output cache and cleanup.
+
+Reports throughput, p50/p99 latency, CPU seconds per job, peak RSS and peak disk per job,
+plus the per-stage means from /metrics. Each run is appended to a JSON-lines results file
+with the commit it ran on and compared with the previous run of the same configuration.
+
+Usage: python benchmarks/bench_e2e.py [--jobs 20] [--concurrency 4] [--format 136]
+                                      [--size-scale 0.05] [--rate BYTES_PER_S] [--results PATH]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_youtube import FakeYouTube
+
+FINISHED = ('completed', 'error', 'unknown')
+STAGE_PATTERN = re.compile(r'^ytdl_stage_(duration_seconds_sum|duration_seconds_count|errors_total)'
+                           r'\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+# Compared between runs; higher is better only for throughput
+KEY_METRICS = ('throughput_jobs_per_s', 'job_s_p50', 'job_s_p99', 'info_ms_p50', 'info_ms_p99',
+               'cpu_s_per_job', 'peak_rss_mb', 'peak_disk_mb_per_job')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers={'Content-Type': 'application/json'} if body is not None else {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return json.loads(data) if response.getheader('Content-Type', '').startswith('application/json') else data.decode()
+
+
+def run_job(port, index, format_id, client_timeout):
+    """video-info -> download -> long-poll progress until finished; returns the job's timings"""
+    video_id = f"e2e{index:08d}"
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    started = time.perf_counter()
+    info = request(port, 'POST', '/api/video-info', {'url': url})
+    info_ms = (time.perf_counter() - started) * 1000
+    if not info.get('success'):
+        return {'status': 'error', 'error': info.get('error'), 'info_ms': info_ms}
+
+    submitted = time.perf_counter()
+    download = request(port, 'POST', '/api/download', {'url': url, 'quality_format_id': format_id})
+    submit_ms = (time.perf_counter() - submitted) * 1000
+    if not download.get('success'):
+        return {'status': 'error', 'error': download.get('error'), 'info_ms': info_ms, 'submit_ms': submit_ms}
+
+    version = 0
+    deadline = time.monotonic() + client_timeout
+    while time.monotonic() < deadline:
+        progress = request(port, 'GET', f"/api/progress/{download['download_id']}?since={version}&wait=25")
+        status = progress['status']
+        if status.get('status') in FINISHED:
+            break
+        version = progress['version']
+    else:
+        status = {'status': 'error', 'error': 'client timeout'}
+    return {
+        'status': status.get('status'),
+        'error': status.get('error'),
+        'download_id': download['download_id'],
+        'info_ms': info_ms,
+        'submit_ms': submit_ms,
+        'job_s': time.perf_counter() - started,
+    }
+
+
+class DiskSampler:
+    """Polls the working directories and output cache for peak usage, total and per job"""
+
+    def __init__(self, jobs_root, cache_root, interval=0.05):
+        self.jobs_root = jobs_root
+        self.cache_root = cache_root
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_per_job = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            total = directory_size(self.cache_root)
+            for name in os.listdir(self.jobs_root):
+                size = directory_size(os.path.join(self.jobs_root, name))
+                total += size
+                self.peak_per_job[name] = max(self.peak_per_job.get(name, 0), size)
+            self.peak_total = max(self.peak_total, total)
+            self._stop.wait(self.interval)
+
+
+def directory_size(path):
+    size = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return size
+
+
+def cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def stage_means(metrics_text):
+    """{stage: {'mean_s', 'count', 'errors'}} from the ytdl_stage_* series in /metrics"""
+    stages = {}
+    for series, name, value in STAGE_PATTERN.findall(metrics_text):
+        stages.setdefault(name, {'sum': 0.0, 'count': 0, 'errors': 0})
+        key = {'duration_seconds_sum': 'sum', 'duration_seconds_count': 'count', 'errors_total': 'errors'}[series]
+        stages[name][key] = float(value) if key == 'sum' else int(float(value))
+    return {name: {'mean_s': round(s['sum'] / s['count'], 4) if s['count'] else None,
+                   'count': s['count'], 'errors': s['errors']} for name, s in sorted(stages.items())}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(result, results_path):
+    """Print the change of each key metric against the previous run with the same configuration"""
+    previous = None
+    if os.path.exists(results_path):
+        with open(results_path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['config'] == result['config']:
+                    previous = record
+    if previous is None:
+        print("\nNo earlier run with this configuration to compare against")
+        return
+    print(f"\nChange since {previous['commit']} ({previous['timestamp']}):")
+    for key in KEY_METRICS:
+        old, new = previous['metrics'].get(key), result['metrics'].get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if key == 'throughput_jobs_per_s' else change > 0
+        marker = '⚠️ ' if worse and abs(change) >= 10 else '  '
+        print(f"  {marker}{key:<24} {old:>10.3f} -> {new:>10.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help="clients and download workers")
+    parser.add_argument('--format', default='136', help="format ID to download ('0' for MP3)")
+    parser.add_argument('--size-scale', type=float, default=0.05, help="fraction of the recorded format sizes to serve")
+    parser.add_argument('--rate', type=int, help="per-connection bytes/s from the media server")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to each extraction")
+    parser.add_argument('--timeout', type=float, default=600, help="seconds a client waits for its job")
+    parser.add_argument('--results', default=os.path.join(ROOT, 'benchmarks', 'results', 'e2e.jsonl'))
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='ytdl-e2e-')
+    os.environ.update({
+        'YTDL_WORK_DIR': os.path.join(work, 'jobs'),
+        'YTDL_OUTPUT_CACHE_DIR': os.path.join(work, 'cache'),
+        'YTDL_MAX_CONCURRENT_DOWNLOADS': str(args.concurrency),
+        'YTDL_MAX_QUEUED_DOWNLOADS': str(max(20, args.jobs)),
+        # Failures are summarized in the report; set YTDL_LOG_LEVEL to see each one
+        'YTDL_LOG_LEVEL': os.environ.get('YTDL_LOG_LEVEL', 'CRITICAL'),
+    })
+    os.environ.pop('YTDL_JOB_DB', None)
+
+    from werkzeug.serving import make_server
+    import app_simple
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    config = {'jobs': args.jobs, 'concurrency': args.concurrency, 'format': args.format,
+              'size_scale': args.size_scale, 'rate': args.rate, 'latency': args.latency}
+    try:
+        with FakeYouTube(size_scale=args.size_scale, rate=args.rate, latency=args.latency) as fake:
+            app_simple.downloader.extractor = fake
+            server = make_server("127.0.0.1", 0, app_simple.app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            port = server.server_port
+
+            print(f"🎬 End-to-end benchmark: {args.jobs} jobs, concurrency {args.concurrency}, "
+                  f"format {args.format}, media {sum(fake.sizes.values()) / 1024 ** 2:.1f}MB in total")
+            print("=" * 72)
+            if not app_simple.toolchain.ffmpeg:
+                print("⚠️  FFmpeg not found - video jobs will fail at the merge stage")
+            cpu_before = cpu_seconds()
+            started = time.perf_counter()
+            with DiskSampler(os.environ['YTDL_WORK_DIR'], os.environ['YTDL_OUTPUT_CACHE_DIR']) as disk:
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    jobs = list(pool.map(lambda index: run_job(port, index, args.format, args.timeout),
+                                         range(args.jobs)))
+            elapsed = time.perf_counter() - started
+            cpu = cpu_seconds() - cpu_before
+            stages = stage_means(request(port, 'GET', '/metrics'))
+            server.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    completed = [job for job in jobs if job['status'] == 'completed']
+    errors = [job for job in jobs if job['status'] != 'completed']
+    job_times = [job['job_s'] for job in completed]
+    info_times = [job['info_ms'] for job in jobs]
+    disk_peaks = [disk.peak_per_job.get(job.get('download_id'), 0) for job in jobs]
+    metrics = {
+        'completed': len(completed),
+        'failed': len(errors),
+        'throughput_jobs_per_s': round(len(completed) / elapsed, 3),
+        'elapsed_s': round(elapsed, 3),
+        'info_ms_p50': percentile(info_times, 0.5),
+        'info_ms_p99': percentile(info_times, 0.99),
+        'submit_ms_p50': percentile([job['submit_ms'] for job in jobs if 'submit_ms' in job], 0.5),
+        'job_s_p50': percentile(job_times, 0.5),
+        'job_s_p99': percentile(job_times, 0.99),
+        'cpu_s_per_job': round(cpu / len(jobs), 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'peak_child_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'peak_disk_mb_per_job': round(max(disk_peaks, default=0) / 1024 ** 2, 2),
+        'peak_disk_mb_total': round(disk.peak_total / 1024 ** 2, 2),
+    }
+
+    print(f"completed {metrics['completed']}/{len(jobs)} in {elapsed:.2f}s "
+          f"({metrics['throughput_jobs_per_s']:.2f} jobs/s)")
+    for name, values in (('video-info ms', info_times), ('job seconds', job_times)):
+        if values:
+            print(f"{name:<14} p50={percentile(values, 0.5):9.3f} p99={percentile(values, 0.99):9.3f}")
+    print(f"CPU per job    {metrics['cpu_s_per_job']:.3f}s (app + yt-dlp/FFmpeg children)")
+    print(f"peak RSS       app {metrics['peak_rss_mb']:.1f}MB, largest child {metrics['peak_child_rss_mb']:.1f}MB")
+    print(f"peak disk      {metrics['peak_disk_mb_per_job']:.2f}MB per job, {metrics['peak_disk_mb_total']:.2f}MB total")
+    print("\nStages (mean seconds, count, errors):")
+    for name, values in stages.items():
+        mean = f"{values['mean_s']:.3f}" if values['mean_s'] is not None else '-'
+        print(f"  {name:<12} {mean:>8} {values['count']:>5} {values['errors']:>5}")
+    if errors:
+        print(f"\n⚠️  {len(errors)} jobs failed, e.g.: {str(errors[0].get('error'))[:300]}")
+
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'config': config,
+        'metrics': metrics,
+        'stages': stages,
+    }
+    compare(result, args.results)
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    with open(args.results, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + '\n')
+    print(f"\nSaved to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU seconds per job for the old MP3 + AAC pipeline vs the stream-copy merge
+Generates fixture media locally with FFmpeg, so it needs FFmpeg but no network
+
+Usage: python benchmarks/bench_merge.py [duration_seconds]
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_simple import downloader
+
+
+def ffmpeg_cpu(ffmpeg, args):
+    """Run FFmpeg with -benchmark and return user + system CPU seconds"""
+    result = subprocess.run([ffmpeg, "-v", "error", "-benchmark", "-y"] + args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    match = re.search(r'bench: utime=([\d.]+)s stime=([\d.]+)s', result.stderr)
+    return float(match.group(1)) + float(match.group(2))
+
+
+def main():
+    duration = sys.argv[1] if len(sys.argv) > 1 else "60"
+    ffmpeg = downloader.toolchain.ffmpeg
+    if not ffmpeg:
+        print("❌ FFmpeg not found - this benchmark needs it to generate and merge media")
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench_merge_")
+    try:
+        video = os.path.join(workdir, "fixture_video.mp4")
+        audio = os.path.join(workdir, "fixture_audio.m4a")
+        ffmpeg_cpu(ffmpeg, ["-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={duration}",
+                            "-c:v", "libx264", "-preset", "ultrafast", video])
+        ffmpeg_cpu(ffmpeg, ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+                            "-c:a", "aac", "-b:a", "128k", audio])
+
+        print(f"🎬 Merge benchmark: {duration}s of 720p video + AAC audio")
+        print("=" * 50)
+
+        # Old pipeline: yt-dlp --extract-audio --audio-format mp3 --audio-quality 0, then AAC re-encode
+        mp3 = os.path.join(workdir, "fixture_audio.mp3")
+        extract_cpu = ffmpeg_cpu(ffmpeg, ["-i", audio, "-vn", "-c:a", "libmp3lame", "-q:a", "0", mp3])
+        stats = {}
+        downloader.merge_with_ffmpeg(video, mp3, os.path.join(workdir, "old.mp4"), audio_codec="aac", stats=stats)
+        old_cpu = extract_cpu + stats['cpu_seconds']
+        print(f"mp3+aac      {old_cpu:6.2f} CPU s  (mp3 extract {extract_cpu:.2f}s, aac merge {stats['cpu_seconds']:.2f}s)")
+
+        # New pipeline: original m4a audio stream-copied next to the video
+        output_file, merge_info = downloader.merge_streams(video, audio, os.path.join(workdir, "new"))
+        print(f"stream copy  {merge_info['cpu_seconds']:6.2f} CPU s  ({merge_info['mode']} into {os.path.basename(output_file)})")
+        print(f"✅ Saved {old_cpu - merge_info['cpu_seconds']:.2f} CPU seconds per job")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
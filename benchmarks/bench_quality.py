@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: quality-option selection over large format tables
+Compares the original dict-per-format loop (first entry per resolution wins) with the
+single-pass best-per-(height, fps) selection, on format tables shaped like YouTube's
+(itag ladder per codec, DRC/dubbed audio variants, storyboards)
+
+Usage: python benchmarks/bench_quality.py [iterations]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quality import make_ranker, select_quality_options
+
+# (height, fps) ladder YouTube serves for a 4K60 upload
+LADDER = [(144, 30), (240, 30), (360, 30), (480, 30), (720, 30), (720, 60),
+          (1080, 30), (1080, 60), (1440, 60), (2160, 60)]
+VIDEO_CODECS = ['avc1.640028', 'vp09.00.40.08', 'av01.0.08M.08']
+AUDIO = [('139', 'mp4a.40.5', 48), ('140', 'mp4a.40.2', 129), ('249', 'opus', 50),
+         ('250', 'opus', 70), ('251', 'opus', 135)]
+
+
+def format_table(variants, seed=1):
+    """A YouTube-like format list; `variants` copies of each rung (protocols, dubbed tracks, CDNs)"""
+    rng = random.Random(seed)
+    formats = [{'format_id': f'sb{i}', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'} for i in range(4)]
+    for variant in range(variants):
+        for format_id, acodec, abr in AUDIO:
+            formats.append({'format_id': f'{format_id}-{variant}', 'vcodec': 'none', 'acodec': acodec,
+                            'abr': abr + rng.random(), 'filesize': rng.randint(1, 9) * 1_000_000})
+        for height, fps in LADDER:
+            for codec in VIDEO_CODECS:
+                formats.append({'format_id': f'{height}{fps}{codec[:4]}-{variant}', 'vcodec': codec,
+                                'acodec': 'none', 'height': height, 'fps': fps, 'tbr': height * fps / 10,
+                                'filesize': rng.randint(5, 500) * 1_000_000})
+        formats.append({'format_id': f'18-{variant}', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2',
+                        'height': 360, 'fps': 30, 'filesize': 20_000_000})
+    rng.shuffle(formats)
+    return formats
+
+
+def legacy_quality_options(formats):
+    """The original get_video_info loop, kept verbatim as the baseline"""
+    quality_options = []
+    for fmt in formats:
+        height = fmt.get('height', 0)
+        filesize = fmt.get('filesize', 0)
+        fps = fmt.get('fps', 0)
+        vcodec = fmt.get('vcodec', 'none')
+        acodec = fmt.get('acodec', 'none')
+        format_id = fmt.get('format_id', '')
+        if vcodec != 'none':
+            size_mb = filesize / (1024 * 1024) if filesize else 0
+            if height:
+                display_name = f"{height}p"
+                if fps and fps > 0:
+                    display_name += f"@{fps}fps"
+            else:
+                display_name = "Unknown quality"
+            quality_options.append({
+                'format_id': format_id, 'height': int(height) if height else 0, 'fps': int(fps) if fps else 0,
+                'size_mb': size_mb, 'display': display_name, 'is_combined': acodec != 'none',
+                'vcodec': vcodec, 'acodec': acodec
+            })
+    audio_formats = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+    if audio_formats:
+        best_audio = max(audio_formats, key=lambda x: x.get('abr', 0) if x.get('abr') else 0)
+        quality_options.append({
+            'format_id': best_audio.get('format_id', ''), 'height': 0, 'fps': 0,
+            'size_mb': best_audio.get('filesize', 0) / (1024 * 1024) if best_audio.get('filesize') else 0,
+            'display': f"Audio Only ({best_audio.get('abr', 0)}kbps)", 'is_combined': False,
+            'vcodec': 'none', 'acodec': best_audio.get('acodec', 'none')
+        })
+    unique_qualities = {}
+    for quality in quality_options:
+        key = f"{quality['height']}_{quality['fps']}"
+        if key not in unique_qualities:
+            unique_qualities[key] = quality
+    return sorted(unique_qualities.values(), key=lambda x: (x['height'], x['fps']), reverse=True)
+
+
+def compact(formats, rank):
+    return [option.to_dict() for option in select_quality_options(formats, rank)]
+
+
+def bench(fn, formats, iterations):
+    fn(formats)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn(formats)
+    return (time.perf_counter() - start) / iterations * 1e6, result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rank = make_ranker()
+    print(f"📊 Quality selection benchmark ({iterations} iterations per table)")
+    print("=" * 72)
+    print(f"{'formats':>8} {'legacy µs':>11} {'single-pass µs':>15} {'speedup':>8} {'legacy B':>9} {'compact B':>10}")
+    for variants in (1, 10, 100):
+        formats = format_table(variants)
+        legacy_us, legacy = bench(legacy_quality_options, formats, iterations)
+        new_us, new = bench(lambda f: compact(f, rank), formats, iterations)
+        legacy_bytes = len(json.dumps(legacy, separators=(',', ':')))
+        new_bytes = len(json.dumps(new, separators=(',', ':')))
+        print(f"{len(formats):>8} {legacy_us:>11.1f} {new_us:>15.1f} {legacy_us / new_us:>7.2f}x "
+              f"{legacy_bytes:>9} {new_bytes:>10}")
+
+    # What first-wins dedup costs: how often it keeps a different format than the ranked pick
+    differing = total = 0
+    example = None
+    for seed in range(50):
+        formats = format_table(1, seed=seed)
+        legacy = {(q['height'], q['fps']): q for q in legacy_quality_options(formats)}
+        for option in compact(formats, rank):
+            key = (option['height'], option['fps'])
+            total += 1
+            if legacy[key]['format_id'] != option['format_id']:
+                differing += 1
+                example = example or (key, legacy[key], option)
+    print(f"\nFirst-wins dedup kept a different format in {differing}/{total} (height, fps) slots over 50 tables")
+    if example:
+        (height, fps), old, new = example
+        print(f"   e.g. {height}p{fps}: legacy {old['format_id']} ({old['vcodec']}, combined={old['is_combined']}, "
+              f"{old['size_mb']:.1f}MB) vs ranked {new['format_id']} ({new['vcodec']}, combined={new['is_combined']}, "
+              f"{new['size_mb']:.1f}MB)")
+
+
+if __name__ == "__main__":
+    main()
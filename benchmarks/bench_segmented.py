@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark: one large stream over yt-dlp's single connection vs segmented Range fetching
+The fixture server throttles each connection (like YouTube does), so it runs offline
+
+Usage: python benchmarks/bench_segmented.py [size_mb] [rate_mb_per_s_per_connection]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixture_server import FixtureServer, fixture_bytes
+from segmented import segmented_command
+from supervisor import ProcessSupervisor
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rate_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    size = int(size_mb * 1024 * 1024)
+    supervisor = ProcessSupervisor()
+
+    with FixtureServer({'/video.mp4': (fixture_bytes(size), 'video/mp4')}, rate=int(rate_mb * 1024 * 1024)) as server:
+        fmt = {'url': server.url('/video.mp4'), 'protocol': 'http', 'filesize': size}
+        runs = [('yt-dlp', [sys.executable, "-m", "yt_dlp", "--no-warnings", "-o", "video.mp4", fmt['url']])]
+        runs += [(f"segmented x{n}", segmented_command(fmt, "video.mp4", n)) for n in (1, 2, 4, 8)]
+
+        print(f"🎬 Segmented fetch benchmark: {size_mb:.0f}MB at {rate_mb}MB/s per connection")
+        print("=" * 64)
+        for label, cmd in runs:
+            workdir = tempfile.mkdtemp(prefix="bench_segmented_")
+            requests_before = server.httpd.requests
+            try:
+                started = time.perf_counter()
+                result = supervisor.run(cmd, cwd=workdir, timeout=600)
+                elapsed = time.perf_counter() - started
+                if result.returncode != 0 or os.path.getsize(os.path.join(workdir, "video.mp4")) != size:
+                    print(f"{label:<14} failed: {result.stderr.strip()[-200:]}")
+                    continue
+                summary = next((line for line in result.stdout.splitlines() if line.startswith('[segmented]')), '')
+                print(f"{label:<14} {elapsed:6.2f}s  {size_mb / elapsed:6.2f}MB/s  "
+                      f"{server.httpd.requests - requests_before:3d} requests  {summary[12:]}")
+            finally:
+                shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
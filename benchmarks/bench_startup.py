@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: gunicorn worker boot time (a fresh interpreter importing app_simple)
+Each run is a new process. "boot" is the import, after which the worker serves requests;
+"toolchain" is how long FFmpeg/yt-dlp discovery takes in the background, with the probe
+cache deleted before every run (cold, what every boot used to pay inline) or kept (warm)
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--stub-ffmpeg SECONDS]
+--stub-ffmpeg stands in a script for ffmpeg that takes SECONDS to answer -version
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, time
+started = time.perf_counter()
+import app_simple
+boot = time.perf_counter() - started
+app_simple.toolchain.resolve()
+print(json.dumps({'boot': boot, 'toolchain': app_simple.toolchain.resolve_seconds,
+                  'probes': app_simple.toolchain.probes}))
+os._exit(0)
+"""
+
+
+def boot_once(env):
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def report(label, runs):
+    boot = statistics.median(run['boot'] for run in runs) * 1000
+    toolchain = statistics.median(run['toolchain'] for run in runs) * 1000
+    probes = sum(run['probes'] for run in runs) / len(runs)
+    print(f"{label:<6} boot {boot:7.1f}ms   toolchain {toolchain:7.1f}ms   probes/boot {probes:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--stub-ffmpeg', type=float, metavar='SECONDS',
+                        help="use a stand-in ffmpeg that takes this long to report its version")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='ytdl-startup-')
+    cache_file = os.path.join(work, 'toolchain.json')
+    env = dict(os.environ, YTDL_TOOLCHAIN_CACHE=cache_file, YTDL_WORK_DIR=os.path.join(work, 'jobs'),
+               YTDL_OUTPUT_CACHE_DIR=os.path.join(work, 'cache'), YTDL_LOG_LEVEL='CRITICAL')
+    env.pop('YTDL_JOB_DB', None)
+    if args.stub_ffmpeg is not None:
+        stub = os.path.join(work, 'ffmpeg')
+        with open(stub, 'w') as f:
+            f.write(f'#!/bin/sh\nsleep {args.stub_ffmpeg}\necho "ffmpeg version stub"\n')
+        os.chmod(stub, 0o755)
+        env['YTDL_FFMPEG'] = stub
+
+    try:
+        boot_once(env)  # Warm the OS page cache and bytecode before timing
+        print(f"🚀 Worker boot benchmark: {args.runs} fresh interpreters per row")
+        print("=" * 64)
+        cold = []
+        for _ in range(args.runs):
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            cold.append(boot_once(env))
+        report("cold", cold)
+        report("warm", [boot_once(env) for _ in range(args.runs)])
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
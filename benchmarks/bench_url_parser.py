@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: URL validation and video-ID extraction
+Compares the original path (three patterns compiled per call through re's cache, then a
+separate ID search) with the single precompiled parser, over a corpus of URL variants
+(hosts, paths, tracking parameters, playlists, channels and non-YouTube links)
+
+Usage: python benchmarks/bench_url_parser.py [corpus_size]
+"""
+
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from youtube_url import parse_youtube_url
+
+LEGACY_PATTERNS = [
+    r'(?:https?://)?(?:www\.)?youtube\.com/watch\?v=[\w-]+',
+    r'(?:https?://)?(?:www\.)?youtu\.be/[\w-]+',
+    r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+'
+]
+LEGACY_VIDEO_ID = re.compile(r'(?:[?&]v=|youtu\.be/|/embed/|/shorts/)([\w-]{11})')
+
+ID_CHARS = string.ascii_letters + string.digits + '-_'
+TEMPLATES = [
+    'https://www.youtube.com/watch?v={id}',
+    'https://youtube.com/watch?v={id}&t={n}s',
+    'youtube.com/watch?v={id}',
+    'https://m.youtube.com/watch?v={id}&feature=share',
+    'https://music.youtube.com/watch?v={id}&si={token}',
+    'https://www.youtube.com/watch?app=desktop&v={id}&list=PL{token}',
+    'https://youtu.be/{id}',
+    'https://youtu.be/{id}?si={token}&t={n}',
+    'https://www.youtube.com/embed/{id}?autoplay=1',
+    'https://www.youtube-nocookie.com/embed/{id}',
+    'https://www.youtube.com/shorts/{id}',
+    'https://www.youtube.com/live/{id}?feature=shared',
+    'https://www.youtube.com/playlist?list=PL{token}',
+    'https://www.youtube.com/@channel{n}/videos',
+    'https://vimeo.com/{n}',
+    'https://example.com/watch?v={id}',
+]
+
+
+def corpus(size, seed=1):
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(size):
+        template = rng.choice(TEMPLATES)
+        urls.append(template.format(
+            id=''.join(rng.choice(ID_CHARS) for _ in range(11)),
+            token=''.join(rng.choice(ID_CHARS) for _ in range(16)),
+            n=rng.randint(1, 5000),
+        ))
+    return urls
+
+
+def legacy(url):
+    """The original is_valid_youtube_url followed by extract_video_id"""
+    if not any(re.match(pattern, url) for pattern in LEGACY_PATTERNS):
+        return None
+    match = LEGACY_VIDEO_ID.search(url)
+    return match.group(1) if match else None
+
+
+def unified(url):
+    parsed = parse_youtube_url(url)
+    return parsed.video_id if parsed and parsed.kind == 'video' else None
+
+
+def bench(fn, urls):
+    start = time.perf_counter()
+    results = [fn(url) for url in urls]
+    return time.perf_counter() - start, results
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    urls = corpus(size)
+    bench(legacy, urls[:1000])
+    bench(unified, urls[:1000])
+
+    legacy_s, legacy_ids = bench(legacy, urls)
+    unified_s, unified_ids = bench(unified, urls)
+
+    print(f"📊 URL parser benchmark ({size:,} URLs, {len(TEMPLATES)} variants)")
+    print("=" * 60)
+    print(f"{'':>10} {'seconds':>9} {'URLs/s':>12} {'video IDs':>10}")
+    for name, seconds, ids in (('legacy', legacy_s, legacy_ids), ('unified', unified_s, unified_ids)):
+        found = sum(1 for video_id in ids if video_id)
+        print(f"{name:>10} {seconds:>9.3f} {size / seconds:>12,.0f} {found:>10,}")
+    print(f"\nSpeedup: {legacy_s / unified_s:.2f}x")
+
+    # Variants the old validator turned away (or accepted with a different ID)
+    missed = {}
+    for url, old, new in zip(urls, legacy_ids, unified_ids):
+        if old != new:
+            host_path = url.split('?')[0].rsplit('/', 1)[0]
+            missed[host_path] = missed.get(host_path, 0) + 1
+    print(f"Recognized differently: {sum(missed.values()):,} URLs")
+    for host_path, count in sorted(missed.items(), key=lambda item: -item[1]):
+        print(f"   {host_path:<40} {count:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for the benchmarks
+Serves deterministic fixture media so nothing has to reach YouTube
+"""
+
+import io
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def fixture_bytes(size):
+    """Deterministic payload of the given size"""
+    block = bytes(range(256)) * 4096
+    return (block * (size // len(block) + 1))[:size]
+
+
+def fixture_image(width=1280, height=720, fmt='JPEG'):
+    """Encoded test image: a gradient, so resized and re-encoded variants aren't trivially small"""
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _lookup(self):
+        return self.server.files.get(self.path.split('?', 1)[0])
+
+    def do_HEAD(self):
+        entry = self._lookup()
+        if entry is None:
+            self.send_error(404)
+            return
+        data, content_type = entry
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        entry = self._lookup()
+        if entry is None:
+            self.send_error(404)
+            return
+        data, content_type = entry
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.fail_requests > 0
+            self.server.fail_requests -= fail
+            stall = not fail and self.server.stall_requests > 0
+            self.server.stall_requests -= stall
+
+        body, status = data, 200
+        range_header = self.headers.get("Range")
+        if range_header and self.server.ranges:
+            match = RANGE_PATTERN.match(range_header.strip())
+            if match and match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            elif match and match.group(2):
+                start, end = max(0, len(data) - int(match.group(2))), len(data) - 1
+            else:
+                start, end = 0, -1
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body, status = data[start:end + 1], 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes" if self.server.ranges else "none")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if fail:
+            # Cut the response off halfway, like a dropped connection
+            self._write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        if stall:
+            # Send half the body, then go quiet with the connection still open
+            self._write(body[:len(body) // 2])
+            self.wfile.flush()
+            time.sleep(self.server.stall_seconds)
+            self.close_connection = True
+            return
+        self._write(body)
+
+    def _write(self, data):
+        """Send the body, throttled to the server's per-connection rate if one is set"""
+        rate = self.server.rate
+        if not rate:
+            self.wfile.write(data)
+            return
+        chunk = max(1, rate // 20)
+        for offset in range(0, len(data), chunk):
+            self.wfile.write(data[offset:offset + chunk])
+            time.sleep(chunk / rate)
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response is expected (HEAD probes, cancelled fetches)
+        pass
+
+
+class FixtureServer:
+    """Background HTTP server; use as a context manager
+
+    Range requests are answered with 206 unless ranges=False. The first fail_requests GETs
+    are cut off halfway through the body, to exercise retries; the next stall_requests GETs
+    stop sending halfway and hold the connection open for stall_seconds, to exercise timeouts.
+    """
+
+    def __init__(self, files=None, rate=None, ranges=True, fail_requests=0, stall_requests=0, stall_seconds=5):
+        self.httpd = QuietHTTPServer(("127.0.0.1", 0), FixtureHandler)
+        self.httpd.rate = rate  # bytes per second per connection
+        self.httpd.ranges = ranges
+        self.httpd.fail_requests = fail_requests
+        self.httpd.stall_requests = stall_requests
+        self.httpd.stall_seconds = stall_seconds
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self.httpd.files = {}
+        for path, (data, content_type) in (files or {}).items():
+            self.add(path, data, content_type)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add(self, path, data, content_type="video/mp4"):
+        self.httpd.files[path] = (data, content_type)
+
+    def url(self, path):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
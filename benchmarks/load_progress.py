@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Load test: progress delivery by polling vs long-poll vs Server-Sent Events
+Runs N fake downloads inside a local server and measures HTTP request rate and
+worker occupancy (average/max requests being handled at once) for each mode
+
+Usage: python benchmarks/load_progress.py [downloads] [duration_seconds]
+"""
+
+import http.client
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+import app_simple
+
+UPDATE_INTERVAL = 2.0  # how often a fake job actually changes
+
+
+class OccupancyMiddleware:
+    """Counts requests and integrates the time handlers are busy"""
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.busy_seconds = 0.0
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def done():
+            with self.lock:
+                self.in_flight -= 1
+                self.busy_seconds += time.perf_counter() - start
+
+        return ClosingIterator(self.app(environ, start_response), [done])
+
+
+def fake_job(download_id, duration):
+    steps = int(duration / UPDATE_INTERVAL)
+    for step in range(1, steps + 1):
+        time.sleep(UPDATE_INTERVAL)
+        if step == steps:
+            app_simple.update_job(download_id, {'status': 'completed', 'filename': 'fake.mp4'}, progress=100)
+        else:
+            app_simple.update_job(download_id, {'status': 'downloading'}, progress=step * 100 // steps)
+
+
+def get_json(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", path)
+    data = json.loads(conn.getresponse().read())
+    conn.close()
+    return data
+
+
+def poll_client(port, download_id):
+    while get_json(port, f"/api/progress/{download_id}")['status']['status'] != 'completed':
+        time.sleep(1)
+
+
+def long_poll_client(port, download_id):
+    version = 0
+    while True:
+        data = get_json(port, f"/api/progress/{download_id}?since={version}&wait=25")
+        if data['status']['status'] == 'completed':
+            return
+        version = data['version']
+
+
+def sse_client(port, download_id):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", f"/api/progress/{download_id}/events")
+    response = conn.getresponse()
+    for line in response:
+        if line.startswith(b"data: ") and json.loads(line[6:])['status']['status'] == 'completed':
+            break
+    conn.close()
+
+
+def run_mode(name, client, port, middleware, downloads, duration):
+    middleware.reset()
+    threads = []
+    for i in range(downloads):
+        download_id = f"load_{name}_{i}"
+        app_simple.update_job(download_id, {'status': 'downloading'}, progress=0)
+        threads.append(threading.Thread(target=fake_job, args=(download_id, duration)))
+        threads.append(threading.Thread(target=client, args=(port, download_id)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} requests={middleware.requests:5d} ({middleware.requests / elapsed:6.1f}/s)  "
+          f"occupancy avg={middleware.busy_seconds / elapsed:6.2f} max={middleware.max_in_flight:3d}")
+
+
+def main():
+    downloads = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    middleware = OccupancyMiddleware(app_simple.app)
+    server = make_server("127.0.0.1", 0, middleware, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    print(f"🎬 Progress delivery load test: {downloads} downloads x {duration}s, one change every {UPDATE_INTERVAL}s")
+    print("=" * 50)
+    try:
+        run_mode('polling', poll_client, port, middleware, downloads, duration)
+        run_mode('long-poll', long_poll_client, port, middleware, downloads, duration)
+        run_mode('sse', sse_client, port, middleware, downloads, duration)
+    finally:
+        server.shutdown()
+    print("ℹ️  Push modes trade request rate for held connections - serve them from threaded workers (gthread)")
+
+
+if __name__ == "__main__":
+    main()
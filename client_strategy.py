@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Player-client selection for metadata extraction
+Clients are tried in the order that recently worked best; if the first one hasn't answered
+after `hedge_delay` seconds (or fails), the next one is started alongside it and the first
+good result wins
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+from extraction import ExtractionError
+
+DEFAULT_CLIENTS = ('web', 'android')
+
+
+class ClientStats:
+    """Outcomes of a client's most recent attempts"""
+
+    def __init__(self, window):
+        self.outcomes = deque(maxlen=window)  # (succeeded, seconds)
+        self.attempts = 0
+        self.wins = 0
+
+    def record(self, succeeded, seconds):
+        self.outcomes.append((succeeded, seconds))
+        self.attempts += 1
+
+    def success_rate(self):
+        if not self.outcomes:
+            return None
+        return sum(1 for succeeded, _ in self.outcomes if succeeded) / len(self.outcomes)
+
+    def latency(self):
+        """Mean latency of recent successful attempts"""
+        times = [seconds for succeeded, seconds in self.outcomes if succeeded]
+        return sum(times) / len(times) if times else None
+
+    def score(self, penalty):
+        """Expected seconds to a good result; failures cost `penalty` seconds each"""
+        rate = self.success_rate()
+        if not rate:
+            return float('inf')
+        return (self.latency() + (1 - rate) * penalty) / rate
+
+
+class HedgedClientStrategy:
+    """Orders player clients by recent results and races them with a hedge delay"""
+
+    def __init__(self, clients=DEFAULT_CLIENTS, hedge_delay=3.0, window=50, min_samples=5):
+        self.clients = tuple(clients)
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.hedges = 0
+        self._stats = {client: ClientStats(window) for client in self.clients}
+        self._lock = threading.Lock()
+
+    def order(self):
+        """Clients, best first; the configured order is kept until every client has enough samples"""
+        with self._lock:
+            if any(len(stats.outcomes) < self.min_samples for stats in self._stats.values()):
+                return list(self.clients)
+            penalty = max(self.hedge_delay, 1.0)
+            return sorted(self.clients, key=lambda client: self._stats[client].score(penalty))
+
+    def record(self, client, succeeded, seconds, won=False):
+        with self._lock:
+            stats = self._stats[client]
+            stats.record(succeeded, seconds)
+            if won:
+                stats.wins += 1
+
+    def extract(self, extract_info, url):
+        """Run extract_info(url, client) with hedging; returns the first successful result"""
+        order = self.order()
+        results = queue.Queue()
+        first_success = threading.Lock()
+
+        def attempt(client):
+            started = time.perf_counter()
+            try:
+                info, error = extract_info(url, client), None
+            except Exception as e:
+                info, error = None, e
+            # Losers still report, so slow clients keep being measured
+            won = error is None and first_success.acquire(blocking=False)
+            self.record(client, error is None, time.perf_counter() - started, won=won)
+            results.put((info, error))
+
+        def launch():
+            client = order[len(started_clients)]
+            started_clients.append(client)
+            threading.Thread(target=attempt, args=(client,), daemon=True).start()
+
+        started_clients = []
+        launch()
+        pending = 1
+        while True:
+            try:
+                timeout = self.hedge_delay if len(started_clients) < len(order) else None
+                info, error = results.get(timeout=timeout)
+            except queue.Empty:
+                # The running client is slow: start the next one alongside it
+                with self._lock:
+                    self.hedges += 1
+                launch()
+                pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                return info
+            if not pending and len(started_clients) < len(order):
+                launch()
+                pending += 1
+            elif not pending:
+                raise error
+
+    async def extract_async(self, extract_info_async, url):
+        """Async extract with hedging; slower attempts are cancelled once one succeeds"""
+        order = self.order()
+        tasks = {}
+
+        async def attempt(client):
+            started = time.perf_counter()
+            try:
+                info = await extract_info_async(url, client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.record(client, False, time.perf_counter() - started)
+                raise
+            self.record(client, True, time.perf_counter() - started, won=True)
+            return info
+
+        def launch():
+            client = order[len(started_clients)]
+            started_clients.append(client)
+            tasks[asyncio.ensure_future(attempt(client))] = client
+
+        started_clients = []
+        last_error = None
+        launch()
+        try:
+            while tasks:
+                timeout = self.hedge_delay if len(started_clients) < len(order) else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    with self._lock:
+                        self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    del tasks[task]
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not tasks and len(started_clients) < len(order):
+                    launch()
+            raise last_error or ExtractionError("No player client succeeded")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            clients = {}
+            for client, stats in self._stats.items():
+                rate = stats.success_rate()
+                latency = stats.latency()
+                clients[client] = {
+                    'attempts': stats.attempts,
+                    'wins': stats.wins,
+                    'recent_success_rate': round(rate, 3) if rate is not None else None,
+                    'recent_latency': round(latency, 3) if latency is not None else None,
+                }
+            hedges = self.hedges
+        return {'order': self.order(), 'hedge_delay': self.hedge_delay, 'hedges': hedges, 'clients': clients}
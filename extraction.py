@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Extraction backends for yt-dlp metadata lookups
+The in-process backend keeps warm YoutubeDL instances per player client,
+the subprocess backend runs `yt-dlp --dump-json` as before
+"""
+
+import asyncio
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+from logs import get_logger
+from metrics import count_spawn
+
+log = get_logger('extraction')
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+FORMAT_SORT = ["res", "fps", "codec:h264"]
+
+
+class ExtractionError(Exception):
+    """yt-dlp could not extract the requested URL"""
+
+
+def player_client_args(player_client):
+    """Extractor args for a YouTube player client, matching the CLI flags we used to pass"""
+    args = {'player_client': [player_client]}
+    if player_client == 'web':
+        args['player_skip'] = ['webpage']
+    return {'youtube': args}
+
+
+def entry_video_url(entry):
+    """Watch URL for a flat playlist entry (entries often carry only an ID)"""
+    if entry.get('id') and entry.get('ie_key', 'Youtube') == 'Youtube':
+        return f"https://www.youtube.com/watch?v={entry['id']}"
+    return entry.get('url')
+
+
+class SubprocessExtractor:
+    """Runs yt-dlp in a fresh interpreter for every lookup"""
+
+    name = 'subprocess'
+
+    def __init__(self, toolchain=None, timeout=30):
+        self.toolchain = toolchain
+        self.timeout = timeout
+
+    @property
+    def yt_dlp_cmd(self):
+        """The toolchain's yt-dlp command, or this interpreter's module without one"""
+        return self.toolchain.yt_dlp if self.toolchain else [sys.executable, "-m", "yt_dlp"]
+
+    def build_command(self, url, player_client='web'):
+        """Build the --dump-json command line for a player client"""
+        cmd = self.yt_dlp_cmd + [
+            "--dump-json",
+            "--no-playlist",
+            "--format-sort", ",".join(FORMAT_SORT),
+            "--no-warnings",
+            "--user-agent", USER_AGENT,
+        ]
+        for key, values in player_client_args(player_client)['youtube'].items():
+            cmd += ["--extractor-args", f"youtube:{key}={','.join(values)}"]
+        cmd.append(url)
+        return cmd
+
+    def extract_info(self, url, player_client='web'):
+        """Return the yt-dlp info dict for a URL"""
+        cmd = self.build_command(url, player_client)
+        try:
+            count_spawn('yt-dlp')
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise ExtractionError(f"yt-dlp timed out after {self.timeout}s")
+
+        if result.returncode != 0:
+            raise ExtractionError(f"yt-dlp error: {result.stderr}")
+
+        return json.loads(result.stdout)
+
+    async def extract_info_async(self, url, player_client='web'):
+        """Async extract_info; cancelling the call (or its deadline) kills yt-dlp"""
+        count_spawn('yt-dlp')
+        process = await asyncio.create_subprocess_exec(
+            *self.build_command(url, player_client),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ExtractionError(f"yt-dlp timed out after {self.timeout}s")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        if process.returncode != 0:
+            raise ExtractionError(f"yt-dlp error: {stderr.decode(errors='replace')}")
+
+        return json.loads(stdout)
+
+    def iter_entries(self, url):
+        """Yield video URLs of a playlist/channel as yt-dlp lists them (flat, lazily)"""
+        cmd = self.yt_dlp_cmd + [
+            "--flat-playlist", "--lazy-playlist", "--dump-json",
+            "--no-warnings",
+            "--user-agent", USER_AGENT,
+            url,
+        ]
+        count_spawn('yt-dlp')
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        try:
+            for line in process.stdout:
+                if line.strip():
+                    entry_url = entry_video_url(json.loads(line))
+                    if entry_url:
+                        yield entry_url
+            if process.wait() != 0:
+                raise ExtractionError(f"yt-dlp error: {process.stderr.read()}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+class InProcessExtractor:
+    """Keeps a small pool of warm yt_dlp.YoutubeDL instances per player client
+
+    Synchronous only: a running lookup can't be interrupted, so async callers (hedged and
+    deadline-bound lookups) use the subprocess backend instead, see FallbackExtractor
+    """
+
+    name = 'inprocess'
+
+    def __init__(self, pool_size=2):
+        import yt_dlp  # Imported here so a missing module only disables this backend
+        self._yt_dlp = yt_dlp
+        self.pool_size = pool_size
+        self._pools = {}
+        self._created = {}
+        self._lock = threading.Lock()
+
+    def _options(self, player_client):
+        return {
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'skip_download': True,
+            'format_sort': FORMAT_SORT,
+            'http_headers': {'User-Agent': USER_AGENT},
+            'extractor_args': player_client_args(player_client),
+        }
+
+    def _acquire(self, player_client):
+        """Take an idle instance for the client, creating one while the pool has room"""
+        with self._lock:
+            pool = self._pools.setdefault(player_client, queue.LifoQueue())
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                pass
+            if self._created.get(player_client, 0) < self.pool_size:
+                self._created[player_client] = self._created.get(player_client, 0) + 1
+                return self._yt_dlp.YoutubeDL(self._options(player_client))
+        return pool.get()
+
+    def _release(self, player_client, ydl):
+        self._pools[player_client].put(ydl)
+
+    def extract_info(self, url, player_client='web'):
+        """Return the yt-dlp info dict for a URL"""
+        ydl = self._acquire(player_client)
+        try:
+            info = ydl.extract_info(url, download=False)
+            return ydl.sanitize_info(info)
+        except self._yt_dlp.utils.DownloadError as e:
+            raise ExtractionError(f"yt-dlp error: {e}")
+        finally:
+            self._release(player_client, ydl)
+
+    def iter_entries(self, url):
+        """Yield video URLs of a playlist/channel as yt-dlp lists them (flat, lazily)"""
+        ydl = self._yt_dlp.YoutubeDL({
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'http_headers': {'User-Agent': USER_AGENT},
+        })
+        try:
+            info = ydl.extract_info(url, download=False, process=False)
+        except self._yt_dlp.utils.DownloadError as e:
+            raise ExtractionError(f"yt-dlp error: {e}")
+        yield from self._flatten(ydl, info, depth=0)
+
+    def _flatten(self, ydl, info, depth):
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            entry_url = entry_video_url(info)
+            if entry_url:
+                yield entry_url
+            return
+        for entry in info.get('entries') or ():
+            # Channel URLs list their tabs (Videos, Shorts...) as nested playlists
+            if entry.get('_type') == 'url' and entry.get('ie_key') == 'YoutubeTab' and depth == 0:
+                try:
+                    nested = ydl.extract_info(entry['url'], download=False, process=False)
+                except self._yt_dlp.utils.DownloadError as e:
+                    log.warning("Skipping channel tab", extra={'url': entry['url'], 'error': str(e)})
+                    continue
+                yield from self._flatten(ydl, nested, depth + 1)
+            else:
+                entry_url = entry_video_url(entry)
+                if entry_url:
+                    yield entry_url
+
+
+class FallbackExtractor:
+    """Uses the primary backend and falls back when it breaks (not when the video is unavailable)"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def extract_info(self, url, player_client='web'):
+        try:
+            return self.primary.extract_info(url, player_client)
+        except ExtractionError:
+            raise
+        except Exception as e:
+            log.warning("Extractor failed, falling back", extra={
+                'extractor': self.primary.name, 'fallback': self.fallback.name, 'error': str(e)})
+            return self.fallback.extract_info(url, player_client)
+
+    async def extract_info_async(self, url, player_client='web'):
+        """Async lookups go to the fallback when the primary has no async path (InProcessExtractor:
+        a cancelled or overdue lookup would keep running and holding a pooled instance)"""
+        if not hasattr(self.primary, 'extract_info_async'):
+            return await self.fallback.extract_info_async(url, player_client)
+        try:
+            return await self.primary.extract_info_async(url, player_client)
+        except ExtractionError:
+            raise
+        except Exception as e:
+            log.warning("Extractor failed, falling back", extra={
+                'extractor': self.primary.name, 'fallback': self.fallback.name, 'error': str(e)})
+            return await self.fallback.extract_info_async(url, player_client)
+
+    def iter_entries(self, url):
+        yielded = 0
+        try:
+            for entry_url in self.primary.iter_entries(url):
+                yielded += 1
+                yield entry_url
+        except ExtractionError:
+            raise
+        except Exception as e:
+            log.warning("Extractor failed, falling back", extra={
+                'extractor': self.primary.name, 'fallback': self.fallback.name, 'error': str(e)})
+            # Resume where the primary stopped so no entry is queued twice
+            for index, entry_url in enumerate(self.fallback.iter_entries(url)):
+                if index >= yielded:
+                    yield entry_url
+
+
+def create_extractor(backend=None, pool_size=None, toolchain=None):
+    """Create the extraction backend selected by YTDL_EXTRACTOR (inprocess or subprocess)
+
+    The subprocess backend runs yt-dlp as toolchain resolves it (see toolchain.py)
+    """
+    backend = backend or os.environ.get('YTDL_EXTRACTOR', 'inprocess')
+    pool_size = pool_size or int(os.environ.get('YTDL_EXTRACTOR_POOL', 2))
+
+    subprocess_backend = SubprocessExtractor(toolchain=toolchain)
+    if backend == 'subprocess':
+        return subprocess_backend
+
+    try:
+        return FallbackExtractor(InProcessExtractor(pool_size=pool_size), subprocess_backend)
+    except ImportError:
+        log.warning("yt_dlp is not importable - using the subprocess extractor")
+        return subprocess_backend
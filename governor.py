@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Resource governor for concurrent download jobs
+A global bandwidth limit is split across the active transfers (weighted by the job's priority
+class, then evenly between a job's streams) and re-split whenever one starts or finishes.
+Fixed transfers (yt-dlp, whose --limit-rate can't change once it runs) keep the rate they
+started with, reserved out of the limit; adjustable ones (segmented.py following a rate
+file) share whatever those leave.
+CPU-heavy merges share a fixed number of slots, handed out by priority, so transcodes can't
+take every core away from the request threads.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
+
+from logs import get_logger
+from quality import is_audio_only
+
+log = get_logger('governor')
+
+# Dispatch order of the scheduler's priority classes: quick audio-only jobs first, batch items last
+PRIORITY_CLASSES = ('audio', 'video', 'batch')
+# Relative bandwidth share of a job in each class
+PRIORITY_WEIGHTS = {'audio': 4, 'video': 2, 'batch': 1}
+
+# Floor for every active transfer, so one starting while fixed transfers hold the whole limit
+# still moves; the limit can be overshot by at most this much per such transfer
+MIN_RATE = 64 * 1024
+
+# How often a job waiting for a merge slot checks whether it was cancelled
+MERGE_WAIT_POLL = 1.0
+
+
+def priority_class(quality_format_id, batch=False, formats=()):
+    """Priority class of a download request
+
+    formats is the video's format table, if known, so an audio format's ID counts as audio
+    (see quality.is_audio_only).
+    """
+    if batch:
+        return 'batch'
+    return 'audio' if is_audio_only(quality_format_id, formats) else 'video'
+
+
+def priority_rank(name):
+    """Scheduler priority (lower runs first) of a priority class"""
+    return PRIORITY_CLASSES.index(name) if name in PRIORITY_CLASSES else len(PRIORITY_CLASSES)
+
+
+class TokenBucket:
+    """Blocks callers so the bytes they consume average out to `rate` per second
+
+    Holds at most one second's worth of tokens; a rate of None or 0 means unlimited.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate or None
+        self._tokens = self.rate or 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate or None
+            self._tokens = min(self._tokens, self.rate or 0)
+
+    def consume(self, amount):
+        """Take amount tokens, sleeping off any shortfall (which other callers then queue behind)"""
+        with self._lock:
+            if not self.rate:
+                return
+            self._refill()
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class ResourceGovernor:
+    """Bandwidth shares and merge slots for the jobs running in this worker
+
+    bandwidth_limit is in bytes per second (None: unlimited).
+    """
+
+    def __init__(self, bandwidth_limit=None, max_merges=2):
+        self.bandwidth_limit = bandwidth_limit or None
+        self.max_merges = max(1, max_merges)
+        self._transfers = {}  # (job_id, stream) -> {'priority', 'rate', 'rate_file'}
+        self._merging = {}  # job_id -> priority
+        self._merge_queue = []  # (rank, ticket, job_id, priority) waiting for a slot
+        self._tickets = count()
+        self._lock = threading.Condition()
+        self.merges_waited = 0
+
+    def start_transfers(self, job_id, streams, priority, rate_dir=None, fixed=()):
+        """Register a job's concurrent transfers; returns {stream: (rate, rate_file)}
+
+        rate is the transfer's share right now in bytes per second (None when unlimited). If
+        rate_dir is given, each transfer not listed in fixed also gets a file there that
+        always holds its current share, for fetchers that can follow changes (segmented.py
+        --rate-file). Transfers without one keep their starting rate until they finish.
+        Call release(job_id) when the job ends.
+        """
+        with self._lock:
+            for stream in streams:
+                rate_file = os.path.join(rate_dir, f"{job_id}_{stream}.rate") if rate_dir and stream not in fixed else None
+                self._transfers[(job_id, stream)] = {'priority': priority, 'rate': None, 'rate_file': rate_file}
+            self._rebalance()
+            return {stream: (self._transfers[(job_id, stream)]['rate'], self._transfers[(job_id, stream)]['rate_file'])
+                    for stream in streams}
+
+    def finish_transfer(self, job_id, stream):
+        """Hand a finished transfer's share to the job's other transfers and everyone else's"""
+        with self._lock:
+            transfer = self._transfers.get((job_id, stream))
+            if transfer and not transfer.get('done'):
+                transfer['done'] = True
+                self._rebalance()
+
+    def release(self, job_id):
+        """Drop all of a job's transfers, removing their rate files"""
+        with self._lock:
+            for key in [key for key in self._transfers if key[0] == job_id]:
+                transfer = self._transfers.pop(key)
+                if transfer['rate_file']:
+                    remove_quietly(transfer['rate_file'])
+            self._rebalance()
+
+    @contextmanager
+    def merge_slot(self, job_id, priority, is_cancelled=None):
+        """Hold one of max_merges merge slots; yields False if the job was cancelled while waiting
+
+        Waiting jobs get slots in priority-class order, first come first served within a class.
+        """
+        granted = self._acquire_merge(job_id, priority, is_cancelled)
+        try:
+            yield granted
+        finally:
+            if granted:
+                with self._lock:
+                    del self._merging[job_id]
+                    self._lock.notify_all()
+
+    def _acquire_merge(self, job_id, priority, is_cancelled):
+        entry = (priority_rank(priority), next(self._tickets), job_id, priority)
+        with self._lock:
+            self._merge_queue.append(entry)
+            self._merge_queue.sort()
+            waited = False
+            try:
+                while len(self._merging) >= self.max_merges or self._merge_queue[0] is not entry:
+                    if is_cancelled and is_cancelled():
+                        return False
+                    if not waited:
+                        waited = True
+                        self.merges_waited += 1
+                        log.info("Waiting for a merge slot", extra={'job': job_id, 'merging': len(self._merging)})
+                    self._lock.wait(MERGE_WAIT_POLL)
+                self._merging[job_id] = priority
+                return True
+            finally:
+                self._merge_queue.remove(entry)
+                self._lock.notify_all()
+
+    def _rebalance(self):
+        """Split the bandwidth limit across active transfers and rewrite their rate files
+
+        Fixed transfers (no rate file) that already have a rate keep it. A new one gets at
+        most its weighted share of everything, and the adjustable ones split the rest.
+        """
+        streams_per_job, weights = {}, {}
+        for (job_id, _), transfer in self._transfers.items():
+            if not transfer.get('done'):
+                streams_per_job[job_id] = streams_per_job.get(job_id, 0) + 1
+                weights[job_id] = PRIORITY_WEIGHTS.get(transfer['priority'], 1)
+
+        def weight(job_id):
+            return weights[job_id] / streams_per_job[job_id]
+
+        rates = {}
+        if self.bandwidth_limit:
+            active = [(key, transfer) for key, transfer in self._transfers.items() if not transfer.get('done')]
+            total_weight = sum(weights.values())
+            available = self.bandwidth_limit - sum(transfer['rate'] for _, transfer in active
+                                                   if not transfer['rate_file'] and transfer['rate'])
+            sharing = [(key, transfer) for key, transfer in active if transfer['rate_file'] or not transfer['rate']]
+            sharing_weight = sum(weight(job_id) for (job_id, _), _ in sharing)
+            for key, transfer in sharing:
+                if not transfer['rate_file']:
+                    fair = self.bandwidth_limit * weight(key[0]) / total_weight
+                    rates[key] = max(MIN_RATE, int(min(fair, max(available, 0) * weight(key[0]) / sharing_weight)))
+            available -= sum(rates.values())
+            adjustable_weight = sum(weight(job_id) for (job_id, _), transfer in sharing if transfer['rate_file'])
+            for key, transfer in sharing:
+                if transfer['rate_file']:
+                    rates[key] = max(MIN_RATE, int(max(available, 0) * weight(key[0]) / adjustable_weight))
+
+        for key, transfer in self._transfers.items():
+            if not self.bandwidth_limit or transfer.get('done'):
+                rate = None
+            else:
+                rate = rates.get(key, transfer['rate'])
+            if rate == transfer['rate'] and transfer.get('written'):
+                continue
+            transfer['rate'] = rate
+            if transfer['rate_file'] and not transfer.get('done'):
+                try:
+                    write_rate_file(transfer['rate_file'], rate)
+                    transfer['written'] = True
+                except OSError:
+                    log.warning("Could not write rate file", extra={'path': transfer['rate_file']})
+
+    def allocations(self):
+        """Current bandwidth shares and merge slots, for the allocations API"""
+        with self._lock:
+            transfers = [{'job_id': job_id, 'stream': stream, 'priority': transfer['priority'],
+                          'rate': transfer['rate'], 'adjustable': bool(transfer['rate_file'])}
+                         for (job_id, stream), transfer in self._transfers.items() if not transfer.get('done')]
+            return {
+                'bandwidth': {'limit': self.bandwidth_limit, 'transfers': transfers},
+                'merges': {
+                    'limit': self.max_merges,
+                    'running': [{'job_id': job_id, 'priority': priority} for job_id, priority in self._merging.items()],
+                    'waiting': [{'job_id': job_id, 'priority': priority} for _, _, job_id, priority in self._merge_queue],
+                },
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'bandwidth_limit': self.bandwidth_limit,
+                'transfers': sum(1 for transfer in self._transfers.values() if not transfer.get('done')),
+                'max_merges': self.max_merges,
+                'merging': len(self._merging),
+                'merges_waiting': len(self._merge_queue),
+                'merges_waited': self.merges_waited,
+            }
+
+
+def write_rate_file(path, rate):
+    """Atomically replace a rate file's contents (bytes per second, 0 for unlimited)"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(str(rate or 0))
+    os.replace(temp_path, path)
+
+
+def read_rate_file(path):
+    """Rate in a rate file, or None when it is unlimited, missing or unreadable"""
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0) or None
+    except (OSError, ValueError):
+        return None
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_governor():
+    """Governor configured from YTDL_BANDWIDTH_LIMIT_MB and YTDL_MAX_CONCURRENT_MERGES"""
+    limit_mb = float(os.environ.get('YTDL_BANDWIDTH_LIMIT_MB', 0))
+    # Stream-copy merges are cheap but the AAC fallback transcodes; leave half the cores for requests
+    default_merges = max(1, (os.cpu_count() or 2) // 2)
+    return ResourceGovernor(
+        bandwidth_limit=int(limit_mb * 1024 * 1024) or None,
+        max_merges=int(os.environ.get('YTDL_MAX_CONCURRENT_MERGES', default_merges)),
+    )
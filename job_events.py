@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Per-job change notifications
+Every job has a version number that increases on each update; waiters block on the
+job's condition until the version moves past the one they have already seen. Under a
+threaded server each waiter parks a request thread, so WaiterLimiter caps how many may.
+"""
+
+import threading
+
+
+class JobNotifier:
+    """Version counters plus a condition variable per job"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> [version, threading.Condition]
+
+    def _entry(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                entry = self._jobs[job_id] = [0, threading.Condition()]
+            return entry
+
+    def notify(self, job_id):
+        """Bump the job's version and wake everyone waiting on it"""
+        entry = self._entry(job_id)
+        with entry[1]:
+            entry[0] += 1
+            entry[1].notify_all()
+
+    def version(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            return entry[0] if entry else 0
+
+    def wait(self, job_id, since, timeout):
+        """Block until the job's version is greater than `since` (or timeout); returns the current version"""
+        entry = self._entry(job_id)
+        with entry[1]:
+            entry[1].wait_for(lambda: entry[0] > since, timeout=timeout)
+            return entry[0]
+
+    def discard(self, job_id):
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+        if entry:
+            with entry[1]:
+                entry[1].notify_all()
+
+
+class WaiterLimiter:
+    """Caps the request threads parked waiting for job changes (SSE streams and long-polls)
+
+    Over the cap, callers are expected to answer right away instead (503 for a stream, an
+    immediate response for a long-poll), so the rest of the app keeps a free thread.
+    """
+
+    def __init__(self, max_waiters=8):
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self.waiting >= self.max_waiters:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'waiting': self.waiting, 'max_waiters': self.max_waiters, 'rejected': self.rejected}
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Job state store for download progress and status
+The memory backend serves a single worker; the SQLite backend (WAL mode) is shared by
+every gunicorn worker on the host so any of them can answer progress requests.
+Unfinished jobs also keep a spec (what to run) under a renewable lease, so jobs whose
+worker died can be claimed and resumed by another one (see recovery.py)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from job_events import JobNotifier
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+# How often a waiter re-reads SQLite for updates made by other worker processes
+SQLITE_POLL_INTERVAL = 0.25
+
+
+class MemoryJobStore:
+    """Per-process job records with versioned change notification"""
+
+    def __init__(self, finished_ttl=3600):
+        self.finished_ttl = finished_ttl
+        self._jobs = {}  # job_id -> (progress, status, updated)
+        self._specs = {}  # job_id -> {'spec', 'owner', 'heartbeat', 'attempts'}
+        self._cancels = set()  # flagged jobs without a spec (batches)
+        self._lock = threading.Lock()
+        self._events = JobNotifier()
+        self._last_purge = time.time()
+
+    def update(self, job_id, status, progress=None):
+        """Replace a job's status (and progress if given), bumping its version"""
+        now = time.time()
+        with self._lock:
+            if progress is None:
+                progress = self._jobs[job_id][0] if job_id in self._jobs else 0
+            self._jobs[job_id] = (progress, status, now)
+        self._events.notify(job_id)
+        self._maybe_purge(now)
+
+    def get(self, job_id):
+        """Return {'progress', 'status', 'version'} or None for an unknown job"""
+        with self._lock:
+            record = self._jobs.get(job_id)
+        if record is None:
+            return None
+        return {'progress': record[0], 'status': record[1], 'version': self._events.version(job_id)}
+
+    def version(self, job_id):
+        return self._events.version(job_id)
+
+    def wait(self, job_id, since, timeout):
+        """Block until the job's version passes `since` or the timeout expires; returns the version"""
+        return self._events.wait(job_id, since, timeout)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        self._events.discard(job_id)
+
+    def purge_expired(self):
+        """Drop finished jobs older than the TTL"""
+        cutoff = time.time() - self.finished_ttl
+        with self._lock:
+            expired = [job_id for job_id, (_, status, updated) in self._jobs.items()
+                       if updated < cutoff and status.get('status') in FINISHED_STATUSES]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            self._events.discard(job_id)
+        return len(expired)
+
+    def save_spec(self, job_id, spec, owner):
+        """Remember what a job needs to run again until drop_spec is called"""
+        with self._lock:
+            self._specs[job_id] = {'spec': spec, 'owner': owner, 'heartbeat': time.time(), 'attempts': 1}
+
+    def drop_spec(self, job_id):
+        with self._lock:
+            self._specs.pop(job_id, None)
+            self._cancels.discard(job_id)
+
+    def request_cancel(self, job_id, without_spec=False):
+        """Flag an unfinished job for cancellation; returns False if it has no spec (finished or unknown)
+
+        without_spec flags it regardless, for jobs that never have a spec (batches); drop_spec
+        clears the flag.
+        """
+        with self._lock:
+            if job_id not in self._specs:
+                if without_spec:
+                    self._cancels.add(job_id)
+                return without_spec
+            self._specs[job_id]['cancelled'] = True
+            return True
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancels or self._specs.get(job_id, {}).get('cancelled', False)
+
+    def renew_specs(self, owner):
+        """Extend the lease on every job the owner holds"""
+        now = time.time()
+        with self._lock:
+            for record in self._specs.values():
+                if record['owner'] == owner:
+                    record['heartbeat'] = now
+
+    def release_spec(self, job_id):
+        """Give up a job's lease so another owner can claim it right away"""
+        with self._lock:
+            if job_id in self._specs:
+                self._specs[job_id]['heartbeat'] = 0
+
+    def claim_orphaned_specs(self, owner, lease, limit):
+        """Take over up to `limit` jobs whose lease expired; returns [(job_id, spec, attempts)]"""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for job_id, record in self._specs.items():
+                if len(claimed) >= limit:
+                    break
+                if record['heartbeat'] < now - lease:
+                    record.update(owner=owner, heartbeat=now, attempts=record['attempts'] + 1)
+                    claimed.append((job_id, record['spec'], record['attempts']))
+        return claimed
+
+    def _maybe_purge(self, now):
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self.purge_expired()
+
+
+class SQLiteJobStore:
+    """Job records in a WAL-mode SQLite file shared across worker processes"""
+
+    def __init__(self, path, finished_ttl=3600):
+        self.path = path
+        self.finished_ttl = finished_ttl
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._last_purge = time.time()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, progress INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 1, updated REAL NOT NULL, finished INTEGER NOT NULL DEFAULT 0)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (finished, updated)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS job_specs ("
+            "id TEXT PRIMARY KEY, spec TEXT NOT NULL, owner TEXT NOT NULL, "
+            "heartbeat REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 1)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS job_cancels (id TEXT PRIMARY KEY, requested REAL NOT NULL)")
+        db.commit()
+
+    def _db(self):
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def update(self, job_id, status, progress=None):
+        """Atomically replace a job's status (and progress if given), bumping its version"""
+        now = time.time()
+        finished = int(status.get('status') in FINISHED_STATUSES)
+        self._db().execute(
+            "INSERT INTO jobs (id, progress, status, version, updated, finished) VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET progress = COALESCE(?, progress), status = excluded.status, "
+            "version = version + 1, updated = excluded.updated, finished = excluded.finished",
+            (job_id, progress or 0, json.dumps(status, separators=(',', ':')), now, finished, progress),
+        )
+        with self._changed:
+            self._changed.notify_all()
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self.purge_expired()
+
+    def get(self, job_id):
+        row = self._db().execute("SELECT progress, status, version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'progress': row[0], 'status': json.loads(row[1]), 'version': row[2]}
+
+    def version(self, job_id):
+        row = self._db().execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else 0
+
+    def wait(self, job_id, since, timeout):
+        """Block until the job's version passes `since` or the timeout expires; returns the version
+
+        Updates from this process wake waiters immediately, other processes' updates are seen
+        within SQLITE_POLL_INTERVAL
+        """
+        deadline = time.time() + timeout
+        while True:
+            version = self.version(job_id)
+            remaining = deadline - time.time()
+            if version > since or remaining <= 0:
+                return version
+            with self._changed:
+                self._changed.wait(min(SQLITE_POLL_INTERVAL, remaining))
+
+    def delete(self, job_id):
+        self._db().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def save_spec(self, job_id, spec, owner):
+        """Remember what a job needs to run again until drop_spec is called"""
+        self._db().execute(
+            "INSERT OR REPLACE INTO job_specs (id, spec, owner, heartbeat, attempts) VALUES (?, ?, ?, ?, 1)",
+            (job_id, json.dumps(spec, separators=(',', ':')), owner, time.time()),
+        )
+
+    def drop_spec(self, job_id):
+        db = self._db()
+        db.execute("DELETE FROM job_specs WHERE id = ?", (job_id,))
+        db.execute("DELETE FROM job_cancels WHERE id = ?", (job_id,))
+
+    def request_cancel(self, job_id, without_spec=False):
+        """Flag an unfinished job for cancellation; returns False if it has no spec (finished or unknown)
+
+        Whichever worker runs the job sees the flag through cancel_requested. without_spec
+        flags it regardless, for jobs that never have a spec (batches); drop_spec clears the flag.
+        """
+        if without_spec:
+            self._db().execute("INSERT OR IGNORE INTO job_cancels (id, requested) VALUES (?, ?)", (job_id, time.time()))
+            return True
+        cursor = self._db().execute(
+            "INSERT OR IGNORE INTO job_cancels (id, requested) SELECT id, ? FROM job_specs WHERE id = ?",
+            (time.time(), job_id),
+        )
+        return cursor.rowcount == 1 or self.cancel_requested(job_id)
+
+    def cancel_requested(self, job_id):
+        return self._db().execute("SELECT 1 FROM job_cancels WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def renew_specs(self, owner):
+        """Extend the lease on every job the owner holds"""
+        self._db().execute("UPDATE job_specs SET heartbeat = ? WHERE owner = ?", (time.time(), owner))
+
+    def release_spec(self, job_id):
+        """Give up a job's lease so another owner can claim it right away"""
+        self._db().execute("UPDATE job_specs SET heartbeat = 0 WHERE id = ?", (job_id,))
+
+    def claim_orphaned_specs(self, owner, lease, limit):
+        """Take over up to `limit` jobs whose lease expired; returns [(job_id, spec, attempts)]
+
+        Each claim is a compare-and-swap on the previous owner and heartbeat, so when several
+        workers look at the same orphan only one of them gets it
+        """
+        db = self._db()
+        now = time.time()
+        rows = db.execute(
+            "SELECT id, spec, owner, heartbeat, attempts FROM job_specs WHERE heartbeat < ? ORDER BY heartbeat LIMIT ?",
+            (now - lease, limit),
+        ).fetchall()
+        claimed = []
+        for job_id, spec, old_owner, heartbeat, attempts in rows:
+            cursor = db.execute(
+                "UPDATE job_specs SET owner = ?, heartbeat = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND owner = ? AND heartbeat = ?",
+                (owner, now, job_id, old_owner, heartbeat),
+            )
+            if cursor.rowcount == 1:
+                claimed.append((job_id, json.loads(spec), attempts + 1))
+        return claimed
+
+    def purge_expired(self):
+        cursor = self._db().execute("DELETE FROM jobs WHERE finished = 1 AND updated < ?",
+                                    (time.time() - self.finished_ttl,))
+        return cursor.rowcount
+
+
+def create_job_store():
+    """Create the store configured by YTDL_JOB_DB (SQLite path, memory if unset) and YTDL_JOB_TTL"""
+    finished_ttl = int(os.environ.get('YTDL_JOB_TTL', 3600))
+    db_path = os.environ.get('YTDL_JOB_DB')
+    if db_path:
+        return SQLiteJobStore(db_path, finished_ttl=finished_ttl)
+    return MemoryJobStore(finished_ttl=finished_ttl)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Leveled, structured logging
+Modules log through get_logger(name) and pass their fields as `extra=`; records are rendered
+as logfmt (key=value) or JSON lines. Messages below YTDL_LOG_LEVEL are dropped before any
+formatting happens, so debug output (commands, FFmpeg stderr) costs nothing when it's off.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT_LOGGER = 'ytdl'
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def _logfmt_value(value):
+    text = str(value)
+    if not text or any(char in text for char in ' "=\n\t'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    return text
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: logfmt by default, JSON when json_lines is set"""
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            fields['exc'] = self.formatException(record.exc_info)
+        if self.json_lines:
+            return json.dumps(fields, default=str)
+        return ' '.join(f"{key}={_logfmt_value(value)}" for key, value in fields.items())
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def configure_logging(level=None, log_format=None, stream=None):
+    """Send the app's logs to stderr at YTDL_LOG_LEVEL (default INFO) in YTDL_LOG_FORMAT (logfmt or json)"""
+    level = (level or os.environ.get('YTDL_LOG_LEVEL') or 'INFO').upper()
+    log_format = (log_format or os.environ.get('YTDL_LOG_FORMAT') or 'logfmt').lower()
+    logger = logging.getLogger(ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(json_lines=log_format == 'json'))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    # Don't repeat our lines through whatever the server configured on the root logger
+    logger.propagate = False
+    return logger
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Metadata cache for extracted video info
+In-memory LRU with a TTL, optionally backed by SQLite so entries survive worker restarts
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Keys that are large and never used by the app or by `yt-dlp --load-info-json`
+HEAVY_KEYS = (
+    'automatic_captions', 'subtitles', 'thumbnails', 'heatmap',
+    'requested_formats', 'requested_downloads', 'requested_subtitles',
+)
+
+
+def trim_info(info):
+    """Drop the bulky parts of a yt-dlp info dict before caching it"""
+    return {key: value for key, value in info.items() if key not in HEAVY_KEYS}
+
+
+class MetadataCache:
+    """Size-bounded LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, ttl=900, max_entries=256, db_path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "key TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """Return the cached info for a key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, info = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return info
+                del self._entries[key]
+
+            info = self._load(key, now)
+            if info is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return info
+
+    def set(self, key, info):
+        """Store info for a key, evicting the least recently used entries past the limit"""
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires, info)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO metadata (key, expires, accessed, data) VALUES (?, ?, ?, ?)",
+                    (key, expires, time.time(), json.dumps(info)),
+                )
+                self._prune_db()
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'persistent': self._db is not None,
+            }
+
+    def _remember(self, key, expires, info):
+        self._entries[key] = (expires, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key, now):
+        """Read through to the on-disk backend and promote the entry into memory"""
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT expires, data FROM metadata WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        expires, data = row
+        if expires <= now:
+            self._db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE metadata SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        info = json.loads(data)
+        self._remember(key, expires, info)
+        return info
+
+    def _prune_db(self):
+        self._db.execute("DELETE FROM metadata WHERE expires <= ?", (time.time(),))
+        self._db.execute(
+            "DELETE FROM metadata WHERE key NOT IN (SELECT key FROM metadata ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+
+def create_metadata_cache():
+    """Create the cache configured by YTDL_METADATA_TTL, YTDL_METADATA_CACHE_SIZE and YTDL_METADATA_DB"""
+    return MetadataCache(
+        ttl=int(os.environ.get('YTDL_METADATA_TTL', 900)),
+        max_entries=int(os.environ.get('YTDL_METADATA_CACHE_SIZE', 256)),
+        db_path=os.environ.get('YTDL_METADATA_DB') or None,
+    )
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics
+A small in-process registry of counters, gauges and histograms rendered in the Prometheus
+text format by /metrics. Pipeline stages (extraction, stream fetches, merge, cleanup) are
+timed with `stage()`, which also counts their failures. Each worker process keeps its own
+registry, so scrape every worker (or run one worker per scrape target).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; downloads and merges run from under a second to many minutes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Optional callable returning {label values tuple: value}, read at scrape time
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        if self.collect:
+            return sorted(self.collect().items())
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames, key, [('le', _number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A broken collector shouldn't take the whole scrape down
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'ytdl_stage_duration_seconds', 'Time spent in each download pipeline stage', ['stage']))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    'ytdl_stage_errors_total', 'Failed pipeline stages', ['stage']))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    'ytdl_downloaded_bytes_total', 'Bytes fetched from YouTube by download jobs', ['stream']))
+SUBPROCESS_SPAWNS = REGISTRY.register(Counter(
+    'ytdl_subprocess_spawns_total', 'External processes started', ['program']))
+DOWNLOADS = REGISTRY.register(Counter(
+    'ytdl_downloads_total', 'Finished download jobs by outcome', ['result']))
+PROCESS_KILLS = REGISTRY.register(Counter(
+    'ytdl_process_kills_total', 'Supervised processes killed before exiting on their own', ['program', 'reason']))
+
+
+class Stage:
+    """Handle for a running stage; call fail() when it ends badly without raising"""
+
+    def __init__(self, name):
+        self.name = name
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into ytdl_stage_duration_seconds, counting it as an error if it raises or fails"""
+    handle = Stage(name)
+    started = time.perf_counter()
+    try:
+        yield handle
+    except Exception:
+        handle.failed = True
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+        if handle.failed:
+            STAGE_ERRORS.inc(stage=name)
+
+
+def count_spawn(program):
+    SUBPROCESS_SPAWNS.inc(program=program)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of finished downloads
+Entries are keyed by (video ID, format, merge mode) and live in <root>/<key>/<filename>.
+Identical requests that arrive while a download is running attach to that job instead
+of starting another one (single-flight).
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+# Entries used this recently are never evicted, so a path just returned by lookup() or store()
+# still exists when the response opens it
+EVICT_GRACE = 30
+
+
+class OutputCache:
+    """Finished files on disk, evicted by age and total size"""
+
+    def __init__(self, root, max_bytes=5 * 1024 ** 3, max_age=86400):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.total_bytes = 0  # as of the last evict(), which every store() runs
+        self._in_flight = {}  # key -> job_id
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(video_id, format_id, merge_mode):
+        return hashlib.sha256(f"{video_id}\0{format_id}\0{merge_mode}".encode()).hexdigest()[:32]
+
+    def lookup(self, key):
+        """Return (file_path, filename) for a cached entry, or None"""
+        entry_dir = os.path.join(self.root, key)
+        # Under the lock so evict() can't remove the entry between the check and the touch
+        with self._lock:
+            try:
+                filename = next(name for name in os.listdir(entry_dir) if not name.startswith('.'))
+                expired = time.time() - os.path.getmtime(entry_dir) > self.max_age
+                if not expired:
+                    # Directory mtime doubles as the entry's last-used time for LRU eviction
+                    os.utime(entry_dir)
+            except (FileNotFoundError, StopIteration):
+                self.misses += 1
+                return None
+            if expired:
+                self._remove(entry_dir)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return os.path.join(entry_dir, filename), filename
+
+    def store(self, key, file_path, filename):
+        """Move a finished file into the cache and return its new path
+
+        Files larger than the whole quota are left where they are.
+        """
+        if os.path.getsize(file_path) > self.max_bytes:
+            return file_path
+        entry_dir = os.path.join(self.root, key)
+        with self._lock:
+            os.makedirs(entry_dir, exist_ok=True)
+        cached_path = os.path.join(entry_dir, filename)
+        shutil.move(file_path, cached_path)
+        os.utime(entry_dir)
+        self.evict()
+        return cached_path
+
+    def begin(self, key, job_id):
+        """Register job_id as the download for key; returns the job already running it, if any"""
+        with self._lock:
+            existing = self._in_flight.get(key)
+            if existing is not None:
+                self.coalesced += 1
+                return existing
+            self._in_flight[key] = job_id
+            return None
+
+    def finish(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def evict(self, max_bytes=None):
+        """Remove expired entries, then least recently used ones until under the size quota
+
+        max_bytes overrides the quota for this pass (the storage manager uses it to make room);
+        returns the bytes left in the cache. Entries used in the last EVICT_GRACE seconds are kept.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        now = time.time()
+        for key in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, key)
+            try:
+                used = os.path.getmtime(entry_dir)
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+            except OSError:
+                continue
+            if now - used > self.max_age and self._remove_idle(entry_dir):
+                continue
+            entries.append((used, size, entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for used, size, entry_dir in sorted(entries):
+            if total <= max_bytes:
+                break
+            if self._remove_idle(entry_dir):
+                total -= size
+        self.total_bytes = total
+        return total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'in_flight': len(self._in_flight),
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remove_idle(self, entry_dir):
+        """Remove an entry unless a lookup or store used it within EVICT_GRACE seconds"""
+        with self._lock:
+            try:
+                if time.time() - os.path.getmtime(entry_dir) < EVICT_GRACE:
+                    return False
+            except OSError:
+                return True
+            self._remove(entry_dir)
+            return True
+
+    def _remove(self, entry_dir):
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def create_output_cache(download_path):
+    """Create the cache configured by YTDL_OUTPUT_CACHE_DIR, YTDL_OUTPUT_CACHE_MAX_MB and YTDL_OUTPUT_CACHE_MAX_AGE"""
+    return OutputCache(
+        root=os.environ.get('YTDL_OUTPUT_CACHE_DIR') or os.path.join(download_path, 'ytdl-cache'),
+        max_bytes=int(os.environ.get('YTDL_OUTPUT_CACHE_MAX_MB', 5120)) * 1024 * 1024,
+        max_age=int(os.environ.get('YTDL_OUTPUT_CACHE_MAX_AGE', 86400)),
+    )
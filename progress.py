@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Structured download progress
+yt-dlp prints one machine-readable line per progress update (via --progress-template),
+which is parsed into bytes/speed/ETA per stream and aggregated into one job percentage
+"""
+
+import threading
+
+PROGRESS_PREFIX = "[progress] "
+
+# yt-dlp renders missing values as NA
+PROGRESS_TEMPLATE = (
+    "download:" + PROGRESS_PREFIX +
+    "%(progress.downloaded_bytes)s %(progress.total_bytes)s %(progress.total_bytes_estimate)s "
+    "%(progress.speed)s %(progress.eta)s"
+)
+
+# Arguments that make yt-dlp emit the lines parse_progress_line understands
+PROGRESS_ARGS = ["--newline", "--progress-template", PROGRESS_TEMPLATE]
+
+# Share of the bar for the download phase; the rest covers post-processing and the merge
+DOWNLOAD_SHARE = 90
+
+
+def _number(value):
+    if value == "NA":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_progress_line(line):
+    """Parse a progress-template line into a dict, or return None for any other output"""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    fields = line[len(PROGRESS_PREFIX):].split()
+    if len(fields) != 5:
+        return None
+    downloaded, total, estimate, speed, eta = (_number(field) for field in fields)
+    return {
+        'downloaded_bytes': int(downloaded or 0),
+        'total_bytes': int(total or estimate or 0) or None,
+        'speed': speed,
+        'eta': int(eta) if eta is not None else None,
+    }
+
+
+class JobProgress:
+    """Per-stream byte counters for one job, aggregated into a single percentage"""
+
+    def __init__(self, streams):
+        self.streams = {name: {'downloaded_bytes': 0, 'total_bytes': None, 'speed': None, 'eta': None}
+                        for name in streams}
+        self.stage = 'downloading'
+        self._lock = threading.Lock()
+
+    def update(self, stream, values):
+        with self._lock:
+            self.streams[stream].update(values)
+
+    def set_stage(self, stage):
+        with self._lock:
+            self.stage = stage
+
+    def percent(self):
+        """Overall job percentage: bytes-weighted once every stream knows its size"""
+        with self._lock:
+            if self.stage == 'completed':
+                return 100
+            if self.stage != 'downloading':
+                return DOWNLOAD_SHARE
+
+            streams = list(self.streams.values())
+            if all(s['total_bytes'] for s in streams):
+                done = sum(min(s['downloaded_bytes'], s['total_bytes']) for s in streams)
+                fraction = done / sum(s['total_bytes'] for s in streams)
+            else:
+                fraction = sum(min(s['downloaded_bytes'] / s['total_bytes'], 1) if s['total_bytes'] else 0
+                               for s in streams) / len(streams)
+            return int(fraction * DOWNLOAD_SHARE)
+
+    def snapshot(self):
+        """Copy of the per-stream counters plus totals, for the progress API"""
+        with self._lock:
+            streams = {name: dict(values) for name, values in self.streams.items()}
+            return {
+                'stage': self.stage,
+                'streams': streams,
+                'downloaded_bytes': sum(s['downloaded_bytes'] for s in streams.values()),
+                'total_bytes': sum(s['total_bytes'] or 0 for s in streams.values()) or None,
+                'speed': sum(s['speed'] or 0 for s in streams.values()) or None,
+                'eta': max((s['eta'] for s in streams.values() if s['eta'] is not None), default=None),
+            }
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Quality options offered for a video
+One pass over yt-dlp's format table keeps the best format for every (height, fps) pair,
+ranked by configurable criteria, plus the best audio-only format
+"""
+
+import operator
+import os
+from dataclasses import dataclass
+
+# Most compatible first (matches FORMAT_SORT's codec:h264 preference)
+CODEC_PREFERENCE = ('avc1', 'h264', 'vp09', 'vp9', 'av01')
+
+# Applied in order; each one only breaks ties left by the previous ones
+DEFAULT_CRITERIA = ('combined', 'codec', 'size')
+
+
+@dataclass(slots=True)
+class QualityOption:
+    format_id: str
+    height: int
+    fps: int
+    size_mb: float
+    display: str
+    is_combined: bool
+    vcodec: str
+    acodec: str
+
+    def to_dict(self):
+        return {
+            'format_id': self.format_id,
+            'height': self.height,
+            'fps': self.fps,
+            'size_mb': self.size_mb,
+            'display': self.display,
+            'is_combined': self.is_combined,
+            'vcodec': self.vcodec,
+            'acodec': self.acodec,
+        }
+
+
+_CODEC_RANK = {codec: -index for index, codec in enumerate(CODEC_PREFERENCE)}
+_UNKNOWN_CODEC = -len(CODEC_PREFERENCE)
+
+# Criterion name -> position in the tuple _features builds; bigger values are better
+CRITERIA = {'combined': 0, 'codec': 1, 'size': 2, 'bitrate': 3}
+
+
+def _size(fmt):
+    return fmt.get('filesize') or fmt.get('filesize_approx')
+
+
+def _features(fmt):
+    """Every ranking criterion of a video format, computed in one call"""
+    acodec = fmt.get('acodec')
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    return (
+        acodec is not None and acodec != 'none',
+        _CODEC_RANK.get(fmt['vcodec'].partition('.')[0], _UNKNOWN_CODEC),
+        -size if size else float('-inf'),
+        fmt.get('tbr') or 0,
+    )
+
+
+def make_ranker(criteria=DEFAULT_CRITERIA):
+    """Build a key function for the given criterion names (raises ValueError for unknown ones)"""
+    unknown = [name for name in criteria if name not in CRITERIA]
+    if unknown:
+        raise ValueError(f"Unknown quality criteria: {', '.join(unknown)} (choose from {', '.join(CRITERIA)})")
+    if not criteria:
+        return lambda fmt: ()
+    pick = operator.itemgetter(*(CRITERIA[name] for name in criteria))
+    return lambda fmt: pick(_features(fmt))
+
+
+def _size_mb(fmt):
+    size = _size(fmt)
+    return round(size / (1024 * 1024), 1) if size else 0
+
+
+def select_quality_options(formats, rank=None):
+    """Best format per (height, fps), highest first, followed by the best audio-only format"""
+    rank = rank or make_ranker()
+    best = {}  # (height, fps) -> [rank or None until needed, format]
+    best_audio = None
+    best_abr = -1
+    for fmt in formats:
+        vcodec = fmt.get('vcodec')
+        if not vcodec or vcodec == 'none':
+            acodec = fmt.get('acodec')
+            if acodec and acodec != 'none' and (fmt.get('abr') or 0) > best_abr:
+                best_audio, best_abr = fmt, fmt.get('abr') or 0
+            continue
+        key = (int(fmt.get('height') or 0), int(fmt.get('fps') or 0))
+        current = best.get(key)
+        if current is None:
+            # Ranks are only computed once a second format competes for the same slot
+            best[key] = [None, fmt]
+            continue
+        if current[0] is None:
+            current[0] = rank(current[1])
+        fmt_rank = rank(fmt)
+        if fmt_rank > current[0]:
+            current[0], current[1] = fmt_rank, fmt
+
+    options = []
+    for (height, fps), (_, fmt) in sorted(best.items(), reverse=True):
+        if height:
+            display = f"{height}p@{fps}fps" if fps else f"{height}p"
+        else:
+            display = "Unknown quality"
+        options.append(QualityOption(
+            format_id=fmt.get('format_id', ''),
+            height=height,
+            fps=fps,
+            size_mb=_size_mb(fmt),
+            display=display,
+            is_combined=(fmt.get('acodec') or 'none') != 'none',
+            vcodec=fmt.get('vcodec'),
+            acodec=fmt.get('acodec') or 'none',
+        ))
+
+    if best_audio is not None:
+        options.append(QualityOption(
+            format_id=best_audio.get('format_id', ''),
+            height=0,
+            fps=0,
+            size_mb=_size_mb(best_audio),
+            display=f"Audio Only ({best_audio.get('abr', 0)}kbps)",
+            is_combined=False,
+            vcodec='none',
+            acodec=best_audio.get('acodec') or 'none',
+        ))
+    return options
+
+
+def is_audio_only(quality_format_id, formats=()):
+    """Whether a requested format means an audio-only download: '0' (best audio), or the ID of
+    a format without a video stream, like the option select_quality_options offers"""
+    format_id = str(quality_format_id)
+    if format_id == '0':
+        return True
+    fmt = next((fmt for fmt in formats if fmt.get('format_id') == format_id), None)
+    return fmt is not None and (fmt.get('vcodec') or 'none') == 'none' and (fmt.get('acodec') or 'none') != 'none'
+
+
+def ranker_from_env():
+    """Ranker for the comma-separated criteria in YTDL_QUALITY_CRITERIA"""
+    value = os.environ.get('YTDL_QUALITY_CRITERIA')
+    if not value:
+        return make_ranker()
+    return make_ranker(tuple(name.strip() for name in value.split(',') if name.strip()))
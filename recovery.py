@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Crash recovery for download jobs
+Every worker renews the lease on the jobs it owns; jobs whose lease runs out (their worker
+died or was restarted) are claimed by another worker and run again. Working files are named
+after the job ID, so yt-dlp picks up its .part files and skips finished streams. Processes
+the dead worker left running are stopped first (storage.JobLock), so no file has two writers.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+
+from logs import get_logger
+from scheduler import QueueFullError
+
+log = get_logger('recovery')
+
+
+def make_owner_id():
+    """Unique per process start, so a recycled PID never inherits a dead worker's jobs"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobRecovery:
+    """Lease keeper and orphan collector for one worker process"""
+
+    def __init__(self, job_store, resubmit, on_give_up=None, owner=None, lease=90, interval=30,
+                 max_attempts=3, claim_limit=None):
+        self.job_store = job_store
+        self.resubmit = resubmit  # (job_id, spec) -> None, may raise QueueFullError
+        self.on_give_up = on_give_up  # (job_id) -> None, for jobs that keep dying
+        self.owner = owner or make_owner_id()
+        self.lease = lease
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.claim_limit = claim_limit or (lambda: 5)
+        self.recovered = 0
+        self.abandoned = 0
+
+    def start(self):
+        threading.Thread(target=self._loop, name="job-recovery", daemon=True).start()
+
+    def run_once(self):
+        """Renew our own leases, then claim and resubmit orphaned jobs; returns the claimed IDs"""
+        self.job_store.renew_specs(self.owner)
+        limit = self.claim_limit()
+        if limit <= 0:
+            return []
+
+        claimed = []
+        for job_id, spec, attempts in self.job_store.claim_orphaned_specs(self.owner, self.lease, limit):
+            if attempts > self.max_attempts:
+                # The job took its worker down repeatedly; stop retrying it
+                self.job_store.drop_spec(job_id)
+                self.abandoned += 1
+                if self.on_give_up:
+                    self.on_give_up(job_id)
+                continue
+            try:
+                self.resubmit(job_id, spec)
+            except QueueFullError:
+                self.job_store.release_spec(job_id)
+                continue
+            log.info("Resuming interrupted job", extra={'job': job_id, 'attempt': attempts})
+            self.recovered += 1
+            claimed.append(job_id)
+        return claimed
+
+    def stats(self):
+        return {'owner': self.owner, 'recovered': self.recovered, 'abandoned': self.abandoned, 'lease': self.lease}
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Job recovery failed")
+            time.sleep(self.interval)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Bounded download job scheduler
+A fixed pool of worker threads pulls jobs from per-client FIFO queues in round-robin order,
+taking every job of a more urgent priority class before any of a less urgent one
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+from logs import get_logger
+
+log = get_logger('scheduler')
+
+
+class QueueFullError(Exception):
+    """The scheduler queue is at capacity"""
+
+
+class DownloadScheduler:
+    """Runs at most `max_workers` jobs at once and queues up to `max_queue` more
+
+    No client may have more than max_queue_per_client of those waiting, so one client can't
+    fill the queue and lock everyone else out.
+    """
+
+    def __init__(self, max_workers=2, max_queue=20, max_queue_per_client=None, on_queue_change=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client or max_queue
+        # Called with the queued job IDs in dispatch order whenever the queue changes. It runs
+        # under the scheduler lock, so a job can't start before its queued state is recorded
+        self.on_queue_change = on_queue_change
+        self._classes = {}  # priority -> OrderedDict of client_id -> deque of (job_id, fn, args)
+        self._queued = 0
+        self._queued_by_client = {}  # client_id -> jobs waiting, across priority classes
+        self._running = set()
+        self._cond = threading.Condition()
+
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker, name=f"download-worker-{i}", daemon=True)
+            worker.start()
+
+    def submit(self, client_id, job_id, fn, *args, priority=0):
+        """Queue a job for a client, raising QueueFullError when the queue (or the client's share) is full
+
+        Lower priority values are dispatched first.
+        """
+        with self._cond:
+            if self._queued >= self.max_queue:
+                raise QueueFullError(f"Download queue is full ({self.max_queue} jobs waiting)")
+            if self._queued_by_client.get(client_id, 0) >= self.max_queue_per_client:
+                raise QueueFullError(f"You already have {self.max_queue_per_client} downloads waiting")
+            queues = self._classes.setdefault(priority, OrderedDict())
+            queues.setdefault(client_id, deque()).append((job_id, fn, args))
+            self._queued += 1
+            self._queued_by_client[client_id] = self._queued_by_client.get(client_id, 0) + 1
+            self._queue_changed()
+            self._cond.notify()
+
+    def cancel(self, job_id):
+        """Remove a job that is still waiting; returns its (fn, args), or None if it already started"""
+        with self._cond:
+            for priority, queues in self._classes.items():
+                for client_id, jobs in queues.items():
+                    for job in jobs:
+                        if job[0] == job_id:
+                            jobs.remove(job)
+                            self._drop_empty(priority, client_id)
+                            self._dequeued(client_id)
+                            self._queue_changed()
+                            return job[1], job[2]
+        return None
+
+    def is_running(self, job_id):
+        with self._cond:
+            return job_id in self._running
+
+    def position(self, job_id):
+        """1-based position of a queued job in dispatch order, or None if it is not waiting"""
+        with self._cond:
+            for position, queued_id in enumerate(self._dispatch_order(), 1):
+                if queued_id == job_id:
+                    return position
+        return None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'running': len(self._running),
+                'queued': self._queued,
+                'max_queue': self.max_queue,
+                'max_queue_per_client': self.max_queue_per_client,
+                'queued_by_priority': {priority: sum(len(jobs) for jobs in queues.values())
+                                       for priority, queues in sorted(self._classes.items())},
+                'clients_waiting': len({client_id for queues in self._classes.values() for client_id in queues}),
+            }
+
+    def _queue_changed(self):
+        if self.on_queue_change and self._queued:
+            try:
+                self.on_queue_change(list(self._dispatch_order()))
+            except Exception:
+                log.exception("Queue change listener failed")
+
+    def _dispatch_order(self):
+        """Job IDs in the order workers will pick them up (by priority, then round-robin across clients)"""
+        for priority in sorted(self._classes):
+            pending = [list(jobs) for jobs in self._classes[priority].values()]
+            depth = 0
+            while pending:
+                for jobs in pending:
+                    yield jobs[depth][0]
+                depth += 1
+                pending = [jobs for jobs in pending if len(jobs) > depth]
+
+    def _next_job(self):
+        """Pop the most urgent class's next job, rotating its client to the back of that class's line"""
+        priority = min(self._classes)
+        queues = self._classes[priority]
+        client_id, jobs = next(iter(queues.items()))
+        job = jobs.popleft()
+        queues.move_to_end(client_id)
+        self._drop_empty(priority, client_id)
+        self._dequeued(client_id)
+        return job
+
+    def _dequeued(self, client_id):
+        self._queued -= 1
+        self._queued_by_client[client_id] -= 1
+        if not self._queued_by_client[client_id]:
+            del self._queued_by_client[client_id]
+
+    def _drop_empty(self, priority, client_id):
+        queues = self._classes[priority]
+        if not queues[client_id]:
+            del queues[client_id]
+            if not queues:
+                del self._classes[priority]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._classes:
+                    self._cond.wait()
+                job_id, fn, args = self._next_job()
+                self._running.add(job_id)
+                self._queue_changed()
+            try:
+                fn(*args)
+            except Exception:
+                log.exception("Job crashed", extra={'job': job_id})
+            finally:
+                with self._cond:
+                    self._running.discard(job_id)
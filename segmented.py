@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+"""
+Segmented HTTP fetch for one large stream
+YouTube throttles each connection, so a large video-only format is fetched as byte ranges
+over several keep-alive connections at once, each part written in place (pwrite) into a
+preallocated file. Connections are added one at a time while each addition still raises
+the total throughput, and a failed part is retried from where it stopped. All connections
+draw from one token bucket when the fetch is rate limited (--limit-rate, or a --rate-file the
+resource governor rewrites as other downloads come and go). Finished parts are listed in a
+small sidecar next to the temp file, so a rerun after the process died fetches only the rest.
+
+Run as `python segmented.py URL OUTPUT`; it prints yt-dlp style progress lines (see
+progress.py) so the download pipeline supervises and reports it like a yt-dlp fetch.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from governor import TokenBucket, read_rate_file
+from progress import PROGRESS_PREFIX
+
+SCRIPT = os.path.abspath(__file__)
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+READ_SIZE = 256 * 1024
+MIN_PART_SIZE = 1024 * 1024
+MAX_PART_SIZE = 32 * 1024 * 1024
+# Each connection gets roughly this many parts, so faster connections can take on more
+PARTS_PER_CONNECTION = 4
+# Throughput is compared over windows this long; a new connection must add GROWTH_GAIN
+GROWTH_WINDOW = 1.0
+GROWTH_GAIN = 0.15
+# Sidecar next to OUTPUT.part listing the byte ranges already written
+RANGES_SUFFIX = '.ranges'
+
+
+class SegmentError(Exception):
+    """A part could not be fetched"""
+
+
+class HTTPStatusError(SegmentError):
+    """The server answered with an error status"""
+
+    def __init__(self, status, reason):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+
+
+class PartialRead(SegmentError):
+    """A response body broke off; offset is the first byte not written"""
+
+    def __init__(self, offset, error):
+        super().__init__(str(error) or type(error).__name__)
+        self.offset = offset
+
+
+class ConnectionPool:
+    """Keep-alive connections to one origin, reused from part to part"""
+
+    def __init__(self, url, timeout=30):
+        parts = urllib.parse.urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.created = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def put(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class SegmentedFetcher:
+    """Downloads url to path over up to `connections` concurrent Range requests
+
+    on_progress(downloaded, total, speed) is called from fetch() about every interval
+    seconds while bytes are arriving. Servers that ignore Range get a single-connection
+    download. rate_limit caps the combined speed in bytes per second; a rate_file is
+    re-read every interval and overrides it.
+    """
+
+    def __init__(self, url, path, headers=None, connections=4, initial_connections=2, retries=3,
+                 timeout=30, max_bytes=None, on_progress=None, interval=0.5, rate_limit=None, rate_file=None):
+        parts = urllib.parse.urlsplit(url)
+        self.target = parts.path + (f"?{parts.query}" if parts.query else '')
+        self.headers = dict(headers or {})
+        self.path = path
+        self.max_connections = max(1, connections)
+        self.initial_connections = max(1, min(initial_connections, self.max_connections))
+        self.retries = retries
+        self.max_bytes = max_bytes
+        self.on_progress = on_progress
+        self.interval = interval
+        self.pool = ConnectionPool(url, timeout=timeout)
+        self.rate_file = rate_file
+        self.bucket = TokenBucket(read_rate_file(rate_file) if rate_file else rate_limit)
+        self.total = None
+        self.downloaded = 0
+        self.resumed = 0
+        self.retried = 0
+        self.peak_connections = 0
+        self._temp_path = f"{path}.part"
+        self._ranges_path = f"{path}.part{RANGES_SUFFIX}"
+        self._done = []  # merged (start, end) byte ranges already in the temp file
+        self._parts = []
+        self._workers = []
+        self._error = None
+        self._lock = threading.Lock()
+        self._fd = None
+        self._started = None
+
+    def fetch(self):
+        """Download the whole file; returns its size, raising SegmentError on failure
+
+        A finished file already at path is kept. A temp file left by an interrupted run is
+        reused, and only the ranges its sidecar doesn't list are requested.
+        """
+        self._started = time.monotonic()
+        if os.path.exists(self.path):
+            self.total = self.downloaded = self.resumed = os.path.getsize(self.path)
+            self._report(self._started, None)
+            return self.downloaded
+
+        state = self._load_ranges()
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        self._fd = os.open(self._temp_path, flags if state else flags | os.O_TRUNC, 0o644)
+        complete = False
+        try:
+            if state:
+                self._check_size(state[0])
+                self._done = state[1]
+                self.resumed = self.downloaded = sum(end - start + 1 for start, end in self._done)
+                missing = missing_ranges(self._done, self.total)
+            else:
+                missing = [(0, None)]
+            if missing:
+                self._fetch_missing(*missing[0])
+            if self._error:
+                raise self._error
+            if self.total is not None and self.downloaded != self.total:
+                raise SegmentError(f"Got {self.downloaded} of {self.total} bytes")
+            os.fsync(self._fd)
+            complete = True
+        finally:
+            os.close(self._fd)
+            self.pool.close()
+            if not complete:
+                self._remove(self._temp_path)
+            self._remove(self._ranges_path)
+        os.replace(self._temp_path, self.path)
+        return self.downloaded
+
+    def _fetch_missing(self, start, end):
+        """Fetch everything not yet written, probing with the first missing part
+
+        The probe tells us the size and whether ranges work. end is the last byte of the
+        first gap, or None when nothing is known about the file yet.
+        """
+        probe_end = start + MIN_PART_SIZE - 1 if end is None else min(start + MIN_PART_SIZE - 1, end)
+        connection, response = self._probe(start, probe_end)
+        if response.status == 200:
+            if self.resumed:
+                self._discard_resumed()
+            length = response.getheader('Content-Length')
+            if length:
+                self._check_size(int(length))
+            # No ranges: one connection reads the whole body
+            self._start_worker(lambda: self._read_whole(connection, response))
+            self._monitor(grow=False)
+            return
+
+        first_end = self._plan(response, start)
+        try:
+            offset = self._read_into(response, start)
+        except PartialRead as e:
+            offset = e.offset
+            with self._lock:
+                self.retried += 1
+        if offset <= first_end:
+            # Cut short: the rest of the first part goes to the workers, who retry
+            connection.close()
+            self._parts.append((offset, first_end))
+        else:
+            self.pool.put(connection)
+        self._mark_done(start, offset - 1)
+        for _ in range(min(self.initial_connections, len(self._parts))):
+            self._start_worker(self._part_worker)
+        self._monitor(grow=True)
+
+    def _probe(self, start, end):
+        """Request the first part, retrying like _fetch_part; returns (connection, response)"""
+        attempt = 0
+        while True:
+            connection = self.pool.get()
+            try:
+                return connection, self._request(connection, start, end)
+            except (OSError, http.client.HTTPException, SegmentError) as e:
+                connection.close()
+                attempt += 1
+                if not retryable(e):
+                    raise
+                if attempt > self.retries:
+                    raise SegmentError(f"First part failed after {attempt} attempts: {e}")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(backoff(attempt))
+
+    def _request(self, connection, start, end):
+        headers = {**self.headers, 'Range': f"bytes={start}-{'' if end is None else end}"}
+        connection.request('GET', self.target, headers=headers)
+        response = connection.getresponse()
+        if response.status not in (200, 206):
+            response.read()
+            raise HTTPStatusError(response.status, response.reason)
+        return response
+
+    def _check_size(self, total):
+        if self.max_bytes and total > self.max_bytes:
+            raise SegmentError(f"File is larger than the max-filesize ({total} > {self.max_bytes} bytes)")
+        self.total = total
+
+    def _plan(self, response, start):
+        """Size the file from the first part's Content-Range and queue the missing parts
+
+        Returns the first part's last byte
+        """
+        match = CONTENT_RANGE_PATTERN.match(response.getheader('Content-Range') or '')
+        if not match:
+            raise SegmentError("Server answered a Range request without a Content-Range")
+        if int(match.group(1)) != start:
+            raise SegmentError(f"Server sent bytes from {match.group(1)} when asked for {start}")
+        total = int(match.group(3))
+        if self.resumed and total != self.total:
+            # The file changed since the interrupted run; start over (the probe still fits)
+            self._discard_resumed()
+        self._check_size(total)
+        if os.fstat(self._fd).st_size > total:
+            os.ftruncate(self._fd, total)
+        preallocate(self._fd, total)
+
+        first_end = int(match.group(2))
+        missing = missing_ranges(merge_ranges(self._done + [(start, first_end)]), total)
+        remaining = sum(end - start + 1 for start, end in missing)
+        part_size = remaining // (self.max_connections * PARTS_PER_CONNECTION)
+        part_size = max(MIN_PART_SIZE, min(MAX_PART_SIZE, part_size))
+        for gap_start, gap_end in missing:
+            while gap_start <= gap_end:
+                end = min(gap_start + part_size - 1, gap_end)
+                self._parts.append((gap_start, end))
+                gap_start = end + 1
+        self._parts.reverse()  # pop() hands them out in file order
+        return first_end
+
+    def _discard_resumed(self):
+        """Forget what an interrupted run wrote; the temp file can't be trusted"""
+        os.ftruncate(self._fd, 0)
+        self._remove(self._ranges_path)
+        with self._lock:
+            self.downloaded -= self.resumed
+            self.resumed = 0
+            self._done = []
+        self.total = None
+
+    def _monitor(self, grow):
+        """Report progress until the workers finish, adding part workers while throughput keeps growing"""
+        level_started, level_bytes, best_rate = time.monotonic(), self.downloaded, None
+        growing = grow
+        last_reported = self.downloaded
+        while any(worker.is_alive() for worker in self._workers):
+            for worker in self._workers:
+                worker.join(self.interval / len(self._workers))
+            now = time.monotonic()
+            last_reported = self._report(now, last_reported)
+            if self.rate_file:
+                self.bucket.set_rate(read_rate_file(self.rate_file))
+
+            elapsed = now - level_started
+            if growing and elapsed >= GROWTH_WINDOW and len(self._workers) < self.max_connections:
+                rate = (self.downloaded - level_bytes) / elapsed
+                with self._lock:
+                    work_left = bool(self._parts)
+                if not work_left or self._error:
+                    growing = False
+                elif best_rate is None or rate > best_rate * (1 + GROWTH_GAIN):
+                    best_rate = max(rate, best_rate or 0)
+                    self._start_worker(self._part_worker)
+                    level_started, level_bytes = now, self.downloaded
+                else:
+                    growing = False
+        self._report(time.monotonic(), last_reported)
+
+    def _start_worker(self, target):
+        worker = threading.Thread(target=self._guarded, args=(target,), daemon=True)
+        self._workers.append(worker)
+        self.peak_connections = max(self.peak_connections, len(self._workers))
+        worker.start()
+
+    def _guarded(self, target):
+        """Run a worker, recording its failure so the others stop"""
+        try:
+            target()
+        except Exception as e:
+            with self._lock:
+                self._error = self._error or (e if isinstance(e, SegmentError) else SegmentError(str(e)))
+
+    def _part_worker(self):
+        while True:
+            with self._lock:
+                if self._error or not self._parts:
+                    return
+                start, end = self._parts.pop()
+            self._fetch_part(start, end)
+
+    def _fetch_part(self, start, end):
+        """Fetch bytes start..end, resuming from the last written byte on each retry"""
+        offset = start
+        attempt = 0
+        while offset <= end:
+            connection = self.pool.get()
+            try:
+                response = self._request(connection, offset, end)
+                if response.status != 206:
+                    raise SegmentError("Server stopped honouring Range requests")
+                offset = self._read_into(response, offset)
+                if offset <= end:
+                    raise SegmentError(f"Connection closed at byte {offset} of part {start}-{end}")
+                self.pool.put(connection)
+            except (OSError, http.client.HTTPException, SegmentError) as e:
+                connection.close()
+                if isinstance(e, PartialRead):
+                    offset = e.offset
+                attempt += 1
+                if attempt > self.retries or self._error or not retryable(e):
+                    raise SegmentError(f"Part {start}-{end} failed after {attempt} attempts: {e}")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(backoff(attempt))
+        self._mark_done(start, end)
+
+    def _read_whole(self, connection, response):
+        """Read a whole-file (200) response, starting over from byte 0 on each retry"""
+        attempt = 0
+        while True:
+            try:
+                if response is None:
+                    connection = self.pool.get()
+                    response = self._request(connection, 0, None)
+                self._read_into(response, 0)
+                return
+            except (OSError, http.client.HTTPException, PartialRead, HTTPStatusError) as e:
+                connection.close()
+                response = None
+                if isinstance(e, PartialRead):
+                    with self._lock:
+                        self.downloaded -= e.offset
+                attempt += 1
+                if attempt > self.retries or self._error or not retryable(e):
+                    raise SegmentError(f"Download failed after {attempt} attempts: {e}")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(backoff(attempt))
+
+    def _read_into(self, response, offset):
+        """Write the response body at offset; returns the offset after the last byte written
+
+        A read that fails partway raises PartialRead, so the caller knows where to resume.
+        """
+        while True:
+            try:
+                data = response.read(READ_SIZE)
+            except (OSError, http.client.HTTPException) as e:
+                raise PartialRead(offset, e)
+            if not data:
+                return offset
+            write_at(self._fd, data, offset)
+            offset += len(data)
+            self.bucket.consume(len(data))
+            with self._lock:
+                self.downloaded += len(data)
+                if self._error:
+                    raise SegmentError("Stopped after another part failed")
+                if self.total is None and self.max_bytes and self.downloaded > self.max_bytes:
+                    raise SegmentError(f"File is larger than the max-filesize ({self.max_bytes} bytes)")
+
+    def _mark_done(self, start, end):
+        """Record bytes start..end as written in the ranges sidecar
+
+        Written pages outlive a killed process without an fsync, which is the crash a
+        resume covers, so the sidecar is only replaced atomically.
+        """
+        if end < start:
+            return
+        with self._lock:
+            self._done = merge_ranges(self._done + [(start, end)])
+            temp_path = f"{self._ranges_path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'total': self.total, 'done': self._done}, f)
+            os.replace(temp_path, self._ranges_path)
+
+    def _load_ranges(self):
+        """(total, written ranges) left by an interrupted run, or None to start afresh"""
+        if not os.path.exists(self._temp_path):
+            return None
+        try:
+            with open(self._ranges_path) as f:
+                state = json.load(f)
+            total = int(state['total'])
+            done = merge_ranges((int(start), int(end)) for start, end in state['done'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if os.path.getsize(self._temp_path) != total or any(start < 0 or end >= total for start, end in done):
+            return None
+        return total, done
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _report(self, now, last_reported):
+        """Call on_progress if bytes arrived since the last report; returns the reported count"""
+        downloaded = self.downloaded
+        if self.on_progress and downloaded != last_reported:
+            self.on_progress(downloaded, self.total, downloaded / max(now - self._started, 1e-6))
+        return downloaded
+
+
+def merge_ranges(ranges):
+    """Sorted, non-overlapping [start, end] byte ranges covering the given ones"""
+    merged = []
+    for start, end in sorted(map(tuple, ranges)):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(done, total):
+    """The (start, end) byte ranges of a total-byte file that merged ranges `done` leave out"""
+    missing, start = [], 0
+    for done_start, done_end in done:
+        if done_start > start:
+            missing.append((start, done_start - 1))
+        start = max(start, done_end + 1)
+    if start < total:
+        missing.append((start, total - 1))
+    return missing
+
+
+def retryable(error):
+    """Whether a failed request is worth repeating: not when the server refused it outright"""
+    return not (isinstance(error, HTTPStatusError) and error.status < 500)
+
+
+def backoff(attempt):
+    return min(2 ** attempt * 0.25, 4)
+
+
+def preallocate(fd, size):
+    """Reserve the file's blocks up front where the OS supports it, else just size it"""
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+_seek_lock = threading.Lock()
+
+
+def write_at(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view, offset = view[written:], offset + written
+        return
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def can_segment(fmt, min_bytes):
+    """Whether a yt-dlp format is one plain HTTP(S) file, big enough to be worth splitting"""
+    if not fmt or not fmt.get('url') or fmt.get('fragments'):
+        return False
+    if fmt.get('protocol') not in ('http', 'https'):
+        return False
+    return (fmt.get('filesize') or fmt.get('filesize_approx') or 0) >= min_bytes
+
+
+def segmented_command(fmt, output, connections, max_filesize=None, headers=None, rate_limit=None, rate_file=None):
+    """Command line that fetches a yt-dlp format with this module (same interpreter)"""
+    cmd = [sys.executable, SCRIPT, fmt['url'], output, "--connections", str(connections)]
+    if max_filesize:
+        cmd += ["--max-filesize", str(max_filesize)]
+    if rate_file:
+        cmd += ["--rate-file", rate_file]
+    elif rate_limit:
+        cmd += ["--limit-rate", str(rate_limit)]
+    for name, value in {**(headers or {}), **(fmt.get('http_headers') or {})}.items():
+        cmd += ["--header", f"{name}: {value}"]
+    return cmd
+
+
+def progress_line(downloaded, total, speed):
+    """A line in the format of progress.PROGRESS_TEMPLATE"""
+    eta = f"{(total - downloaded) / speed:.0f}" if total and speed else "NA"
+    return f"{PROGRESS_PREFIX}{downloaded} {total if total else 'NA'} NA {speed:.0f} {eta}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch one URL over several concurrent Range requests")
+    parser.add_argument('url')
+    parser.add_argument('output')
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--header', action='append', default=[], help="'Name: value', may be repeated")
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=30, help="socket timeout per read")
+    parser.add_argument('--max-filesize', type=int)
+    parser.add_argument('--limit-rate', type=int, help="combined bytes per second across connections")
+    parser.add_argument('--rate-file', help="file holding the current --limit-rate (0: unlimited), re-read as it changes")
+    args = parser.parse_args(argv)
+
+    headers = dict(header.split(':', 1) for header in args.header)
+    fetcher = SegmentedFetcher(
+        args.url, args.output, headers={name.strip(): value.strip() for name, value in headers.items()},
+        connections=args.connections, retries=args.retries, timeout=args.timeout, max_bytes=args.max_filesize,
+        on_progress=lambda *values: print(progress_line(*values), flush=True),
+        rate_limit=args.limit_rate, rate_file=args.rate_file,
+    )
+    started = time.monotonic()
+    try:
+        size = fetcher.fetch()
+    except (OSError, http.client.HTTPException, SegmentError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(f"[segmented] {size} bytes in {time.monotonic() - started:.2f}s over {fetcher.peak_connections} "
+          f"connections ({fetcher.pool.created} opened, {fetcher.retried} retries)", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Temporary disk space for download jobs
+Each job works in its own directory under <root>/<job_id>, so finding its files never means
+scanning a shared folder and one job can never pick up another's. Jobs reserve their expected
+size against a global quota before downloading; a janitor thread removes directories that
+have gone idle and keeps the total (job directories plus the output cache) under the quota.
+Admission checks running totals (the janitor's last measurement, kept current as jobs reserve,
+release and evict) instead of scanning the disk.
+A JobLock keeps two runs of one job (a crashed worker's leftovers and its resumption) from
+writing the same files.
+"""
+
+import os
+import shutil
+import signal
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so leftover writers aren't detected
+    fcntl = None
+
+from logs import get_logger
+
+log = get_logger('storage')
+
+
+class StorageQuotaError(Exception):
+    """A job doesn't fit in its own quota or in the space left"""
+
+
+class StorageManager:
+    """Per-job working directories with quotas and age/size-based cleanup"""
+
+    def __init__(self, root, max_bytes=10 * 1024 ** 3, job_max_bytes=4 * 1024 ** 3, max_age=3600,
+                 idle_after=300, interval=300, output_cache=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.job_max_bytes = job_max_bytes
+        self.max_age = max_age  # idle job directories older than this are removed
+        self.idle_after = idle_after  # untouched this long, a directory isn't being written by any worker
+        self.interval = interval
+        self.output_cache = output_cache
+        self.rejected = 0
+        self.evicted_dirs = 0
+        self.evicted_bytes = 0
+        self._jobs = {}  # job_id -> working directory, for jobs running in this process
+        self._reserved = {}  # job_id -> bytes
+        self._reserved_bytes = 0
+        self._stored = {}  # job_id -> bytes of a directory not covered by a reservation here
+        self._stored_bytes = 0
+        self._usage = {'jobs_bytes': 0, 'cache_bytes': 0, 'measured_at': None}
+        self._lock = threading.Lock()
+        self._reserve_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._loop, name="storage-janitor", daemon=True).start()
+
+    def acquire(self, job_id):
+        """Create (or reopen, for a resumed job) the job's working directory and return its path"""
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        with self._lock:
+            self._jobs[job_id] = job_dir
+        return job_dir
+
+    def reserve(self, job_id, nbytes):
+        """Claim space for a job's downloads; raises StorageQuotaError if it can't fit"""
+        if nbytes > self.job_max_bytes:
+            with self._lock:
+                self.rejected += 1
+            raise StorageQuotaError(f"Download needs {nbytes / 1024 ** 2:.0f}MB, more than the "
+                                    f"{self.job_max_bytes / 1024 ** 2:.0f}MB allowed per download")
+        # One admission at a time, so two jobs can't both take the last free space
+        with self._reserve_lock:
+            with self._lock:
+                self._reserved_bytes -= self._reserved.pop(job_id, 0)
+                # A resumed job's partial files count against its reservation from now on
+                self._stored_bytes -= self._stored.pop(job_id, 0)
+            if self._available() < nbytes:
+                # Make room from idle directories and the output cache before giving up
+                self._make_room(nbytes)
+                if self._available() < nbytes:
+                    with self._lock:
+                        self.rejected += 1
+                    raise StorageQuotaError("Not enough temporary disk space for this download right now")
+            with self._lock:
+                self._reserved[job_id] = nbytes
+                self._reserved_bytes += nbytes
+
+    def release(self, job_id, keep=None):
+        """Finish a job: drop its reservation and remove its directory, unless `keep` is a file inside it
+
+        A kept file (one the output cache didn't take) stays until the janitor expires its directory.
+        """
+        with self._lock:
+            self._reserved_bytes -= self._reserved.pop(job_id, 0)
+            job_dir = self._jobs.pop(job_id, None) or os.path.join(self.root, job_id)
+        kept = 0
+        if keep and os.path.dirname(os.path.abspath(keep)) == os.path.abspath(job_dir):
+            for name in os.listdir(job_dir):
+                if name != os.path.basename(keep):
+                    _remove(os.path.join(job_dir, name))
+            kept = _measure(job_dir)[0]
+        else:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        with self._lock:
+            self._stored_bytes += kept - self._stored.pop(job_id, 0)
+            if kept:
+                self._stored[job_id] = kept
+
+    def sweep(self, target=None):
+        """Remove expired idle job directories, then idle ones oldest first while usage is above target
+
+        Directories of jobs running here, or written to recently by another worker, are never touched.
+        Returns the measured usage in bytes.
+        """
+        target = self.max_bytes if target is None else target
+        now = time.time()
+        with self._lock:
+            active = set(self._jobs.values())
+
+        idle = []
+        jobs_bytes = 0
+        stored = {}
+        for name in os.listdir(self.root):
+            job_dir = os.path.join(self.root, name)
+            size, last_write = _measure(job_dir)
+            if job_dir in active or now - last_write < self.idle_after:
+                jobs_bytes += size
+            elif now - last_write > self.max_age:
+                self._evict(job_dir, size)
+                continue
+            else:
+                idle.append((last_write, size, job_dir))
+                jobs_bytes += size
+            stored[name] = size
+
+        cache_bytes = self.output_cache.evict() if self.output_cache else 0
+        for _, size, job_dir in sorted(idle):
+            if jobs_bytes + cache_bytes <= target:
+                break
+            self._evict(job_dir, size)
+            stored.pop(os.path.basename(job_dir), None)
+            jobs_bytes -= size
+        if self.output_cache and jobs_bytes + cache_bytes > target:
+            cache_bytes = self.output_cache.evict(max_bytes=max(0, target - jobs_bytes))
+
+        with self._lock:
+            self._usage = {'jobs_bytes': jobs_bytes, 'cache_bytes': cache_bytes, 'measured_at': now}
+            # Restart the running totals from the measurement; reserved jobs are counted by reservation
+            self._stored = {job_id: size for job_id, size in stored.items() if job_id not in self._reserved}
+            self._stored_bytes = sum(self._stored.values())
+        return jobs_bytes + cache_bytes
+
+    def stats(self):
+        with self._lock:
+            usage = dict(self._usage)
+            reserved = self._reserved_bytes
+            active = len(self._jobs)
+        try:
+            disk_free = shutil.disk_usage(self.root).free
+        except OSError:
+            disk_free = None
+        return {
+            'root': self.root,
+            'max_bytes': self.max_bytes,
+            'job_max_bytes': self.job_max_bytes,
+            'used_bytes': usage['jobs_bytes'] + usage['cache_bytes'],
+            'jobs_bytes': usage['jobs_bytes'],
+            'cache_bytes': usage['cache_bytes'],
+            'measured_at': usage['measured_at'],
+            'reserved_bytes': reserved,
+            'active_jobs': active,
+            'evicted_dirs': self.evicted_dirs,
+            'evicted_bytes': self.evicted_bytes,
+            'rejected': self.rejected,
+            'disk_free_bytes': disk_free,
+        }
+
+    def _available(self):
+        """Bytes left under the quota (and on the disk) after what's stored and reserved"""
+        cache_bytes = self.output_cache.total_bytes if self.output_cache else 0
+        with self._lock:
+            reserved = self._reserved_bytes
+            available = self.max_bytes - self._stored_bytes - cache_bytes - reserved
+        try:
+            available = min(available, shutil.disk_usage(self.root).free - reserved)
+        except OSError:
+            pass
+        return available
+
+    def _make_room(self, nbytes):
+        """Evict idle directories, oldest first, then output cache entries until nbytes fit
+
+        Only directories the running totals hold are measured, never the whole tree.
+        """
+        now = time.time()
+        with self._lock:
+            active = set(self._jobs.values())
+            candidates = [os.path.join(self.root, job_id) for job_id in self._stored]
+        idle = []
+        for job_dir in candidates:
+            if job_dir in active:
+                continue
+            size, last_write = _measure(job_dir)
+            if now - last_write >= self.idle_after:
+                idle.append((last_write, size, job_dir))
+        for _, size, job_dir in sorted(idle):
+            shortfall = nbytes - self._available()
+            if shortfall <= 0:
+                return
+            self._evict(job_dir, size)
+        shortfall = nbytes - self._available()
+        if self.output_cache and shortfall > 0:
+            self.output_cache.evict(max_bytes=max(0, self.output_cache.total_bytes - shortfall))
+
+    def _evict(self, job_dir, size):
+        shutil.rmtree(job_dir, ignore_errors=True)
+        with self._lock:
+            self.evicted_dirs += 1
+            self.evicted_bytes += size
+            self._stored_bytes -= self._stored.pop(os.path.basename(job_dir), 0)
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                log.exception("Storage janitor failed")
+            time.sleep(self.interval)
+
+
+class JobLock:
+    """Exclusive flock on a job's working directory, held while anything may write there
+
+    Processes the job starts inherit the lock's descriptor (ProcessSupervisor.share_lock) and
+    their process groups are recorded next to it. If the worker dies, the processes it left
+    running keep the lock held, and the worker resuming the job stops them before it starts.
+    """
+
+    LOCK_FILE = '.job.lock'
+    GROUPS_FILE = '.job.pgids'
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.fd = None
+
+    def acquire(self, timeout=30, kill_grace=5):
+        """Take the lock, stopping a dead worker's leftover processes first; False if they won't stop"""
+        if fcntl is None:
+            return True
+        self.fd = os.open(os.path.join(self.job_dir, self.LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        if not self._try_lock():
+            groups = self._groups()
+            log.warning("Stopping processes left by an interrupted run", extra={'dir': self.job_dir, 'groups': groups})
+            started = time.monotonic()
+            sig = signal.SIGTERM
+            _signal_groups(groups, sig)
+            while not self._try_lock():
+                elapsed = time.monotonic() - started
+                if elapsed > timeout:
+                    self.release()
+                    return False
+                if elapsed > kill_grace and sig != signal.SIGKILL:
+                    sig = signal.SIGKILL
+                    _signal_groups(groups, sig)
+                time.sleep(0.1)
+        # Only processes started under this lock belong in the list now
+        with open(os.path.join(self.job_dir, self.GROUPS_FILE), 'w'):
+            pass
+        return True
+
+    def record(self, pid):
+        """Note a process (group) the job started, so a resuming worker can stop it"""
+        if self.fd is not None:
+            with open(os.path.join(self.job_dir, self.GROUPS_FILE), 'a') as f:
+                f.write(f"{pid}\n")
+
+    def release(self):
+        """Close our descriptor; the lock is free once the processes that inherited it exit too"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _try_lock(self):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _groups(self):
+        try:
+            with open(os.path.join(self.job_dir, self.GROUPS_FILE)) as f:
+                return [int(line) for line in f if line.strip().isdigit()]
+        except OSError:
+            return []
+
+
+def _signal_groups(groups, sig):
+    for pgid in groups:
+        try:
+            os.killpg(pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _measure(job_dir):
+    """(total bytes, newest modification time) of a job directory"""
+    size = 0
+    last_write = 0
+    try:
+        last_write = os.path.getmtime(job_dir)
+        with os.scandir(job_dir) as entries:
+            for entry in entries:
+                stat = entry.stat(follow_symlinks=False)
+                size += stat.st_size
+                last_write = max(last_write, stat.st_mtime)
+    except OSError:
+        pass
+    return size, last_write
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def create_storage_manager(download_path, output_cache=None):
+    """Create the manager configured by YTDL_WORK_DIR, YTDL_STORAGE_MAX_MB, YTDL_JOB_MAX_MB,
+    YTDL_STORAGE_MAX_AGE and YTDL_JANITOR_INTERVAL"""
+    return StorageManager(
+        root=os.environ.get('YTDL_WORK_DIR') or os.path.join(download_path, 'ytdl-jobs'),
+        max_bytes=int(os.environ.get('YTDL_STORAGE_MAX_MB', 10240)) * 1024 * 1024,
+        job_max_bytes=int(os.environ.get('YTDL_JOB_MAX_MB', 4096)) * 1024 * 1024,
+        max_age=int(os.environ.get('YTDL_STORAGE_MAX_AGE', 3600)),
+        interval=int(os.environ.get('YTDL_JANITOR_INTERVAL', 300)),
+        output_cache=output_cache,
+    )
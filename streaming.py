@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Stream-while-downloading delivery
+FFmpeg reads the selected formats' direct URLs (from the cached metadata) and remuxes them
+into a streamable container on stdout, which is relayed to the client in fixed-size chunks.
+Nothing touches the disk and each stream holds at most one chunk in memory; a slow client
+back-pressures FFmpeg through the pipe. FFmpeg gives up on an upstream that stops answering
+(-rw_timeout), and a watchdog kills streams that stall or run past their deadline, so a dead
+upstream can't hold a request thread and a streaming slot.
+"""
+
+import subprocess
+import threading
+import time
+import uuid
+
+from metrics import count_spawn
+
+CHUNK_SIZE = 64 * 1024
+
+# Fragmented MP4: a moov up front plus self-contained fragments, so playback can start
+# before the file ends and no seekable output is needed
+FRAGMENTED_MP4 = ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+
+MP4_VIDEO_CODECS = ('avc1', 'h264', 'av01', 'hev1', 'hvc1')
+MP4_AUDIO_CODECS = ('mp4a', 'aac')
+
+
+class StreamUnavailableError(Exception):
+    """The requested formats can't be streamed"""
+
+
+class StreamSlotsExhaustedError(Exception):
+    """Every streaming slot is in use"""
+
+
+def _codec(fmt, key):
+    return (fmt.get(key) or 'none').split('.')[0].lower() if fmt else 'none'
+
+
+def select_stream_formats(info, quality_format_id):
+    """Pick (video_format, audio_format) for a stream; video_format is None for audio only"""
+    formats = [fmt for fmt in info.get('formats') or () if fmt.get('url')]
+    audio = [fmt for fmt in formats if _codec(fmt, 'vcodec') == 'none' and _codec(fmt, 'acodec') != 'none']
+
+    video = None
+    if str(quality_format_id) != '0':
+        video = next((fmt for fmt in formats if fmt.get('format_id') == str(quality_format_id)), None)
+        if video is None:
+            raise StreamUnavailableError(f"Format {quality_format_id} is not available for streaming")
+        if _codec(video, 'vcodec') == 'none':
+            video, audio = None, [video]
+        elif _codec(video, 'acodec') != 'none':
+            return video, None  # already has both streams
+
+    if not audio:
+        raise StreamUnavailableError("No audio format available for streaming")
+    # Prefer audio that fits the video's container so the remux needs no re-encode
+    wants_mp4 = video is None or _codec(video, 'vcodec') in MP4_VIDEO_CODECS
+    audio.sort(key=lambda fmt: ((_codec(fmt, 'acodec') in MP4_AUDIO_CODECS) == wants_mp4, fmt.get('abr') or 0))
+    return video, audio[-1]
+
+
+def stream_container(video, audio):
+    """Return (extension, mimetype, ffmpeg output args) for a stream-copy remux"""
+    video_codec = _codec(video, 'vcodec')
+    audio_codec = _codec(audio or video, 'acodec')
+    mp4_video = video is None or video_codec in MP4_VIDEO_CODECS
+    if mp4_video and audio_codec in MP4_AUDIO_CODECS + ('none',):
+        return ('mp4', 'video/mp4', FRAGMENTED_MP4) if video else ('m4a', 'audio/mp4', FRAGMENTED_MP4)
+    if video is None and audio_codec in ('opus', 'vorbis'):
+        return 'webm', 'audio/webm', ["-f", "webm"]
+    if video_codec in ('vp9', 'vp09', 'vp8', 'av01') and audio_codec in ('opus', 'vorbis'):
+        return 'webm', 'video/webm', ["-f", "webm"]
+    # Matroska takes any codec pair and is written sequentially
+    return 'mkv', 'video/x-matroska', ["-f", "matroska"]
+
+
+def build_stream_command(ffmpeg, video, audio, user_agent, rw_timeout=30):
+    """FFmpeg command that remuxes the formats' URLs to stdout without re-encoding
+
+    An input that sends nothing for rw_timeout seconds fails the stream instead of blocking it
+    """
+    cmd = [ffmpeg, "-nostdin", "-loglevel", "error"]
+    inputs = [fmt for fmt in (video, audio) if fmt]
+    for fmt in inputs:
+        headers = dict(fmt.get('http_headers') or {})
+        headers['User-Agent'] = user_agent
+        cmd += ["-headers", "".join(f"{name}: {value}\r\n" for name, value in headers.items()),
+                "-rw_timeout", str(int(rw_timeout * 1000000)), "-i", fmt['url']]
+    if video and audio:
+        cmd += ["-map", "0:v:0", "-map", "1:a:0"]
+    elif video:
+        cmd += ["-map", "0:v:0", "-map", "0:a:0?"]
+    else:
+        cmd += ["-map", "0:a:0"]
+    _, _, output_args = stream_container(video, audio)
+    cmd += ["-c", "copy", *output_args, "pipe:1"]
+    return cmd
+
+
+class StreamLimiter:
+    """Caps concurrent streams; each one holds an FFmpeg process and an open connection
+
+    Running streams are registered by ID so they can be cancelled like downloads.
+    """
+
+    def __init__(self, max_streams=4):
+        self.max_streams = max_streams
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self._streams = {}
+        self.active = 0
+        self.served = 0
+        self.stopped = {'stalled': 0, 'timeout': 0, 'cancelled': 0}
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            raise StreamSlotsExhaustedError(f"All {self.max_streams} streaming slots are busy")
+        with self._lock:
+            self.active += 1
+            self.served += 1
+
+    def register(self, stream):
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+
+    def release(self, stream_id=None):
+        with self._lock:
+            self.active -= 1
+            stream = self._streams.pop(stream_id, None)
+            if stream is not None and stream.reason:
+                self.stopped[stream.reason] += 1
+        self._slots.release()
+
+    def cancel(self, stream_id):
+        """Stop a running stream; False if there is none with that ID"""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            return False
+        stream.stop('cancelled')
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'served': self.served, 'max_streams': self.max_streams,
+                    'stopped': dict(self.stopped)}
+
+
+class MediaStream:
+    """FFmpeg's stdout as a WSGI-closable iterable of chunks
+
+    The server calls close() when the response ends or the client goes away, which kills
+    FFmpeg and runs on_close exactly once (even if iteration never started).
+
+    A watchdog kills FFmpeg when a read waits stall_timeout seconds for output (time spent
+    waiting on a slow client doesn't count) or the stream outlives timeout seconds; the
+    response then ends and the server's close() releases the slot. self.reason says why a
+    stream was stopped ('stalled', 'timeout' or 'cancelled'), None otherwise.
+    """
+
+    def __init__(self, cmd, chunk_size=CHUNK_SIZE, on_close=None, timeout=None, stall_timeout=None,
+                 check_interval=1, stream_id=None):
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+        self.bytes_sent = 0
+        self.reason = None
+        self.stream_id = stream_id or uuid.uuid4().hex
+        self._closed = False
+        self._done = threading.Event()
+        self._reading_since = None
+        count_spawn('ffmpeg')
+        self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        if timeout or stall_timeout:
+            threading.Thread(target=self._watch, args=(time.monotonic(), timeout, stall_timeout, check_interval),
+                             name="stream-watchdog", daemon=True).start()
+        try:
+            self._first = self._read()
+        except BaseException:
+            self.close()
+            raise
+        if not self._first:
+            return_code = self.close()
+            if self.reason:
+                raise StreamUnavailableError(f"FFmpeg was stopped before producing output ({self.reason})")
+            raise StreamUnavailableError(f"FFmpeg produced no output (exit code {return_code})")
+
+    def __iter__(self):
+        chunk, self._first = self._first, None
+        while chunk:
+            self.bytes_sent += len(chunk)
+            yield chunk
+            chunk = self._read()
+
+    def stop(self, reason):
+        """Kill FFmpeg from another thread; iteration ends at the next read"""
+        if self._process.poll() is None:
+            self.reason = self.reason or reason
+            self._process.kill()
+
+    def close(self):
+        """Stop FFmpeg and release the stream; returns FFmpeg's exit code"""
+        self._done.set()
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        return_code = self._process.wait()
+        if not self._closed:
+            self._closed = True
+            if self.on_close:
+                self.on_close()
+        return return_code
+
+    def _read(self):
+        self._reading_since = time.monotonic()
+        try:
+            return self._process.stdout.read(self.chunk_size)
+        finally:
+            self._reading_since = None
+
+    def _watch(self, started, timeout, stall_timeout, check_interval):
+        while not self._done.wait(check_interval):
+            now = time.monotonic()
+            reading_since = self._reading_since
+            if timeout and now - started > timeout:
+                self.stop('timeout')
+            elif stall_timeout and reading_since is not None and now - reading_since > stall_timeout:
+                self.stop('stalled')
+            else:
+                continue
+            return
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Supervised yt-dlp and FFmpeg processes
+Both pipes are drained as output arrives (selectors, or reader threads on Windows), keeping
+a bounded tail of each, so a chatty process can never block on a full pipe. Every run has a
+deadline and a stall timeout (no output on either pipe for that long); on either, or when
+its job is cancelled, the process is killed with everything it started (its process group).
+"""
+
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+from logs import get_logger
+from metrics import PROCESS_KILLS, count_spawn
+
+log = get_logger('supervisor')
+
+# How often a run wakes up to check its deadline, stall timer and cancellation
+POLL_INTERVAL = 0.25
+# How often the shared cancellation check (e.g. the job store) is consulted per run
+CANCEL_CHECK_INTERVAL = 1.0
+
+# reason is None when the process exited on its own, else 'timeout', 'stalled' or 'cancelled'
+ProcessResult = namedtuple('ProcessResult', ['returncode', 'stdout', 'stderr', 'reason'])
+
+
+class RingBuffer:
+    """Keeps the last `size` bytes written to it"""
+
+    def __init__(self, size=65536):
+        self.size = size
+        self.total = 0
+        self._data = bytearray()
+
+    def write(self, data):
+        self.total += len(data)
+        self._data += data
+        if len(self._data) > self.size:
+            del self._data[:len(self._data) - self.size]
+
+    def text(self):
+        return self._data.decode('utf-8', errors='replace')
+
+
+class ProcessSupervisor:
+    """Runs processes for jobs and can kill all of a job's processes at once
+
+    is_cancelled(job_id), if given, is polled while a job's process runs so a cancel
+    recorded elsewhere (another worker, via the job store) also stops it.
+    """
+
+    def __init__(self, buffer_size=65536, kill_grace=5, is_cancelled=None):
+        self.buffer_size = buffer_size
+        self.kill_grace = kill_grace
+        self.is_cancelled = is_cancelled
+        self._running = {}  # job_id -> set of Popen
+        self._job_locks = {}  # job_id -> storage.JobLock its processes inherit
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self.kills = {'timeout': 0, 'stalled': 0, 'cancelled': 0}
+
+    def run(self, cmd, cwd=None, job_id=None, program=None, timeout=None, stall_timeout=None, on_output=None,
+            nice=None):
+        """Run cmd to completion, passing each stdout line to on_output; returns a ProcessResult
+
+        stdout and stderr hold the last buffer_size bytes of each. A cancelled job's
+        later commands return straight away without starting. nice lowers the process's
+        CPU priority (and that of the children it starts afterwards) where the OS allows.
+        stall_timeout may be a function, re-read on every poll; returning None turns the stall
+        check off (e.g. while a post-processing step that prints nothing runs).
+        """
+        program = program or os.path.basename(cmd[0])
+        if job_id is not None and self.cancelled(job_id):
+            return ProcessResult(None, '', '', 'cancelled')
+
+        count_spawn(program)
+        with self._lock:
+            job_lock = self._job_locks.get(job_id)
+        inherit = {'pass_fds': (job_lock.fd,)} if job_lock and job_lock.fd is not None else {}
+        process = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, **new_process_group(), **inherit)
+        if job_lock:
+            job_lock.record(process.pid)
+        if nice:
+            lower_priority(process, nice)
+        with self._lock:
+            self._running.setdefault(job_id, set()).add(process)
+        try:
+            stdout, stderr, reason = self._supervise(process, job_id, timeout, stall_timeout, on_output)
+        finally:
+            with self._lock:
+                processes = self._running.get(job_id)
+                processes.discard(process)
+                if not processes:
+                    del self._running[job_id]
+            if process.poll() is None:
+                self._kill(process)
+        if reason:
+            self.kills[reason] += 1
+            PROCESS_KILLS.inc(program=program, reason=reason)
+            log.warning("Process killed", extra={'job': job_id, 'program': program, 'reason': reason})
+        return ProcessResult(process.returncode, stdout.text(), stderr.text(), reason)
+
+    def cancel(self, job_id):
+        """Mark a job cancelled and kill its running processes; returns how many were killed"""
+        with self._lock:
+            self._cancelled.add(job_id)
+            processes = list(self._running.get(job_id, ()))
+        for process in processes:
+            self._kill(process)
+        return len(processes)
+
+    def cancelled(self, job_id):
+        with self._lock:
+            if job_id in self._cancelled:
+                return True
+        if self.is_cancelled and self.is_cancelled(job_id):
+            with self._lock:
+                self._cancelled.add(job_id)
+            return True
+        return False
+
+    def share_lock(self, job_id, job_lock):
+        """Have the job's processes inherit its JobLock (and record themselves in it) until forget()"""
+        with self._lock:
+            self._job_locks[job_id] = job_lock
+
+    def forget(self, job_id):
+        """Drop a finished job's cancellation mark and lock"""
+        with self._lock:
+            self._cancelled.discard(job_id)
+            self._job_locks.pop(job_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': sum(len(processes) for processes in self._running.values()),
+                'jobs': len(self._running),
+                'kills': dict(self.kills),
+            }
+
+    def _supervise(self, process, job_id, timeout, stall_timeout, on_output):
+        """Drain both pipes until they close, enforcing the deadline, stall timer and cancellation"""
+        buffers = {'stdout': RingBuffer(self.buffer_size), 'stderr': RingBuffer(self.buffer_size)}
+        partial = b''
+        started = last_output = last_cancel_check = time.monotonic()
+        reason = None
+
+        reader = PipeReader(process)
+        try:
+            while reader.open:
+                now = time.monotonic()
+                if timeout and now - started > timeout:
+                    reason = 'timeout'
+                elif stall_limit(stall_timeout) and now - last_output > stall_limit(stall_timeout):
+                    reason = 'stalled'
+                elif job_id is not None and now - last_cancel_check >= CANCEL_CHECK_INTERVAL:
+                    last_cancel_check = now
+                    if self.cancelled(job_id):
+                        reason = 'cancelled'
+                if reason:
+                    self._kill(process)
+                    break
+
+                for name, data in reader.read(POLL_INTERVAL):
+                    last_output = time.monotonic()
+                    buffers[name].write(data)
+                    if name == 'stdout' and on_output:
+                        *lines, partial = (partial + data).split(b'\n')
+                        for line in lines:
+                            on_output(line.decode('utf-8', errors='replace') + '\n')
+        finally:
+            reader.close()
+
+        if partial and on_output and not reason:
+            on_output(partial.decode('utf-8', errors='replace'))
+        # The pipes close when the process exits (or was killed); reap it
+        try:
+            process.wait(timeout=self.kill_grace)
+        except subprocess.TimeoutExpired:
+            # Closed its output but kept running
+            self._kill(process)
+            reason = reason or 'timeout'
+        if reason is None and job_id is not None and process.returncode != 0:
+            # Killed by cancel() from another thread
+            with self._lock:
+                if job_id in self._cancelled:
+                    reason = 'cancelled'
+        return buffers['stdout'], buffers['stderr'], reason
+
+    def _kill(self, process):
+        """Terminate the process's group, escalating to SIGKILL after kill_grace seconds"""
+        if process.poll() is not None:
+            return
+        signal_group(process, signal.SIGTERM)
+        try:
+            process.wait(timeout=self.kill_grace)
+        except subprocess.TimeoutExpired:
+            signal_group(process, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+            process.wait()
+
+
+class PipeReader:
+    """Reads whatever a process wrote to stdout/stderr, waiting at most a timeout
+
+    Uses a selector where pipes support one (POSIX) and a reader thread per pipe otherwise
+    """
+
+    def __init__(self, process):
+        self.open = {'stdout', 'stderr'}
+        self._pipes = {'stdout': process.stdout, 'stderr': process.stderr}
+        if os.name == 'nt':
+            self._selector = None
+            self._queue = queue.Queue()
+            for name, pipe in self._pipes.items():
+                threading.Thread(target=self._pump, args=(name, pipe), daemon=True).start()
+        else:
+            self._selector = selectors.DefaultSelector()
+            for name, pipe in self._pipes.items():
+                self._selector.register(pipe, selectors.EVENT_READ, name)
+
+    def read(self, timeout):
+        """[(pipe name, bytes)] read within timeout; closed pipes are removed from self.open"""
+        if self._selector is None:
+            events = []
+            try:
+                events.append(self._queue.get(timeout=timeout))
+                while True:
+                    events.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+        else:
+            events = [(key.data, os.read(key.fd, 65536)) for key, _ in self._selector.select(timeout)]
+        chunks = []
+        for name, data in events:
+            if data:
+                chunks.append((name, data))
+            else:
+                self.open.discard(name)
+                if self._selector is not None:
+                    self._selector.unregister(self._pipes[name])
+        return chunks
+
+    def close(self):
+        if self._selector is not None:
+            self._selector.close()
+        for pipe in self._pipes.values():
+            pipe.close()
+
+    def _pump(self, name, pipe):
+        try:
+            while True:
+                data = pipe.read1(65536)
+                self._queue.put((name, data))
+                if not data:
+                    return
+        except (OSError, ValueError):
+            self._queue.put((name, b''))
+
+
+def new_process_group():
+    """Popen arguments that start the child in its own process group"""
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def stall_limit(stall_timeout):
+    return stall_timeout() if callable(stall_timeout) else stall_timeout
+
+
+def lower_priority(process, nice):
+    if hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, process.pid, nice)
+        except OSError:
+            pass
+
+
+def signal_group(process, sig):
+    try:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
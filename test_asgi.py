@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the async /api/video-info path
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import asgi
+
+
+class SlowExtractor:
+    """Async extractor that takes `delay` seconds and records cancellations"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = 0
+        self.urls = []
+
+    async def extract_info_async(self, url, player_client='web'):
+        self.urls.append(url)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {'id': url[-11:], 'title': 'Video', 'formats': [
+            {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'fps': 30},
+        ]}
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    fake = SlowExtractor(delay=0.2)
+    monkeypatch.setattr(asgi.downloader, 'extractor', fake)
+    monkeypatch.setattr(asgi.downloader.metadata_cache, 'get', lambda key: None)
+    return fake
+
+
+async def call(url, disconnect_after=None):
+    """Drive the ASGI app with one POST /api/video-info; returns (status, payload)"""
+    messages = [{'type': 'http.request', 'body': json.dumps({'url': url}).encode()}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        if disconnect_after is not None:
+            await asyncio.sleep(disconnect_after)
+            return {'type': 'http.disconnect'}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'path': '/api/video-info', 'method': 'POST', 'headers': []}
+    await asgi.app(scope, receive, send)
+    if not sent:
+        return None, None
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def test_lookups_run_concurrently(extractor):
+    async def run():
+        return await asyncio.gather(*(call(f"https://youtu.be/video{i:06d}") for i in range(20)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    assert time.perf_counter() - started < 1.5
+    assert all(status == 200 and payload['success'] for status, payload in results)
+
+
+def test_deadline_returns_504(extractor, monkeypatch):
+    extractor.delay = 5
+    original = asgi.extract_with_fallback_async
+    monkeypatch.setattr(asgi, 'extract_with_fallback_async', lambda url: original(url, deadline=0.1))
+    status, payload = asyncio.run(call("https://youtu.be/abcdefghijk"))
+    assert status == 504
+    assert not payload['success']
+
+
+def test_disconnect_cancels_the_lookup(extractor):
+    extractor.delay = 5
+    status, _ = asyncio.run(call("https://youtu.be/abcdefghijk", disconnect_after=0.05))
+    assert status is None
+    assert extractor.cancelled == 1
+
+
+def test_share_links_are_looked_up_by_their_canonical_url(extractor):
+    status, payload = asyncio.run(call("https://youtu.be/abcdefghijk?si=share"))
+    assert status == 200 and payload['success']
+    assert extractor.urls == ['https://www.youtube.com/watch?v=abcdefghijk']
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for batch download coordination
+"""
+
+import threading
+import time
+
+from batch import BatchManager
+from job_store import MemoryJobStore
+from scheduler import QueueFullError
+
+
+def wait_until(predicate, timeout=3):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+class FakeDownloads:
+    """Stands in for enqueue_download; jobs finish when the test says so"""
+
+    def __init__(self, store, fail_first=()):
+        self.store = store
+        self.fail_first = set(fail_first)
+        self.started = []
+        self.lock = threading.Lock()
+
+    def enqueue(self, url, quality_format_id, client_id):
+        with self.lock:
+            download_id = f"job{len(self.started)}"
+            self.started.append((url, download_id))
+        self.store.update(download_id, {'status': 'queued'})
+        return {'download_id': download_id}
+
+    def finish(self, download_id, url):
+        if url in self.fail_first:
+            self.fail_first.discard(url)
+            self.store.update(download_id, {'status': 'error', 'error': 'boom'})
+        else:
+            self.store.update(download_id, {'status': 'completed', 'filename': f"{url}.mp4"}, progress=100)
+
+
+def batch_record(store, batch_id):
+    return store.get(batch_id)
+
+
+def test_batch_expands_lazily_and_respects_concurrency():
+    store = MemoryJobStore()
+    downloads = FakeDownloads(store)
+    pulled = []
+
+    def entries():
+        for i in range(5):
+            pulled.append(i)
+            yield f"v{i}"
+
+    def expand(url):
+        return entries() if url == "playlist" else None
+
+    manager = BatchManager(downloads.enqueue, expand, store, concurrency=2, poll_interval=0.01)
+    batch_id = manager.start(["playlist", "single"], "0", "client")
+
+    wait_until(lambda: len(downloads.started) == 2)
+    time.sleep(0.05)
+    assert len(downloads.started) == 2
+    assert len(pulled) <= 3
+
+    finished = 0
+    while finished < 6:
+        wait_until(lambda: len(downloads.started) > finished)
+        url, download_id = downloads.started[finished]
+        downloads.finish(download_id, url)
+        finished += 1
+
+    wait_until(lambda: batch_record(store, batch_id)['status']['status'] == 'completed')
+    record = batch_record(store, batch_id)
+    assert record['progress'] == 100
+    assert record['status']['total'] == 6
+    assert [item['url'] for item in record['status']['items']] == ["v0", "v1", "v2", "v3", "v4", "single"]
+
+
+def test_failed_items_are_retried_then_reported():
+    store = MemoryJobStore()
+    downloads = FakeDownloads(store, fail_first=["a"])
+    manager = BatchManager(downloads.enqueue, lambda url: None, store, retries=1, poll_interval=0.01)
+    batch_id = manager.start(["a", "b"], "0", "client")
+
+    wait_until(lambda: len(downloads.started) == 2)
+    for url, download_id in list(downloads.started):
+        downloads.finish(download_id, url)
+    wait_until(lambda: len(downloads.started) == 3)
+    assert downloads.started[2][0] == "a"
+    downloads.finish(downloads.started[2][1], "a")
+
+    wait_until(lambda: batch_record(store, batch_id)['status']['status'] == 'completed')
+    items = batch_record(store, batch_id)['status']['items']
+    assert [item['attempts'] for item in items] == [2, 1]
+    assert batch_record(store, batch_id)['status']['failed'] == 0
+
+
+def test_full_queue_delays_items_instead_of_failing_them():
+    store = MemoryJobStore()
+    downloads = FakeDownloads(store)
+    full = threading.Event()
+    full.set()
+
+    def enqueue(url, quality_format_id, client_id):
+        if full.is_set():
+            raise QueueFullError("full")
+        return downloads.enqueue(url, quality_format_id, client_id)
+
+    manager = BatchManager(enqueue, lambda url: None, store, poll_interval=0.01)
+    batch_id = manager.start(["a"], "0", "client")
+    time.sleep(0.05)
+    assert batch_record(store, batch_id)['status']['items'][0]['status'] == 'pending'
+
+    full.clear()
+    wait_until(lambda: downloads.started)
+    downloads.finish(downloads.started[0][1], "a")
+    wait_until(lambda: batch_record(store, batch_id)['status']['status'] == 'completed')
+
+
+def test_crash_while_expanding_marks_the_batch_failed():
+    store = MemoryJobStore()
+    downloads = FakeDownloads(store)
+
+    def expand(url):
+        yield "a"
+        raise RuntimeError("playlist page changed")
+
+    manager = BatchManager(downloads.enqueue, expand, store, concurrency=2, poll_interval=0.01)
+    batch_id = manager.start(["list"], "0", "client")
+    wait_until(lambda: batch_record(store, batch_id)['status']['status'] == 'error')
+    assert "playlist page changed" in batch_record(store, batch_id)['status']['error']
+    assert not batch_record(store, batch_id)['status']['expanding']
+
+
+def test_cancel_drops_pending_items_and_cancels_running_ones():
+    store = MemoryJobStore()
+    downloads = FakeDownloads(store)
+    cancelled = []
+
+    def cancel(download_id):
+        cancelled.append(download_id)
+        store.update(download_id, {'status': 'cancelled'})
+
+    manager = BatchManager(downloads.enqueue, lambda url: None, store, concurrency=1, poll_interval=0.01,
+                           cancel=cancel)
+    batch_id = manager.start(["a", "b", "c"], "0", "client")
+    wait_until(lambda: downloads.started)
+    assert store.request_cancel(batch_id, without_spec=True)
+
+    wait_until(lambda: batch_record(store, batch_id)['status']['status'] == 'cancelled')
+    items = batch_record(store, batch_id)['status']['items']
+    assert cancelled == ["job0"] and len(downloads.started) == 1
+    assert all(item['status'] == 'cancelled' for item in items)
+    # The flag is cleared once the batch is done
+    assert not store.cancel_requested(batch_id)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged player-client selection, using a fake extractor
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from client_strategy import HedgedClientStrategy
+from extraction import ExtractionError
+
+
+class FakeExtractor:
+    """Per-client latency and failure behaviour, recording every call"""
+
+    def __init__(self, **behaviour):
+        self.behaviour = behaviour  # client -> (seconds, fails)
+        self.calls = []
+        self.cancelled = []
+
+    def extract_info(self, url, player_client='web'):
+        self.calls.append(player_client)
+        seconds, fails = self.behaviour[player_client]
+        time.sleep(seconds)
+        if fails:
+            raise ExtractionError(f"{player_client} failed")
+        return {'client': player_client}
+
+    async def extract_info_async(self, url, player_client='web'):
+        self.calls.append(player_client)
+        seconds, fails = self.behaviour[player_client]
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            self.cancelled.append(player_client)
+            raise
+        if fails:
+            raise ExtractionError(f"{player_client} failed")
+        return {'client': player_client}
+
+
+def test_failure_moves_on_without_waiting_for_the_hedge():
+    extractor = FakeExtractor(web=(0, True), android=(0.05, False))
+    strategy = HedgedClientStrategy(hedge_delay=5)
+    started = time.perf_counter()
+    assert strategy.extract(extractor.extract_info, 'url') == {'client': 'android'}
+    assert time.perf_counter() - started < 1
+    assert strategy.stats()['hedges'] == 0
+
+
+def test_slow_client_is_hedged():
+    extractor = FakeExtractor(web=(1, False), android=(0.05, False))
+    strategy = HedgedClientStrategy(hedge_delay=0.1)
+    started = time.perf_counter()
+    assert strategy.extract(extractor.extract_info, 'url') == {'client': 'android'}
+    assert time.perf_counter() - started < 0.5
+    assert extractor.calls == ['web', 'android']
+    assert strategy.stats()['hedges'] == 1
+    assert strategy.stats()['clients']['android']['wins'] == 1
+
+
+def test_all_clients_failing_raises_the_last_error():
+    extractor = FakeExtractor(web=(0, True), android=(0, True))
+    strategy = HedgedClientStrategy(hedge_delay=1)
+    with pytest.raises(ExtractionError, match="android failed"):
+        strategy.extract(extractor.extract_info, 'url')
+
+
+def test_order_adapts_to_recent_results():
+    extractor = FakeExtractor(web=(0, True), android=(0, False))
+    strategy = HedgedClientStrategy(hedge_delay=1, min_samples=3)
+    assert strategy.order() == ['web', 'android']
+    for _ in range(3):
+        strategy.extract(extractor.extract_info, 'url')
+    assert extractor.calls == ['web', 'android'] * 3
+    stats = strategy.stats()
+    assert stats['order'] == ['android', 'web']
+    assert stats['clients']['web']['recent_success_rate'] == 0.0
+
+
+def test_faster_client_is_preferred_when_both_succeed():
+    strategy = HedgedClientStrategy(hedge_delay=1, min_samples=2)
+    for _ in range(2):
+        strategy.record('web', True, 2.0)
+        strategy.record('android', True, 0.5)
+    assert strategy.order() == ['android', 'web']
+
+
+def test_async_hedge_cancels_the_loser():
+    extractor = FakeExtractor(web=(5, False), android=(0.05, False))
+    strategy = HedgedClientStrategy(hedge_delay=0.1)
+    started = time.perf_counter()
+    result = asyncio.run(strategy.extract_async(extractor.extract_info_async, 'url'))
+    assert result == {'client': 'android'}
+    assert time.perf_counter() - started < 1
+    assert extractor.cancelled == ['web']
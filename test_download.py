@@ -1,99 +1,166 @@
 #!/usr/bin/env python3
 """
-Test script to verify yt-dlp download functionality
+Offline regression tests for metadata and downloads
+Recorded extractor JSON is replayed by benchmarks/fake_youtube.py and its formats are served
+locally, so nothing reaches YouTube (see benchmarks/bench_e2e.py for the timed version)
 """
 
-import subprocess
-import os
 import json
+import os
+import subprocess
+import sys
+import time
 
-def test_yt_dlp():
-    """Test if yt-dlp can download a video"""
-    
-    # Test URL (Rick Astley - Never Gonna Give You Up)
-    test_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
-    
-    print("🎬 Testing yt-dlp download functionality")
-    print("=" * 50)
-    
-    # Test 1: Get video info
-    print("\n1. Testing video info retrieval...")
-    try:
-        cmd = [
-            "py", "-m", "yt_dlp",
-            "--dump-json",
-            "--no-playlist",
-            test_url
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        
-        if result.returncode == 0:
-            video_data = json.loads(result.stdout)
-            print(f"✅ Video info retrieved successfully!")
-            print(f"   Title: {video_data.get('title', 'Unknown')}")
-            print(f"   Duration: {video_data.get('duration', 0)} seconds")
-            print(f"   Uploader: {video_data.get('uploader', 'Unknown')}")
-        else:
-            print(f"❌ Failed to get video info: {result.stderr}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error getting video info: {str(e)}")
-        return False
-    
-    # Test 2: Download a small video
-    print("\n2. Testing video download...")
-    try:
-        # Create test directory
-        test_dir = "test_downloads"
-        os.makedirs(test_dir, exist_ok=True)
-        
-        # Download with low quality for speed
-        cmd = [
-            "py", "-m", "yt_dlp",
-            "-f", "worst[height<=360]",  # Low quality for faster download
-            "-o", os.path.join(test_dir, "test_video.%(ext)s"),
-            "--no-playlist",
-            test_url
-        ]
-        
-        print(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        
-        print(f"Download result: {result.returncode}")
-        print(f"Download stdout: {result.stdout}")
-        print(f"Download stderr: {result.stderr}")
-        
-        if result.returncode == 0:
-            # Check if file was downloaded
-            files = os.listdir(test_dir)
-            video_files = [f for f in files if f.startswith("test_video.")]
-            
-            if video_files:
-                print(f"✅ Download successful! File: {video_files[0]}")
-                print(f"   File size: {os.path.getsize(os.path.join(test_dir, video_files[0]))} bytes")
-                
-                # Clean up
-                for file in video_files:
-                    os.remove(os.path.join(test_dir, file))
-                os.rmdir(test_dir)
-                
-                return True
-            else:
-                print("❌ Download completed but no file found")
-                return False
-        else:
-            print(f"❌ Download failed: {result.stderr}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error during download: {str(e)}")
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from fake_youtube import FakeYouTube
+
+
+@pytest.fixture
+def fake_youtube():
+    with FakeYouTube(size_scale=0.01) as fake:
+        yield fake
+
+
+def test_video_info_from_recorded_fixture(fake_youtube, monkeypatch):
+    import app_simple
+    monkeypatch.setattr(app_simple.downloader, 'extractor', fake_youtube)
+    client = app_simple.app.test_client()
+
+    response = client.post('/api/video-info', json={'url': 'https://youtu.be/regress0001?si=share'}).get_json()
+    assert response['success'], response
+    assert response['title'].startswith('Rick Astley')
+    picks = {option['display']: option['format_id'] for option in response['qualities']}
+    # avc1 beats vp9 at 1080p; the combined format wins its slot at 360p
+    assert picks['1080p@25fps'] == '137'
+    assert picks['360p@25fps'] == '18'
+    assert picks['Audio Only (135.8kbps)'] == '251'
+
+    client.post('/api/video-info', json={'url': 'https://m.youtube.com/watch?v=regress0001'})
+    assert fake_youtube.extractions == 1
+
+
+def test_yt_dlp_downloads_recorded_formats_offline(fake_youtube, tmp_path):
+    pytest.importorskip('yt_dlp')
+    info_file = tmp_path / "info.json"
+    info_file.write_text(json.dumps(fake_youtube.info('regress0002')))
+
+    result = subprocess.run([sys.executable, "-m", "yt_dlp", "--load-info-json", str(info_file),
+                             "-f", "bestaudio[ext=m4a]", "-o", "audio.%(ext)s", "--no-warnings"],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert os.path.getsize(tmp_path / "audio.m4a") == fake_youtube.sizes['140']
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "condition not reached"
+        time.sleep(0.05)
+
+
+def test_cancel_stops_a_running_download_and_removes_its_files(monkeypatch):
+    pytest.importorskip('yt_dlp')
+    import app_simple
+    with FakeYouTube(size_scale=0.01, rate=20000) as fake:
+        monkeypatch.setattr(app_simple.downloader, 'extractor', fake)
+        client = app_simple.app.test_client()
+        download_id = client.post('/api/download', json={'url': 'https://youtu.be/regress0003',
+                                                         'quality_format_id': '137'}).get_json()['download_id']
+
+        def status():
+            return client.get(f'/api/progress/{download_id}').get_json()['status']
+
+        # Cancel once yt-dlp is fetching (throttled, so it would take minutes)
+        wait_for(lambda: status().get('streams'))
+        assert client.post(f'/api/download/{download_id}/cancel').get_json()['success']
+        wait_for(lambda: status()['status'] == 'cancelled')
+        wait_for(lambda: not os.path.exists(os.path.join(app_simple.storage.root, download_id)))
+        assert client.post(f'/api/download/{download_id}/cancel').status_code == 409
+
+
+def test_batch_rejects_non_numeric_options():
+    import app_simple
+    response = app_simple.app.test_client().post('/api/batch', json={'url': 'https://youtu.be/regress0004',
+                                                                      'concurrency': 'lots'})
+    assert response.status_code == 400 and not response.get_json()['success']
+
+
+def test_merge_container_keeps_both_streams_as_they_are():
+    import app_simple
+    choose = app_simple.downloader.choose_merge_container
+    assert choose('v.mp4', 'a.m4a') == 'mp4'
+    assert choose('v.webm', 'a.webm') == 'webm'
+    assert choose('v.mp4', 'a.webm') == choose('v.webm', 'a.m4a') == 'mkv'
+
+
+class FakeSupervisor:
+    """Records FFmpeg commands; fails the ones whose audio codec is in `failing`"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.commands = []
+
+    def run(self, cmd, **options):
+        from supervisor import ProcessResult
+        self.commands.append(cmd)
+        if cmd[cmd.index('-c:a') + 1] in self.failing:
+            return ProcessResult(1, '', 'Could not write header', None)
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'merged')
+        return ProcessResult(0, '', 'bench: utime=0.5s stime=0.25s rtime=1s', None)
+
+    def cancelled(self, job_id):
         return False
 
-if __name__ == "__main__":
-    success = test_yt_dlp()
-    if success:
-        print("\n🎉 All tests passed! yt-dlp is working correctly.")
-    else:
-        print("\n❌ Tests failed. There might be an issue with yt-dlp.") 
\ No newline at end of file
+
+def test_merge_falls_back_to_an_aac_transcode_when_copying_fails(tmp_path):
+    import types
+    import app_simple
+    for name in ('v.webm', 'a.m4a'):
+        (tmp_path / name).write_bytes(b'x')
+    toolchain = types.SimpleNamespace(ffmpeg='ffmpeg', yt_dlp=['yt-dlp'])
+    supervisor = FakeSupervisor(failing=('copy',))
+    downloader = app_simple.EnhancedYouTubeDownloader(toolchain=toolchain, supervisor=supervisor)
+
+    output, info = downloader.merge_streams(str(tmp_path / 'v.webm'), str(tmp_path / 'a.m4a'), str(tmp_path / 'out'))
+    assert output == str(tmp_path / 'out.mp4')
+    assert info['mode'] == 'transcode' and info['cpu_seconds'] == 0.75
+    copy_cmd, transcode_cmd = supervisor.commands
+    assert copy_cmd[-1] == str(tmp_path / 'out.mkv')
+    for cmd in (copy_cmd, transcode_cmd):
+        # Optional maps, so an input without the expected stream doesn't fail the merge
+        assert cmd[cmd.index('-map'):cmd.index('-map') + 4] == ['-map', '0:v:0?', '-map', '1:a:0?']
+
+    supervisor.failing = ('copy', 'aac')
+    assert downloader.merge_streams(str(tmp_path / 'v.webm'), str(tmp_path / 'a.m4a'), str(tmp_path / 'x')) == (None, None)
+
+
+def test_audio_format_id_downloads_audio_only(fake_youtube, tmp_path, monkeypatch):
+    import app_simple
+    from supervisor import ProcessResult
+    commands = []
+    downloader = app_simple.downloader
+    monkeypatch.setattr(downloader, 'extract_with_fallback', lambda url: fake_youtube.info('regress0005'))
+    monkeypatch.setattr(downloader, 'run_yt_dlp', lambda cmd, *args, **kwargs: commands.append(cmd) or
+                        ProcessResult(1, '', 'stopped by the test', None))
+    monkeypatch.setattr(downloader, 'fetch_streams', lambda *args, **kwargs: pytest.fail("fetched two streams"))
+
+    downloader.download_video('https://youtu.be/regress0005', '251', str(tmp_path), 'audio_job')
+    app_simple.storage.release('audio_job')
+    [cmd] = commands
+    assert cmd[cmd.index('-f') + 1] == '251' and '--extract-audio' in cmd
+
+
+def test_clients_are_told_apart_by_the_hop_our_proxy_added(monkeypatch):
+    import app_simple
+    seen = []
+    monkeypatch.setattr(app_simple, 'enqueue_download', lambda url, fmt, client_id: seen.append(client_id) or {})
+    client = app_simple.app.test_client()
+    for forwarded in ('1.1.1.1, 203.0.113.7', '2.2.2.2, 203.0.113.7'):
+        client.post('/api/download', json={'url': 'https://youtu.be/regress0006', 'quality_format_id': '18'},
+                    headers={'X-Forwarded-For': forwarded})
+    # The spoofable first hops differ, but both requests came through the proxy from one address
+    assert seen == ['203.0.113.7', '203.0.113.7']
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the extraction backends
+A stub yt_dlp module stands in for the in-process backend and small Python scripts for the
+yt-dlp command, so nothing reaches YouTube
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import types
+
+import pytest
+
+import extraction
+from extraction import ExtractionError, FallbackExtractor, InProcessExtractor, SubprocessExtractor
+
+
+class DownloadError(Exception):
+    pass
+
+
+class StubYoutubeDL:
+    """Answers extract_info from a {url: info or exception} table"""
+
+    created = []
+    responses = {}
+
+    def __init__(self, options):
+        self.options = options
+        StubYoutubeDL.created.append(self)
+
+    def extract_info(self, url, download=True, process=True):
+        response = self.responses[url]
+        if callable(response):
+            response = response()
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def sanitize_info(self, info):
+        return dict(info, sanitized=True)
+
+
+@pytest.fixture
+def stub_yt_dlp(monkeypatch):
+    StubYoutubeDL.created = []
+    StubYoutubeDL.responses = {}
+    module = types.SimpleNamespace(YoutubeDL=StubYoutubeDL, utils=types.SimpleNamespace(DownloadError=DownloadError))
+    monkeypatch.setitem(sys.modules, 'yt_dlp', module)
+    return StubYoutubeDL
+
+
+def test_instances_are_checked_out_and_returned(stub_yt_dlp):
+    extractor = InProcessExtractor(pool_size=1)
+    stub_yt_dlp.responses['https://v/1'] = {'id': '1'}
+    stub_yt_dlp.responses['https://v/gone'] = DownloadError("Video unavailable")
+
+    assert extractor.extract_info('https://v/1') == {'id': '1', 'sanitized': True}
+    with pytest.raises(ExtractionError):
+        extractor.extract_info('https://v/gone')
+    assert extractor.extract_info('https://v/1')['id'] == '1'
+    # The failed lookup gave its instance back, so one was enough; each client gets its own
+    assert len(stub_yt_dlp.created) == 1
+    extractor.extract_info('https://v/1', player_client='ios')
+    assert len(stub_yt_dlp.created) == 2
+    assert stub_yt_dlp.created[1].options['extractor_args'] == {'youtube': {'player_client': ['ios']}}
+
+
+def test_lookups_wait_for_a_pooled_instance(stub_yt_dlp):
+    extractor = InProcessExtractor(pool_size=1)
+    started, finish = threading.Event(), threading.Event()
+    stub_yt_dlp.responses['https://v/slow'] = lambda: started.set() or finish.wait(5) and {'id': 'slow'}
+    stub_yt_dlp.responses['https://v/fast'] = {'id': 'fast'}
+
+    results = []
+    slow = threading.Thread(target=lambda: results.append(extractor.extract_info('https://v/slow')))
+    slow.start()
+    started.wait(5)
+    waiting = threading.Thread(target=lambda: results.append(extractor.extract_info('https://v/fast')))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive() and not results
+    finish.set()
+    slow.join(5)
+    waiting.join(5)
+    assert [info['id'] for info in results] == ['slow', 'fast']
+    assert len(stub_yt_dlp.created) == 1
+
+
+class StubBackend:
+    def __init__(self, name, result=None, error=None, entries=(), fail_after=None):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.entries = entries
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def extract_info(self, url, player_client='web'):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+    async def extract_info_async(self, url, player_client='web'):
+        return self.extract_info(url, player_client)
+
+    def iter_entries(self, url):
+        for index, entry in enumerate(self.entries):
+            if index == self.fail_after:
+                raise self.error
+            yield entry
+
+
+def test_backend_failures_fall_back_but_unavailable_videos_do_not():
+    fallback = StubBackend('subprocess', result={'id': 'fallback'})
+    broken = FallbackExtractor(StubBackend('inprocess', error=RuntimeError("yt_dlp broke")), fallback)
+    assert broken.extract_info('https://v/1') == {'id': 'fallback'}
+    assert asyncio.run(broken.extract_info_async('https://v/1')) == {'id': 'fallback'}
+    assert broken.name == 'inprocess+subprocess'
+
+    unavailable = FallbackExtractor(StubBackend('inprocess', error=ExtractionError("Video unavailable")), fallback)
+    with pytest.raises(ExtractionError):
+        unavailable.extract_info('https://v/1')
+    with pytest.raises(ExtractionError):
+        asyncio.run(unavailable.extract_info_async('https://v/1'))
+    assert fallback.calls == 2
+
+
+def test_async_lookups_skip_a_primary_that_cannot_be_cancelled(stub_yt_dlp):
+    stub_yt_dlp.responses['https://v/1'] = {'id': 'inprocess'}
+    fallback = StubBackend('subprocess', result={'id': 'subprocess'})
+    extractor = FallbackExtractor(InProcessExtractor(), fallback)
+    assert asyncio.run(extractor.extract_info_async('https://v/1')) == {'id': 'subprocess'}
+    assert extractor.extract_info('https://v/1')['id'] == 'inprocess'
+    assert len(stub_yt_dlp.created) == 1  # only the synchronous lookup took an instance
+
+
+def test_playlist_resumes_on_the_fallback_without_repeats():
+    entries = [f"https://v/{index}" for index in range(5)]
+    primary = StubBackend('inprocess', entries=entries, error=RuntimeError("yt_dlp broke"), fail_after=2)
+    extractor = FallbackExtractor(primary, StubBackend('subprocess', entries=entries))
+    assert list(extractor.iter_entries('https://p/1')) == entries
+
+    primary = StubBackend('inprocess', entries=entries, error=ExtractionError("Playlist unavailable"), fail_after=2)
+    extractor = FallbackExtractor(primary, StubBackend('subprocess', entries=entries))
+    with pytest.raises(ExtractionError):
+        list(extractor.iter_entries('https://p/1'))
+
+
+def test_channel_tabs_are_flattened(stub_yt_dlp):
+    stub_yt_dlp.responses['https://c/1'] = {'_type': 'playlist', 'entries': [
+        {'_type': 'url', 'ie_key': 'YoutubeTab', 'url': 'https://c/1/videos'},
+        {'_type': 'url', 'ie_key': 'YoutubeTab', 'url': 'https://c/1/broken'},
+        {'_type': 'url', 'ie_key': 'Generic', 'url': 'https://elsewhere/x'},
+    ]}
+    stub_yt_dlp.responses['https://c/1/videos'] = {'_type': 'playlist', 'entries': [{'id': 'a'}, {'id': 'b'}]}
+    stub_yt_dlp.responses['https://c/1/broken'] = DownloadError("This channel has no tab")
+    stub_yt_dlp.responses['https://c/gone'] = DownloadError("Channel unavailable")
+
+    extractor = InProcessExtractor()
+    assert list(extractor.iter_entries('https://c/1')) == [
+        'https://www.youtube.com/watch?v=a', 'https://www.youtube.com/watch?v=b', 'https://elsewhere/x']
+    with pytest.raises(ExtractionError):
+        list(extractor.iter_entries('https://c/gone'))
+
+
+def script_toolchain(script):
+    """A toolchain whose yt-dlp command runs a Python script (arguments are ignored)"""
+    return types.SimpleNamespace(yt_dlp=[sys.executable, '-c', script])
+
+
+def test_subprocess_lookup_errors(monkeypatch):
+    extractor = SubprocessExtractor(toolchain=script_toolchain(f"print({json.dumps(json.dumps({'id': '1'}))})"))
+    assert extractor.extract_info('https://v/1') == {'id': '1'}
+    assert asyncio.run(extractor.extract_info_async('https://v/1')) == {'id': '1'}
+
+    failing = SubprocessExtractor(toolchain=script_toolchain("import sys; sys.exit('Video unavailable')"))
+    with pytest.raises(ExtractionError, match='Video unavailable'):
+        failing.extract_info('https://v/1')
+
+    def timeout(cmd, **kwargs):
+        raise subprocess.TimeoutExpired(cmd, kwargs['timeout'])
+    monkeypatch.setattr(extraction.subprocess, 'run', timeout)
+    with pytest.raises(ExtractionError, match='timed out'):
+        extractor.extract_info('https://v/1')
+
+
+def test_subprocess_entries_stream_and_report_failures():
+    lines = [json.dumps({'id': 'a'}), json.dumps({'ie_key': 'Generic', 'url': 'https://elsewhere/x'})]
+    script = f"print({json.dumps(chr(10).join(lines))})\nimport sys; sys.exit('playlist ended early')"
+    entries = SubprocessExtractor(toolchain=script_toolchain(script)).iter_entries('https://p/1')
+    assert next(entries) == 'https://www.youtube.com/watch?v=a'
+    assert next(entries) == 'https://elsewhere/x'
+    with pytest.raises(ExtractionError, match='playlist ended early'):
+        next(entries)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for serving finished downloads
+"""
+
+import os
+
+import pytest
+
+import app_simple
+
+
+@pytest.fixture
+def client():
+    return app_simple.app.test_client()
+
+
+@pytest.fixture
+def finished_job(tmp_path):
+    file_path = tmp_path / "job.mp4"
+    file_path.write_bytes(bytes(range(256)) * 40)
+    app_simple.update_job('delivery-test', {
+        'status': 'completed',
+        'file_path': str(file_path),
+        'filename': 'Some video.mp4'
+    }, progress=100)
+    yield file_path
+    app_simple.job_store.delete('delivery-test')
+
+
+def test_serves_file_as_attachment(client, finished_job):
+    response = client.get('/api/file/delivery-test')
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(os.path.getsize(finished_job))
+    assert 'filename="Some video.mp4"' in response.headers['Content-Disposition']
+    assert response.data == finished_job.read_bytes()
+
+
+def test_range_and_conditional_requests(client, finished_job):
+    response = client.get('/api/file/delivery-test', headers={'Range': 'bytes=1000-1999'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 1000-1999/{os.path.getsize(finished_job)}"
+    assert response.data == finished_job.read_bytes()[1000:2000]
+
+    etag = response.headers['ETag']
+    assert client.get('/api/file/delivery-test', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_missing_or_unfinished_downloads(client, finished_job):
+    assert client.get('/api/file/no-such-job').status_code == 404
+    os.remove(finished_job)
+    assert client.get('/api/file/delivery-test').status_code == 410
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the resource governor: bandwidth shares, rate files and merge slots
+"""
+
+import threading
+import time
+
+from governor import ResourceGovernor, TokenBucket, priority_class, read_rate_file
+
+MB = 1024 * 1024
+
+
+def test_audio_format_ids_are_classed_as_audio():
+    formats = [{'format_id': '251', 'vcodec': 'none', 'acodec': 'opus'},
+               {'format_id': '137', 'vcodec': 'avc1.640028', 'acodec': 'none'}]
+    assert priority_class('251', formats=formats) == priority_class('0') == 'audio'
+    assert priority_class('137', formats=formats) == 'video'
+    # Without the format table only '0' is known to be audio
+    assert priority_class('251') == 'video'
+    assert priority_class('251', batch=True, formats=formats) == 'batch'
+
+
+def test_token_bucket_paces_after_the_burst():
+    bucket = TokenBucket(rate=4 * MB)
+    started = time.monotonic()
+    bucket.consume(4 * MB)  # one second's worth is available up front
+    assert time.monotonic() - started < 0.1
+    bucket.consume(2 * MB)
+    assert 0.4 < time.monotonic() - started < 1
+
+    bucket.set_rate(None)
+    started = time.monotonic()
+    bucket.consume(100 * MB)
+    assert time.monotonic() - started < 0.1
+
+
+def test_bandwidth_is_shared_by_priority_and_rebalanced(tmp_path):
+    governor = ResourceGovernor(bandwidth_limit=12 * MB)
+    video = governor.start_transfers('v', ['video', 'audio'], 'video', rate_dir=str(tmp_path))
+    assert video['video'][0] == video['audio'][0] == 6 * MB
+    rate_file = video['video'][1]
+    assert read_rate_file(rate_file) == 6 * MB
+
+    # An audio job weighs twice a video job
+    assert governor.start_transfers('a', ['audio'], priority_class('0'))['audio'][0] == 8 * MB
+    assert read_rate_file(rate_file) == 2 * MB
+
+    # A finished stream's share moves to the job's other stream, and a finished job's to the rest
+    governor.finish_transfer('v', 'audio')
+    assert read_rate_file(rate_file) == 4 * MB
+    governor.release('a')
+    assert read_rate_file(rate_file) == 12 * MB
+    assert [t['rate'] for t in governor.allocations()['bandwidth']['transfers']] == [12 * MB]
+
+    governor.release('v')
+    assert governor.stats()['transfers'] == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fixed_rates_are_reserved_out_of_the_limit(tmp_path):
+    governor = ResourceGovernor(bandwidth_limit=12 * MB)
+    video = governor.start_transfers('v', ['video', 'audio'], 'video', rate_dir=str(tmp_path), fixed=['audio'])
+    assert video['audio'] == (6 * MB, None)
+    rate_file = video['video'][1]
+
+    # A new yt-dlp transfer gets part of what the adjustable one had; the started one keeps its rate
+    audio_rate = governor.start_transfers('a', ['audio'], 'audio')['audio'][0]
+    assert 4 * MB < audio_rate < 8 * MB
+    assert read_rate_file(rate_file) + audio_rate + 6 * MB <= 12 * MB
+    transfers = governor.allocations()['bandwidth']['transfers']
+    assert [(t['stream'], t['adjustable']) for t in transfers] == [('video', True), ('audio', False), ('audio', False)]
+
+    governor.finish_transfer('v', 'audio')
+    assert read_rate_file(rate_file) == 12 * MB - audio_rate
+    governor.release('a')
+    assert read_rate_file(rate_file) == 12 * MB
+
+
+def test_merge_slots_go_to_the_most_urgent_waiting_job():
+    governor = ResourceGovernor(max_merges=1)
+    order = []
+    release = threading.Event()
+
+    def merge(job_id, priority):
+        with governor.merge_slot(job_id, priority) as granted:
+            assert granted
+            order.append(job_id)
+            if job_id == 'first':
+                release.wait()
+
+    first = threading.Thread(target=merge, args=('first', 'video'))
+    first.start()
+    while not governor.stats()['merging']:
+        time.sleep(0.01)
+    waiting = []
+    for job_id, priority in [('batch', 'batch'), ('video', 'video')]:
+        waiting.append(threading.Thread(target=merge, args=(job_id, priority)))
+        waiting[-1].start()
+    while governor.stats()['merges_waiting'] < 2:
+        time.sleep(0.01)
+    assert [m['job_id'] for m in governor.allocations()['merges']['waiting']] == ['video', 'batch']
+
+    release.set()
+    for thread in [first, *waiting]:
+        thread.join(5)
+    assert order == ['first', 'video', 'batch']
+    assert governor.stats()['merges_waited'] == 2
+
+
+def test_cancelled_job_gives_up_waiting_for_a_merge_slot():
+    governor = ResourceGovernor(max_merges=1)
+    with governor.merge_slot('running', 'video'):
+        cancelled = threading.Event()
+        threading.Timer(0.1, cancelled.set).start()
+        with governor.merge_slot('waiting', 'video', is_cancelled=cancelled.is_set) as granted:
+            assert not granted
+    assert governor.stats()['merges_waiting'] == 0
+    with governor.merge_slot('next', 'video') as granted:
+        assert granted
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory and SQLite job stores
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from job_store import MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request):
+    if request.param == 'memory':
+        yield MemoryJobStore(finished_ttl=60)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        yield SQLiteJobStore(os.path.join(tmp, "jobs.db"), finished_ttl=60)
+
+
+def test_update_bumps_version_and_keeps_progress(store):
+    assert store.get("job") is None
+    store.update("job", {'status': 'downloading'}, progress=40)
+    store.update("job", {'status': 'downloading', 'stage': 'merging'})
+    job = store.get("job")
+    assert job == {'progress': 40, 'status': {'status': 'downloading', 'stage': 'merging'}, 'version': 2}
+
+
+def test_wait_wakes_on_update(store):
+    store.update("job", {'status': 'queued'})
+    threading.Timer(0.1, store.update, args=("job", {'status': 'completed'}, 100)).start()
+    start = time.time()
+    assert store.wait("job", 1, timeout=5) == 2
+    assert time.time() - start < 2
+
+
+def test_finished_jobs_expire(store):
+    store.finished_ttl = 0
+    store.update("done", {'status': 'completed'}, progress=100)
+    store.update("running", {'status': 'downloading'})
+    time.sleep(0.01)
+    assert store.purge_expired() == 1
+    assert store.get("done") is None
+    assert store.get("running") is not None
+
+
+def test_sqlite_is_shared_between_instances():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        writer, reader = SQLiteJobStore(path), SQLiteJobStore(path)
+        writer.update("job", {'status': 'downloading'}, progress=10)
+        assert reader.get("job")['progress'] == 10
+
+
+def test_cancel_is_flagged_only_for_unfinished_jobs(store):
+    store.save_spec("job", {'url': 'u'}, "owner")
+    assert not store.cancel_requested("job")
+    assert store.request_cancel("job") and store.request_cancel("job")
+    assert store.cancel_requested("job")
+    store.drop_spec("job")
+    assert not store.cancel_requested("job")
+    assert not store.request_cancel("job")
+    # Batches have no spec and are flagged regardless, until drop_spec clears the flag
+    assert store.request_cancel("batch", without_spec=True)
+    assert store.cancel_requested("batch")
+    store.drop_spec("batch")
+    assert not store.cancel_requested("batch")
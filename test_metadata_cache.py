@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the metadata cache (TTL, LRU eviction and the SQLite backend)
+"""
+
+import os
+import tempfile
+import time
+
+from metadata_cache import MetadataCache, trim_info
+
+
+def test_hit_and_miss_counters():
+    cache = MetadataCache(ttl=60, max_entries=4)
+    assert cache.get("dQw4w9WgXcQ") is None
+    cache.set("dQw4w9WgXcQ", {'title': 'Video'})
+    assert cache.get("dQw4w9WgXcQ") == {'title': 'Video'}
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = MetadataCache(ttl=0.05, max_entries=4)
+    cache.set("a", {'title': 'A'})
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = MetadataCache(ttl=60, max_entries=2)
+    cache.set("a", {'title': 'A'})
+    cache.set("b", {'title': 'B'})
+    cache.get("a")
+    cache.set("c", {'title': 'C'})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_sqlite_backend_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        MetadataCache(ttl=60, db_path=db_path).set("a", {'title': 'A'})
+        assert MetadataCache(ttl=60, db_path=db_path).get("a") == {'title': 'A'}
+
+
+def test_trim_info_drops_heavy_keys():
+    info = trim_info({'title': 'A', 'formats': [], 'subtitles': {'en': []}, 'thumbnails': []})
+    assert info == {'title': 'A', 'formats': []}
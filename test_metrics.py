@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus registry, stage timing and structured log lines
+"""
+
+import io
+import json
+
+import pytest
+
+from logs import configure_logging, get_logger
+from metrics import Counter, Gauge, Histogram, Registry, STAGE_ERRORS, STAGE_SECONDS, stage
+
+
+def test_registry_renders_text_format():
+    registry = Registry()
+    requests = registry.register(Counter('test_requests_total', 'Requests', ['route']))
+    registry.register(Gauge('test_depth', 'Queue depth', collect=lambda: {(): 3}))
+    latency = registry.register(Histogram('test_seconds', 'Latency', ['route'], buckets=(0.1, 1)))
+    requests.inc(route='/a "quoted"')
+    requests.inc(2, route='/a "quoted"')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, route='/a')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE test_requests_total counter' in lines
+    assert 'test_requests_total{route="/a \\"quoted\\""} 3' in lines
+    assert 'test_depth 3' in lines
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    with pytest.raises(ValueError):
+        requests.inc(path='/a')
+
+
+def test_stage_times_and_counts_failures():
+    before = (STAGE_SECONDS.count(stage='test_stage'), STAGE_ERRORS.value(stage='test_stage'))
+    with stage('test_stage'):
+        pass
+    with stage('test_stage') as handle:
+        handle.fail()
+    with pytest.raises(RuntimeError):
+        with stage('test_stage'):
+            raise RuntimeError("boom")
+    assert STAGE_SECONDS.count(stage='test_stage') == before[0] + 3
+    assert STAGE_ERRORS.value(stage='test_stage') == before[1] + 2
+
+
+@pytest.mark.parametrize('log_format', ['logfmt', 'json'])
+def test_structured_log_lines(log_format):
+    stream = io.StringIO()
+    configure_logging(level='INFO', log_format=log_format, stream=stream)
+    try:
+        log = get_logger('test')
+        log.debug("hidden", extra={'job': 'j1'})
+        log.info("Download completed", extra={'job': 'j1', 'file': '/tmp/a b.mp4'})
+    finally:
+        configure_logging()
+    line = stream.getvalue().strip()
+    assert '\n' not in line
+    if log_format == 'json':
+        record = json.loads(line)
+        assert (record['level'], record['msg'], record['job'], record['file']) == \
+            ('info', 'Download completed', 'j1', '/tmp/a b.mp4')
+    else:
+        assert 'level=info logger=ytdl.test msg="Download completed" job=j1 file="/tmp/a b.mp4"' in line
+
+
+def test_metrics_endpoint():
+    import app_simple
+    response = app_simple.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    for name in ('ytdl_queue_depth', 'ytdl_cache_lookups_total', 'ytdl_stage_duration_seconds',
+                 'ytdl_subprocess_spawns_total', 'ytdl_storage_used_bytes'):
+        assert f'# TYPE {name} ' in body
+    assert 'ytdl_cache_lookups_total{cache="metadata",result="hit"}' in body
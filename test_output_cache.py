@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed output cache
+"""
+
+import os
+import tempfile
+import time
+
+from output_cache import OutputCache
+
+
+def write_file(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+def test_store_and_lookup():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OutputCache(os.path.join(tmp, "cache"), max_bytes=1024)
+        key = OutputCache.key("dQw4w9WgXcQ", "137", "stream-copy")
+        assert cache.lookup(key) is None
+
+        cached_path = cache.store(key, write_file(tmp, "job_1.mp4", 100), "Video.mp4")
+        assert cache.lookup(key) == (cached_path, "Video.mp4")
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_keys_differ_by_format_and_mode():
+    assert OutputCache.key("a", "137", "stream-copy") != OutputCache.key("a", "22", "stream-copy")
+    assert OutputCache.key("a", "0", "audio-mp3") != OutputCache.key("a", "0", "stream-copy")
+
+
+def test_least_recently_used_entry_is_evicted_over_quota():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OutputCache(os.path.join(tmp, "cache"), max_bytes=250)
+        cache.store("old", write_file(tmp, "a", 100), "a.mp4")
+        cache.store("used", write_file(tmp, "b", 100), "b.mp4")
+        past = time.time() - 100
+        os.utime(os.path.join(cache.root, "old"), (past, past))
+        os.utime(os.path.join(cache.root, "used"), (past + 1, past + 1))
+
+        cache.store("new", write_file(tmp, "c", 100), "c.mp4")
+        assert cache.lookup("old") is None
+        assert cache.lookup("used") is not None
+        assert cache.lookup("new") is not None
+
+
+def test_identical_requests_coalesce():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OutputCache(tmp)
+        assert cache.begin("key", "job_1") is None
+        assert cache.begin("key", "job_2") == "job_1"
+        cache.finish("key")
+        assert cache.begin("key", "job_3") is None
+
+
+def test_recently_used_entries_survive_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OutputCache(os.path.join(tmp, "cache"), max_bytes=1024)
+        cache.store("served", write_file(tmp, "a", 100), "a.mp4")
+        past = time.time() - 100
+        os.utime(os.path.join(cache.root, "served"), (past, past))
+
+        # A file handed out by lookup() is still there when the response opens it
+        file_path, _ = cache.lookup("served")
+        assert cache.evict(max_bytes=0) == 100
+        assert os.path.exists(file_path)
+
+        os.utime(os.path.join(cache.root, "served"), (past, past))
+        assert cache.evict(max_bytes=0) == 0
+        assert not os.path.exists(file_path)
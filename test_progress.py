@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Tests for progress-template parsing and per-job aggregation
+"""
+
+from progress import JobProgress, parse_progress_line
+
+
+def test_parse_progress_line():
+    values = parse_progress_line("[progress] 1024 4096 NA 512.5 6\n")
+    assert values == {'downloaded_bytes': 1024, 'total_bytes': 4096, 'speed': 512.5, 'eta': 6}
+
+
+def test_parse_uses_estimate_when_total_is_unknown():
+    assert parse_progress_line("[progress] 10 NA 100.0 NA NA")['total_bytes'] == 100
+
+
+def test_parse_ignores_other_output():
+    assert parse_progress_line("[download] Destination: video.mp4") is None
+
+
+def test_percent_is_byte_weighted_across_streams():
+    progress = JobProgress(['video', 'audio'])
+    progress.update('video', {'downloaded_bytes': 900, 'total_bytes': 900})
+    assert progress.percent() == 45  # audio size unknown yet: average of stream fractions
+
+    progress.update('audio', {'downloaded_bytes': 0, 'total_bytes': 100})
+    assert progress.percent() == 81
+
+    progress.set_stage('merging')
+    assert progress.percent() == 90
+    progress.set_stage('completed')
+    assert progress.percent() == 100
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the progress endpoints: Server-Sent Events, long-polling and conditional polls
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+import app_simple
+
+
+@pytest.fixture
+def client():
+    return app_simple.app.test_client()
+
+
+@pytest.fixture
+def job():
+    app_simple.update_job('events-test', {'status': 'downloading'}, progress=10)
+    yield 'events-test'
+    app_simple.job_store.delete('events-test')
+
+
+def test_event_stream_sends_changes_until_the_job_finishes(client, job):
+    threading.Timer(0.2, app_simple.update_job, args=(job, {'status': 'completed', 'filename': 'a.mp4'}, 100)).start()
+    response = client.get(f'/api/progress/{job}/events')
+    assert response.mimetype == 'text/event-stream'
+    events = [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+              if line.startswith('data: ')]
+    response.close()
+    assert [event['status']['status'] for event in events] == ['downloading', 'completed']
+    assert app_simple.progress_waiters.stats()['waiting'] == 0
+
+
+def test_long_poll_returns_on_change_or_after_wait(client, job):
+    version = client.get(f'/api/progress/{job}').get_json()['version']
+    threading.Timer(0.2, app_simple.update_job, args=(job, {'status': 'downloading'}, 50)).start()
+    started = time.monotonic()
+    changed = client.get(f'/api/progress/{job}?since={version}&wait=5').get_json()
+    assert changed['progress'] == 50 and changed['version'] > version
+    assert time.monotonic() - started < 2
+
+    started = time.monotonic()
+    unchanged = client.get(f"/api/progress/{job}?since={changed['version']}&wait=0.3").get_json()
+    assert unchanged['version'] == changed['version'] and time.monotonic() - started >= 0.3
+
+
+def test_unchanged_progress_is_a_304(client, job):
+    response = client.get(f'/api/progress/{job}')
+    etag = response.headers['ETag']
+    assert client.get(f'/api/progress/{job}', headers={'If-None-Match': etag}).status_code == 304
+    app_simple.update_job(job, {'status': 'downloading'}, progress=20)
+    assert client.get(f'/api/progress/{job}', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_waiters_over_the_cap_are_answered_right_away(client, job, monkeypatch):
+    monkeypatch.setattr(app_simple.progress_waiters, 'max_waiters', 0)
+    response = client.get(f'/api/progress/{job}/events')
+    assert response.status_code == 503 and response.headers['Retry-After']
+
+    version = client.get(f'/api/progress/{job}').get_json()['version']
+    started = time.monotonic()
+    assert client.get(f'/api/progress/{job}?since={version}&wait=5').get_json()['version'] == version
+    assert time.monotonic() - started < 1
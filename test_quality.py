@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for quality-option selection
+"""
+
+import pytest
+
+from quality import QualityOption, make_ranker, select_quality_options
+
+FORMATS = [
+    {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none'},
+    {'format_id': '243', 'vcodec': 'vp9', 'acodec': 'none', 'height': 360, 'fps': 30, 'filesize': 5_000_000},
+    {'format_id': '134', 'vcodec': 'avc1.4d401e', 'acodec': 'none', 'height': 360, 'fps': 30, 'filesize': 9_000_000},
+    {'format_id': '18', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360, 'fps': 30, 'filesize': 12_000_000},
+    {'format_id': '298', 'vcodec': 'avc1.4d4020', 'acodec': 'none', 'height': 720, 'fps': 60, 'filesize': 80_000_000},
+    {'format_id': '302', 'vcodec': 'vp9', 'acodec': 'none', 'height': 720, 'fps': 60, 'filesize': 60_000_000},
+    {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 129.5, 'filesize': 3_000_000},
+    {'format_id': '251', 'vcodec': 'none', 'acodec': 'opus', 'abr': 135.1, 'filesize': 3_200_000},
+]
+
+
+def ids(options):
+    return [option.format_id for option in options]
+
+
+def test_best_format_per_height_and_fps_with_default_criteria():
+    options = select_quality_options(FORMATS)
+    # Combined wins at 360p even though it came last; h264 wins at 720p60; best audio last
+    assert ids(options) == ['298', '18', '251']
+    assert options[0] == QualityOption('298', 720, 60, 76.3, '720p@60fps', False, 'avc1.4d4020', 'none')
+    assert options[-1].display == 'Audio Only (135.1kbps)'
+
+
+def test_criteria_are_configurable():
+    by_size = select_quality_options(FORMATS, make_ranker(('size',)))
+    assert ids(by_size) == ['302', '243', '251']
+    by_codec_then_size = select_quality_options(FORMATS, make_ranker(('codec', 'size')))
+    assert ids(by_codec_then_size) == ['298', '134', '251']
+
+
+def test_result_does_not_depend_on_format_order():
+    assert ids(select_quality_options(FORMATS)) == ids(select_quality_options(list(reversed(FORMATS))))
+
+
+def test_unknown_criteria_are_rejected():
+    with pytest.raises(ValueError, match="resolution"):
+        make_ranker(('codec', 'resolution'))
+
+
+def test_to_dict_keeps_the_api_fields():
+    option = select_quality_options(FORMATS)[1]
+    assert option.to_dict() == {
+        'format_id': '18', 'height': 360, 'fps': 30, 'size_mb': 11.4, 'display': '360p@30fps',
+        'is_combined': True, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2',
+    }
+    assert not hasattr(option, '__dict__')
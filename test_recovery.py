@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for leasing and resuming jobs left behind by dead workers
+"""
+
+import time
+
+import pytest
+
+from job_store import MemoryJobStore, SQLiteJobStore
+from recovery import JobRecovery
+from scheduler import QueueFullError
+
+SPEC = {'url': 'https://youtu.be/abcdefghijk', 'quality_format_id': '137', 'client_id': 'c'}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+def test_orphans_are_claimed_once(store):
+    store.save_spec('job1', SPEC, 'dead-worker')
+    assert store.claim_orphaned_specs('worker-a', lease=60, limit=5) == []
+
+    time.sleep(0.05)
+    assert store.claim_orphaned_specs('worker-a', lease=0.01, limit=5) == [('job1', SPEC, 2)]
+    assert store.claim_orphaned_specs('worker-b', lease=60, limit=5) == []
+
+
+def test_renewed_and_dropped_specs_are_not_claimed(store):
+    store.save_spec('alive', SPEC, 'worker-a')
+    store.save_spec('done', SPEC, 'worker-a')
+    store.drop_spec('done')
+    time.sleep(0.1)
+    store.renew_specs('worker-a')
+    assert store.claim_orphaned_specs('worker-b', lease=0.05, limit=5) == []
+
+
+def test_recovery_resubmits_and_gives_up(store):
+    resubmitted = []
+    given_up = []
+    recovery = JobRecovery(store, resubmit=lambda job_id, spec: resubmitted.append(job_id),
+                           on_give_up=given_up.append, owner='worker-b', lease=0.01, max_attempts=2)
+    store.save_spec('job1', SPEC, 'dead-worker')
+    time.sleep(0.05)
+    assert recovery.run_once() == ['job1']
+    assert resubmitted == ['job1']
+
+    # worker-b dies too; the next claim exceeds max_attempts
+    recovery.owner = 'worker-c'
+    time.sleep(0.05)
+    assert recovery.run_once() == []
+    assert given_up == ['job1']
+    assert store.claim_orphaned_specs('worker-d', lease=0, limit=5) == []
+
+
+def test_full_queue_releases_the_claim(store):
+    def resubmit(job_id, spec):
+        raise QueueFullError("full")
+
+    recovery = JobRecovery(store, resubmit=resubmit, owner='worker-b', lease=60)
+    store.save_spec('job1', SPEC, 'dead-worker')
+    store.release_spec('job1')
+    assert recovery.run_once() == []
+    assert [job_id for job_id, _, _ in store.claim_orphaned_specs('worker-c', lease=60, limit=5)] == ['job1']
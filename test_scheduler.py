@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded download scheduler
+"""
+
+import threading
+import time
+
+import pytest
+
+from scheduler import DownloadScheduler, QueueFullError
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+def test_round_robin_across_clients():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=10)
+    release = threading.Event()
+    order = []
+
+    scheduler.submit("blocker", "blocker", release.wait)
+    wait_until(lambda: scheduler.stats()['running'] == 1)
+    for job_id, client in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]:
+        scheduler.submit(client, job_id, order.append, job_id)
+
+    assert scheduler.position("a1") == 1
+    assert scheduler.position("b1") == 2
+    assert scheduler.position("a3") == 4
+    assert scheduler.position("blocker") is None
+
+    release.set()
+    wait_until(lambda: len(order) == 4)
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_queue_full_is_rejected():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=1)
+    release = threading.Event()
+    scheduler.submit("c", "running", release.wait)
+    wait_until(lambda: scheduler.stats()['running'] == 1)
+    scheduler.submit("c", "queued", lambda: None)
+
+    with pytest.raises(QueueFullError):
+        scheduler.submit("c", "rejected", lambda: None)
+    release.set()
+
+
+def test_one_client_cannot_fill_the_queue():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=10, max_queue_per_client=2)
+    release = threading.Event()
+    scheduler.submit("a", "blocker", release.wait)
+    wait_until(lambda: scheduler.is_running("blocker"))
+    scheduler.submit("a", "a1", lambda: None)
+    scheduler.submit("a", "a2", lambda: None, priority=1)
+
+    with pytest.raises(QueueFullError, match="already have 2"):
+        scheduler.submit("a", "a3", lambda: None)
+    scheduler.submit("b", "b1", lambda: None)
+    # A finished or cancelled wait frees the client's slot
+    scheduler.cancel("a1")
+    scheduler.submit("a", "a3", lambda: None)
+    release.set()
+    wait_until(lambda: scheduler.stats()['queued'] == 0)
+    scheduler.submit("a", "a4", lambda: None)
+
+
+def test_cancel_removes_only_waiting_jobs():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=10)
+    release = threading.Event()
+    order = []
+
+    scheduler.submit("a", "blocker", release.wait)
+    wait_until(lambda: scheduler.is_running("blocker"))
+    scheduler.submit("a", "a1", order.append, "a1")
+    scheduler.submit("b", "b1", order.append, "b1")
+
+    assert scheduler.cancel("blocker") is None
+    assert scheduler.cancel("b1") == (order.append, ("b1",))
+    assert scheduler.stats()['queued'] == 1 and scheduler.stats()['clients_waiting'] == 1
+    release.set()
+    wait_until(lambda: order == ["a1"])
+
+
+def test_more_urgent_classes_run_first():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=10)
+    release = threading.Event()
+    order = []
+
+    scheduler.submit("a", "blocker", release.wait)
+    wait_until(lambda: scheduler.is_running("blocker"))
+    scheduler.submit("a", "batch", order.append, "batch", priority=2)
+    scheduler.submit("a", "video", order.append, "video", priority=1)
+    scheduler.submit("b", "audio", order.append, "audio", priority=0)
+    scheduler.submit("a", "video2", order.append, "video2", priority=1)
+
+    assert scheduler.position("audio") == 1 and scheduler.position("batch") == 4
+    assert scheduler.stats()['queued_by_priority'] == {0: 1, 1: 2, 2: 1}
+    release.set()
+    wait_until(lambda: len(order) == 4)
+    assert order == ["audio", "video", "video2", "batch"]
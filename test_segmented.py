@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for segmented multi-connection fetching against the local fixture server
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from fixture_server import FixtureServer, fixture_bytes
+from progress import parse_progress_line
+from segmented import SegmentedFetcher, SegmentError, can_segment, segmented_command
+from supervisor import ProcessSupervisor
+
+DATA = fixture_bytes(6 * 1024 * 1024 + 12345)
+
+
+def serve(**options):
+    return FixtureServer({'/video.mp4': (DATA, 'video/mp4')}, **options)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_parts_are_fetched_concurrently_and_reassembled(tmp_path):
+    with serve() as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "video.mp4"),
+                                   connections=3, initial_connections=3)
+        assert fetcher.fetch() == len(DATA)
+        requests = server.httpd.requests
+    assert read(tmp_path / "video.mp4") == DATA
+    assert fetcher.peak_connections == 3
+    # Connections are kept alive across parts
+    assert fetcher.pool.created <= 3 < requests
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+def test_dropped_parts_are_retried_from_where_they_stopped(tmp_path):
+    with serve(fail_requests=3) as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "video.mp4"), connections=2)
+        fetcher.fetch()
+    assert read(tmp_path / "video.mp4") == DATA
+    assert fetcher.retried >= 2
+
+
+def test_first_part_stalling_is_retried(tmp_path):
+    with serve(stall_requests=1, stall_seconds=10) as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "video.mp4"), timeout=0.5)
+        started = time.monotonic()
+        fetcher.fetch()
+    assert time.monotonic() - started < 5
+    assert read(tmp_path / "video.mp4") == DATA
+    assert fetcher.retried == 1
+
+
+def test_interrupted_fetch_resumes_from_its_temp_file(tmp_path):
+    half = len(DATA) // 2
+    path = tmp_path / "video.mp4"
+    with open(f"{path}.part", 'wb') as f:
+        f.write(DATA[:half] + bytes(len(DATA) - half))
+    with open(f"{path}.part.ranges", 'w') as f:
+        json.dump({'total': len(DATA), 'done': [[0, half - 1]]}, f)
+
+    with serve() as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(path), connections=2)
+        assert fetcher.fetch() == len(DATA)
+        assert (fetcher.resumed, fetcher.downloaded - fetcher.resumed) == (half, len(DATA) - half)
+        assert read(path) == DATA and os.listdir(tmp_path) == ["video.mp4"]
+
+        # A finished file isn't fetched again
+        requests = server.httpd.requests
+        assert SegmentedFetcher(server.url('/video.mp4'), str(path)).fetch() == len(DATA)
+        assert server.httpd.requests == requests
+
+
+def test_server_without_ranges_gets_one_connection(tmp_path):
+    with serve(ranges=False) as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "video.mp4"), connections=4)
+        fetcher.fetch()
+    assert read(tmp_path / "video.mp4") == DATA
+    assert fetcher.peak_connections == 1
+
+
+def test_rate_file_caps_all_connections_together(tmp_path):
+    rate_file = tmp_path / "video.rate"
+    rate_file.write_text(str(2 * 1024 * 1024))
+    with serve() as server:
+        fetcher = SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "video.mp4"), connections=4,
+                                   rate_file=str(rate_file))
+        started = time.monotonic()
+        fetcher.fetch()
+    # One second's burst, then 2MB/s for the remaining ~4MB
+    assert time.monotonic() - started > 1.5
+    assert read(tmp_path / "video.mp4") == DATA
+
+
+def test_oversized_and_failing_fetches_leave_no_files(tmp_path):
+    with serve(fail_requests=100) as server:
+        with pytest.raises(SegmentError, match="max-filesize"):
+            SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "a.mp4"), max_bytes=1024).fetch()
+        with pytest.raises(SegmentError, match="attempts"):
+            SegmentedFetcher(server.url('/video.mp4'), str(tmp_path / "b.mp4"), retries=1).fetch()
+        with pytest.raises(SegmentError, match="404"):
+            SegmentedFetcher(server.url('/missing.mp4'), str(tmp_path / "c.mp4")).fetch()
+    assert os.listdir(tmp_path) == []
+
+
+def test_command_reports_progress_like_yt_dlp(tmp_path):
+    with serve(rate=4 * 1024 * 1024) as server:
+        fmt = {'url': server.url('/video.mp4'), 'protocol': 'http', 'filesize': len(DATA),
+               'http_headers': {'User-Agent': 'test-agent'}}
+        assert can_segment(fmt, len(DATA)) and not can_segment(fmt, len(DATA) + 1)
+        assert not can_segment({**fmt, 'protocol': 'http_dash_segments', 'fragments': [{}]}, 0)
+
+        updates = []
+        result = ProcessSupervisor().run(segmented_command(fmt, "video.mp4", 4), cwd=str(tmp_path), timeout=60,
+                                         on_output=lambda line: updates.append(parse_progress_line(line)))
+    assert result.returncode == 0, result.stderr
+    assert read(tmp_path / "video.mp4") == DATA
+    progress = [values for values in updates if values]
+    assert progress[-1]['downloaded_bytes'] == progress[-1]['total_bytes'] == len(DATA)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for per-job working directories, disk quotas and the janitor sweep
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from output_cache import OutputCache
+from storage import JobLock, StorageManager, StorageQuotaError
+from supervisor import ProcessSupervisor
+
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    for name in os.listdir(path):
+        os.utime(os.path.join(path, name), (past, past))
+    os.utime(path, (past, past))
+
+
+def test_jobs_get_isolated_directories_removed_on_release(tmp_path):
+    storage = StorageManager(str(tmp_path / "jobs"))
+    first, second = storage.acquire('job1'), storage.acquire('job2')
+    assert first != second and os.path.isdir(first)
+    write(os.path.join(first, 'job1_video.mp4.part'), 10)
+    write(os.path.join(second, 'job2.mp3'), 10)
+
+    storage.release('job1')
+    storage.release('job2', keep=os.path.join(second, 'job2.mp3'))
+    assert not os.path.exists(first)
+    assert os.listdir(second) == ['job2.mp3']
+    assert storage.stats()['active_jobs'] == 0
+
+
+def test_reserve_enforces_job_and_global_quotas(tmp_path):
+    storage = StorageManager(str(tmp_path / "jobs"), max_bytes=1000, job_max_bytes=600)
+    with pytest.raises(StorageQuotaError):
+        storage.reserve('big', 700)
+
+    storage.acquire('a')
+    storage.reserve('a', 600)
+    with pytest.raises(StorageQuotaError):
+        storage.reserve('b', 500)
+    storage.release('a')
+    storage.reserve('b', 500)
+    assert storage.stats()['reserved_bytes'] == 500
+    assert storage.stats()['rejected'] == 2
+
+
+def test_reserve_evicts_idle_directories_and_cache_entries_to_make_room(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    write(tmp_path / "done.mp4", 300)
+    cache.store('key', str(tmp_path / "done.mp4"), 'done.mp4')
+    age(os.path.join(cache.root, 'key'), 120)  # entries used in the last few seconds are never evicted
+    storage = StorageManager(str(tmp_path / "jobs"), max_bytes=1000, idle_after=60, output_cache=cache)
+
+    leftover = storage.acquire('crashed')
+    write(os.path.join(leftover, 'crashed_video.webm.part'), 400)
+    storage.release('crashed', keep=os.path.join(leftover, 'crashed_video.webm.part'))
+    age(leftover, 120)
+    running = storage.acquire('running')
+    storage.reserve('running', 200)
+    write(os.path.join(running, 'running_audio.m4a.part'), 200)
+
+    storage.reserve('new', 700)
+    assert not os.path.exists(leftover)
+    assert os.path.exists(running)
+    assert cache.lookup('key') is None
+    assert storage.stats()['evicted_dirs'] == 1
+
+
+def test_admission_uses_running_totals_instead_of_scanning(tmp_path, monkeypatch):
+    storage = StorageManager(str(tmp_path / "jobs"), max_bytes=1000, idle_after=60)
+    leftover = os.path.join(storage.root, 'leftover')
+    os.makedirs(leftover)
+    write(os.path.join(leftover, 'file.mp4'), 300)
+    storage.sweep()
+
+    monkeypatch.setattr(storage, 'sweep', lambda target=None: pytest.fail("admission scanned the disk"))
+    storage.acquire('a')
+    storage.reserve('a', 600)
+    with pytest.raises(StorageQuotaError):
+        storage.reserve('b', 200)  # the leftover is recent, so it can't be evicted
+    storage.release('a', keep=None)
+    storage.reserve('b', 600)
+    assert storage.stats()['reserved_bytes'] == 600
+
+    # A kept file counts until the janitor removes it
+    storage.acquire('b')
+    write(os.path.join(storage.root, 'b', 'b.mp4'), 100)
+    storage.release('b', keep=os.path.join(storage.root, 'b', 'b.mp4'))
+    with pytest.raises(StorageQuotaError):
+        storage.reserve('c', 650)
+    storage.reserve('c', 600)
+
+
+def test_sweep_expires_old_idle_directories_only(tmp_path):
+    storage = StorageManager(str(tmp_path / "jobs"), max_age=3600, idle_after=60)
+    old = os.path.join(storage.root, 'old')
+    recent = os.path.join(storage.root, 'recent')
+    for path in (old, recent):
+        os.makedirs(path)
+        write(os.path.join(path, 'file.mp4'), 50)
+    age(old, 7200)
+    active = storage.acquire('active')
+    write(os.path.join(active, 'file.mp4'), 25)
+    age(active, 7200)
+
+    assert storage.sweep() == 75
+    assert sorted(os.listdir(storage.root)) == ['active', 'recent']
+    stats = storage.stats()
+    assert (stats['jobs_bytes'], stats['evicted_bytes']) == (75, 50)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="flock is POSIX only")
+def test_job_lock_stops_writers_left_by_a_dead_worker(tmp_path):
+    dead_worker_lock = JobLock(str(tmp_path))
+    assert dead_worker_lock.acquire()
+    supervisor = ProcessSupervisor()
+    supervisor.share_lock('job', dead_worker_lock)
+    check = f"import os; os.fstat({dead_worker_lock.fd})"
+    assert supervisor.run([sys.executable, '-c', check], job_id='job').returncode == 0
+
+    # A writer outlives its worker, still holding the inherited lock
+    leftover = subprocess.Popen([sys.executable, '-c', "import time; time.sleep(60)"],
+                                pass_fds=(dead_worker_lock.fd,), start_new_session=True)
+    dead_worker_lock.record(leftover.pid)
+    dead_worker_lock.release()
+
+    resumed = JobLock(str(tmp_path))
+    assert resumed.acquire(timeout=10, kill_grace=1)
+    assert leftover.wait(5) != 0
+    assert resumed._groups() == []
+    resumed.release()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for stream-while-downloading delivery
+"""
+
+import sys
+import time
+
+import pytest
+
+from streaming import (MediaStream, StreamLimiter, StreamSlotsExhaustedError, StreamUnavailableError,
+                       build_stream_command, select_stream_formats, stream_container)
+
+INFO = {'formats': [
+    {'format_id': '140', 'url': 'https://a/140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 129},
+    {'format_id': '251', 'url': 'https://a/251', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+    {'format_id': '137', 'url': 'https://v/137', 'vcodec': 'avc1.640028', 'acodec': 'none'},
+    {'format_id': '248', 'url': 'https://v/248', 'vcodec': 'vp9', 'acodec': 'none'},
+    {'format_id': '18', 'url': 'https://v/18', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2'},
+]}
+
+
+def test_audio_is_matched_to_the_video_container():
+    video, audio = select_stream_formats(INFO, '137')
+    assert (video['format_id'], audio['format_id']) == ('137', '140')
+    assert stream_container(video, audio)[:2] == ('mp4', 'video/mp4')
+
+    video, audio = select_stream_formats(INFO, '248')
+    assert audio['format_id'] == '251'
+    assert stream_container(video, audio)[0] == 'webm'
+
+    assert select_stream_formats(INFO, '18') == (INFO['formats'][4], None)
+    with pytest.raises(StreamUnavailableError):
+        select_stream_formats(INFO, '999')
+
+
+def test_command_remuxes_both_inputs_to_stdout():
+    video, audio = select_stream_formats(INFO, '137')
+    cmd = build_stream_command('ffmpeg', video, audio, 'UA')
+    assert cmd[cmd.index('-i') + 1] == 'https://v/137'
+    assert ['-map', '0:v:0', '-map', '1:a:0', '-c', 'copy'] == cmd[cmd.index('-map'):cmd.index('copy') + 1]
+    assert 'frag_keyframe+empty_moov+default_base_moof' in cmd
+    assert cmd[-1] == 'pipe:1'
+    # A stalled upstream fails the read instead of blocking FFmpeg forever
+    assert cmd[cmd.index('-rw_timeout') + 1] == '30000000'
+
+
+def test_stream_yields_bounded_chunks_and_releases_once():
+    closed = []
+    script = "import sys; sys.stdout.buffer.write(b'x' * 300000)"
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=65536, on_close=lambda: closed.append(1))
+    chunks = list(stream)
+    assert sum(map(len, chunks)) == 300000
+    assert max(map(len, chunks)) <= 65536
+    stream.close()
+    stream.close()
+    assert closed == [1]
+
+
+def test_closing_early_kills_the_process():
+    script = "import sys\nwhile True: sys.stdout.buffer.write(b'x' * 65536)"
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=1024)
+    assert stream.close() != 0
+
+
+def test_empty_output_is_an_error():
+    closed = []
+    with pytest.raises(StreamUnavailableError):
+        MediaStream([sys.executable, '-c', 'pass'], on_close=lambda: closed.append(1))
+    assert closed == [1]
+
+
+def test_limiter_rejects_when_full():
+    limiter = StreamLimiter(max_streams=1)
+    limiter.acquire()
+    with pytest.raises(StreamSlotsExhaustedError):
+        limiter.acquire()
+    limiter.release()
+    limiter.acquire()
+
+
+def test_stalled_stream_is_killed_and_released():
+    closed = []
+    script = "import sys, time\nsys.stdout.buffer.write(b'x' * 1024); sys.stdout.flush(); time.sleep(60)"
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=1024, stall_timeout=0.5, check_interval=0.1,
+                         on_close=lambda: closed.append(1))
+    started = time.monotonic()
+    assert sum(map(len, stream)) == 1024
+    assert time.monotonic() - started < 10 and stream.reason == 'stalled'
+    stream.close()
+    assert closed == [1]
+
+    # Also before the first chunk, which is read before the response starts
+    with pytest.raises(StreamUnavailableError):
+        MediaStream([sys.executable, '-c', "import time; time.sleep(60)"], stall_timeout=0.5, check_interval=0.1,
+                    on_close=lambda: closed.append(2))
+    assert closed == [1, 2]
+
+
+def test_slow_client_is_not_a_stall():
+    script = "import sys\nwhile True: sys.stdout.buffer.write(b'x' * 1024)"
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=1024, stall_timeout=0.3, check_interval=0.1)
+    chunks = iter(stream)
+    next(chunks)
+    time.sleep(0.8)  # the client reads nothing; FFmpeg blocks on the full pipe
+    next(chunks)
+    assert stream.reason is None
+    stream.close()
+
+
+def test_deadline_and_cancel_end_the_stream():
+    script = "import sys\nwhile True: sys.stdout.buffer.write(b'x' * 1024)"
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=1024, timeout=0.3, check_interval=0.1)
+    for _ in stream:
+        pass
+    assert stream.reason == 'timeout'
+    stream.close()
+
+    limiter = StreamLimiter(max_streams=1)
+    limiter.acquire()
+    stream = MediaStream([sys.executable, '-c', script], chunk_size=1024,
+                         on_close=lambda: limiter.release(stream.stream_id))
+    limiter.register(stream)
+    assert limiter.cancel(stream.stream_id) and not limiter.cancel('unknown')
+    for _ in stream:
+        pass
+    stream.close()
+    assert limiter.stats()['stopped']['cancelled'] == 1 and limiter.stats()['active'] == 0
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for supervised processes: pipe draining, deadlines, stall detection and cancellation
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from supervisor import ProcessSupervisor, RingBuffer
+
+
+def python(script):
+    return [sys.executable, '-c', script]
+
+
+def alive(pid):
+    """Whether pid is running; an exited child nobody has reaped yet (a zombie) is not"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return True
+
+
+def test_ring_buffer_keeps_the_tail():
+    buffer = RingBuffer(size=4)
+    buffer.write(b'abc')
+    buffer.write(b'def')
+    assert buffer.text() == 'cdef' and buffer.total == 6
+
+
+def test_chatty_stderr_cannot_block_stdout():
+    # 4MB on stderr would fill the pipe and hang a reader that only drains stdout
+    script = ("import sys\n"
+              "for i in range(4):\n"
+              "    sys.stderr.write('x' * 1024 * 1024)\n"
+              "    print(f'line {i}', flush=True)\n")
+    lines = []
+    result = ProcessSupervisor(buffer_size=1024).run(python(script), timeout=30, on_output=lines.append)
+    assert result.returncode == 0 and result.reason is None
+    assert lines == [f'line {i}\n' for i in range(4)]
+    assert len(result.stderr) == 1024
+
+
+def test_silent_process_is_killed_as_stalled():
+    started = time.monotonic()
+    result = ProcessSupervisor().run(python("import time; time.sleep(30)"), stall_timeout=0.5)
+    assert result.reason == 'stalled' and result.returncode != 0
+    assert time.monotonic() - started < 10
+
+
+def test_deadline_kills_a_busy_process():
+    script = "import time\nwhile True:\n    print('.', flush=True)\n    time.sleep(0.05)\n"
+    result = ProcessSupervisor().run(python(script), timeout=0.5, stall_timeout=5)
+    assert result.reason == 'timeout'
+    assert result.stdout.startswith('.')
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="checks the process group with os.kill")
+def test_cancel_kills_the_whole_process_group(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    # The child starts a grandchild (as yt-dlp starts FFmpeg) and waits on it
+    script = ("import subprocess, sys\n"
+              "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+              f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+              "child.wait()\n")
+    supervisor = ProcessSupervisor()
+    threading.Thread(target=lambda: (time.sleep(0.5), supervisor.cancel('job'))).start()
+    result = supervisor.run(python(script), job_id='job')
+    assert result.reason == 'cancelled'
+
+    grandchild = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while alive(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(grandchild)
+
+    # Later stages of a cancelled job don't start at all
+    assert supervisor.run(python("print('hi')"), job_id='job').returncode is None
+    supervisor.forget('job')
+    assert supervisor.run(python("print('hi')"), job_id='job').stdout == 'hi\n'
+    assert supervisor.stats() == {'running': 0, 'jobs': 0, 'kills': {'timeout': 0, 'stalled': 0, 'cancelled': 1}}
+
+
+def test_cancel_recorded_elsewhere_is_polled():
+    requested = set()
+    supervisor = ProcessSupervisor(is_cancelled=lambda job_id: job_id in requested)
+    threading.Timer(0.2, requested.add, args=('job',)).start()
+    result = supervisor.run(python("import time; time.sleep(30)"), job_id='job')
+    assert result.reason == 'cancelled'
+
+
+def test_stall_check_can_be_turned_off_while_a_quiet_step_runs():
+    # Like yt-dlp's --extract-audio: one line, then silence until the conversion finishes
+    script = "import time\nprint('[ExtractAudio] Destination: a.mp3', flush=True)\ntime.sleep(1)\nprint('done')\n"
+    converting = []
+    result = ProcessSupervisor().run(python(script), stall_timeout=lambda: None if converting else 0.3,
+                                     on_output=lambda line: converting.append(line.startswith('[ExtractAudio]')))
+    assert result.reason is None and result.stdout.endswith('done\n')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the thumbnail proxy cache, against a local image server
+"""
+
+import io
+import os
+import sys
+import threading
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from fake_youtube import FakeYouTube
+from fixture_server import FixtureServer, fixture_image
+from thumbnails import SIZES, ThumbnailCache, ThumbnailError, negotiate_format
+
+
+@pytest.fixture
+def image_server():
+    with FixtureServer({'/hq.jpg': (fixture_image(), 'image/jpeg'),
+                        '/broken.jpg': (b'not an image', 'image/jpeg')}) as server:
+        yield server
+
+
+def test_variants_are_resized_from_one_fetch(tmp_path, image_server):
+    cache = ThumbnailCache(str(tmp_path))
+    url = image_server.url('/hq.jpg')
+    for size, width in SIZES.items():
+        for fmt, pillow_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            with Image.open(cache.get('dQw4w9WgXcQ', url, size=size, fmt=fmt)) as image:
+                assert image.format == pillow_format and image.size == (width, width * 9 // 16)
+    assert image_server.httpd.requests == 1
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 5
+    assert os.path.getsize(cache.get('dQw4w9WgXcQ', url, size='medium')) < len(fixture_image()) / 4
+
+
+def test_concurrent_misses_share_a_fetch(tmp_path, image_server):
+    cache = ThumbnailCache(str(tmp_path))
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.get('dQw4w9WgXcQ', image_server.url('/hq.jpg'))))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 1 and image_server.httpd.requests == 1
+
+
+def test_least_recently_used_videos_are_evicted(tmp_path, image_server):
+    cache = ThumbnailCache(str(tmp_path))
+    cache.get('aaaaaaaaaaa', image_server.url('/hq.jpg'))
+    entry_bytes = cache.evict()
+    cache.max_bytes = int(entry_bytes * 2.5)
+
+    cache.get('bbbbbbbbbbb', image_server.url('/hq.jpg'))
+    os.utime(tmp_path / 'bbbbbbbbbbb', (1, 1))  # make it the least recently used
+    cache.get('ccccccccccc', image_server.url('/hq.jpg'))
+    assert sorted(os.listdir(tmp_path)) == ['aaaaaaaaaaa', 'ccccccccccc']
+
+
+def test_unusable_sources_are_not_cached(tmp_path, image_server):
+    cache = ThumbnailCache(str(tmp_path))
+    with pytest.raises(ThumbnailError, match="readable"):
+        cache.get('dQw4w9WgXcQ', image_server.url('/broken.jpg'))
+    with pytest.raises(ThumbnailError, match="404"):
+        cache.get('dQw4w9WgXcQ', image_server.url('/missing.jpg'))
+    assert os.listdir(tmp_path) == [] and cache.stats()['fetch_errors'] == 2
+
+
+def test_format_negotiation():
+    assert negotiate_format('image/avif,image/webp,*/*') == 'webp'
+    assert negotiate_format('image/png,*/*') == 'jpeg'
+    assert negotiate_format('image/webp', 'jpeg') == 'jpeg'
+
+
+def test_thumbnail_endpoint_serves_cached_variants(tmp_path, monkeypatch):
+    import app_simple
+    with FakeYouTube(size_scale=0.01) as fake:
+        monkeypatch.setattr(app_simple.downloader, 'extractor', fake)
+        monkeypatch.setattr(app_simple, 'thumbnail_cache', ThumbnailCache(str(tmp_path)))
+        client = app_simple.app.test_client()
+
+        info = client.post('/api/video-info', json={'url': 'https://youtu.be/thumbs00001'}).get_json()
+        assert info['thumbnail'] == '/api/thumbnail/thumbs00001'
+
+        response = client.get(info['thumbnail'], headers={'Accept': 'image/webp,*/*'})
+        assert response.status_code == 200 and response.mimetype == 'image/webp'
+        assert response.cache_control.max_age == app_simple.THUMBNAIL_MAX_AGE and response.cache_control.public
+        assert 'Accept' in response.vary
+        assert Image.open(io.BytesIO(response.data)).width == SIZES['medium']
+
+        revalidated = client.get(info['thumbnail'], headers={'Accept': 'image/webp', 'If-None-Match': response.get_etag()[0]})
+        assert revalidated.status_code == 304
+
+        large = client.get(f"{info['thumbnail']}?size=large&format=jpeg")
+        assert large.mimetype == 'image/jpeg' and Image.open(io.BytesIO(large.data)).width == SIZES['large']
+        assert fake.server.httpd.requests == 1
+
+        assert client.get('/api/thumbnail/thumbs00001?size=huge').status_code == 404
+        assert client.get('/api/thumbnail/..%2Fetc').status_code == 404
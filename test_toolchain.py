@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for FFmpeg/yt-dlp discovery and its on-disk probe cache
+"""
+
+import os
+import sys
+
+import pytest
+
+from toolchain import Toolchain
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="uses a shell script as a stand-in ffmpeg")
+
+
+def fake_ffmpeg(path, version):
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\necho "ffmpeg version {version} Copyright (c) the FFmpeg developers"\n')
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+def test_probe_is_cached_until_the_binary_changes(tmp_path):
+    ffmpeg = fake_ffmpeg(tmp_path / "ffmpeg", "7.1")
+    cache_file = str(tmp_path / "toolchain.json")
+
+    first = Toolchain(cache_file=cache_file, ffmpeg=ffmpeg)
+    assert first.ffmpeg == ffmpeg
+    assert first.stats()['ffmpeg']['version'] == '7.1'
+    assert first.probes == 1
+
+    # A new worker reads the cache instead of spawning ffmpeg
+    second = Toolchain(cache_file=cache_file, ffmpeg=ffmpeg)
+    assert second.ffmpeg == ffmpeg
+    assert (second.probes, second.cache_hits) == (0, 1)
+
+    # Upgrading the binary changes its size/mtime, so it is probed again
+    fake_ffmpeg(tmp_path / "ffmpeg", "7.1.1-upgraded")
+    third = Toolchain(cache_file=cache_file, ffmpeg=ffmpeg)
+    assert third.stats()['ffmpeg'] is None  # Not resolved until first use
+    assert third.resolve()['ffmpeg']['version'] == '7.1.1-upgraded'
+    assert third.probes == 1
+
+
+def test_broken_or_missing_ffmpeg_resolves_to_none(tmp_path):
+    broken = tmp_path / "ffmpeg"
+    broken.write_text('#!/bin/sh\nexit 1\n')
+    broken.chmod(0o755)
+    cache_file = str(tmp_path / "toolchain.json")
+
+    assert Toolchain(cache_file=cache_file, ffmpeg=str(broken)).ffmpeg is None
+    cached = Toolchain(cache_file=cache_file, ffmpeg=str(broken))
+    assert cached.ffmpeg is None and cached.probes == 0
+    assert Toolchain(ffmpeg=str(tmp_path / "missing")).ffmpeg is None
+
+
+def test_yt_dlp_runs_as_this_interpreters_module_without_spawning():
+    yt_dlp = pytest.importorskip('yt_dlp')
+    toolchain = Toolchain()
+    assert toolchain.yt_dlp == [sys.executable, '-m', 'yt_dlp']
+    assert toolchain.resolve()['yt_dlp']['version'] == yt_dlp.version.__version__
+    assert toolchain.probes == 0
+
+
+def test_background_start_and_explicit_yt_dlp_command(tmp_path):
+    script = tmp_path / "yt-dlp"
+    script.write_text('#!/bin/sh\necho 2099.01.01\n')
+    script.chmod(0o755)
+    toolchain = Toolchain(yt_dlp=f"{script} --no-config")
+    toolchain.start()
+    assert toolchain.yt_dlp == [str(script), '--no-config']
+    assert toolchain.resolve()['yt_dlp']['version'] == '2099.01.01'
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for YouTube URL parsing and normalization
+"""
+
+import pytest
+
+from youtube_url import YouTubeURL, canonical_url, parse_youtube_url
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VIDEO_ID}',
+    f'youtube.com/watch?v={VIDEO_ID}',
+    f'https://m.youtube.com/watch?feature=share&v={VIDEO_ID}&t=42s',
+    f'https://music.youtube.com/watch?v={VIDEO_ID}&si=abc123',
+    f'https://youtu.be/{VIDEO_ID}?t=10',
+    f'https://www.youtube.com/embed/{VIDEO_ID}?autoplay=1',
+    f'https://www.youtube-nocookie.com/embed/{VIDEO_ID}',
+    f'https://www.youtube.com/shorts/{VIDEO_ID}',
+    f'https://www.youtube.com/live/{VIDEO_ID}?feature=shared',
+    f'HTTPS://WWW.YOUTUBE.COM/watch?v={VIDEO_ID}',
+])
+def test_video_variants_normalize_to_one_url(url):
+    parsed = parse_youtube_url(url)
+    assert parsed.kind == 'video'
+    assert parsed.video_id == VIDEO_ID
+    assert canonical_url(parsed) == f'https://www.youtube.com/watch?v={VIDEO_ID}'
+
+
+def test_watch_url_keeps_its_playlist_either_side_of_v():
+    for url in (f'https://www.youtube.com/watch?v={VIDEO_ID}&list=PL123',
+                f'https://www.youtube.com/watch?list=PL123&v={VIDEO_ID}'):
+        assert parse_youtube_url(url) == YouTubeURL('video', VIDEO_ID, 'PL123', None)
+
+
+@pytest.mark.parametrize('url, kind, canonical', [
+    ('https://www.youtube.com/playlist?list=PLabc-1_2', 'playlist', 'https://www.youtube.com/playlist?list=PLabc-1_2'),
+    ('https://m.youtube.com/playlist?si=x&list=PLabc', 'playlist', 'https://www.youtube.com/playlist?list=PLabc'),
+    ('https://www.youtube.com/@some.channel/videos', 'channel', 'https://www.youtube.com/@some.channel'),
+    ('https://www.youtube.com/channel/UC1234567890', 'channel', 'https://www.youtube.com/channel/UC1234567890'),
+    ('youtube.com/user/someone', 'channel', 'https://www.youtube.com/user/someone'),
+])
+def test_playlists_and_channels(url, kind, canonical):
+    parsed = parse_youtube_url(url)
+    assert parsed.kind == kind
+    assert canonical_url(parsed) == canonical
+
+
+@pytest.mark.parametrize('url', [
+    'https://vimeo.com/12345',
+    f'https://www.youtube.com/watch?v={VIDEO_ID}X',  # 12-character ID
+    'https://www.youtube.com/watch?v=short',
+    f'https://notyoutube.com/watch?v={VIDEO_ID}',
+    f'https://evil.example/?u=https://youtu.be/{VIDEO_ID}',
+    'https://www.youtube.com/feed/trending',
+    '',
+])
+def test_rejects_other_urls(url):
+    assert parse_youtube_url(url) is None
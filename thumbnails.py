@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Thumbnail proxy cache
+Each video's thumbnail is fetched from upstream once and re-encoded into a few small
+WebP and JPEG variants, kept in <root>/<video ID>/ and evicted least recently used first
+when the cache outgrows its quota. The app serves the variants with long-lived cache headers.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from PIL import Image, UnidentifiedImageError
+
+from logs import get_logger
+
+log = get_logger('thumbnails')
+
+# Variant widths; the page shows thumbnails at up to 300px, so large covers 2x displays
+SIZES = {'small': 160, 'medium': 320, 'large': 640}
+# format name -> (Pillow format, extension, MIME type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+QUALITY = 80
+# Upstream images bigger than this are refused rather than decoded
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+
+class ThumbnailError(Exception):
+    """The upstream thumbnail could not be fetched or decoded"""
+
+
+class ThumbnailCache:
+    """Resized thumbnail variants on disk, keyed by video ID"""
+
+    def __init__(self, root, max_bytes=64 * 1024 * 1024, max_age=7 * 86400, timeout=10, user_agent=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+        self._fetching = {}  # video_id -> Lock held while its thumbnail is fetched
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, video_id, source, size='medium', fmt='webp'):
+        """Path of a cached variant, fetching and resizing the source first if needed
+
+        source is the upstream image URL, or a function returning it that is only called on
+        a miss. Concurrent misses for one video share a fetch. Raises ThumbnailError when the
+        source can't be fetched or isn't an image.
+        """
+        path = self._lookup(video_id, size, fmt)
+        if path:
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            self.misses += 1
+            fetching = self._fetching.setdefault(video_id, threading.Lock())
+        with fetching:
+            # Another request may have filled it while we waited
+            path = self._lookup(video_id, size, fmt)
+            if not path:
+                try:
+                    self._store(video_id, self._fetch(source() if callable(source) else source))
+                except ThumbnailError:
+                    with self._lock:
+                        self.fetch_errors += 1
+                    raise
+                finally:
+                    with self._lock:
+                        self._fetching.pop(video_id, None)
+                self.evict()
+                path = self._lookup(video_id, size, fmt)
+        return path
+
+    def _lookup(self, video_id, size, fmt):
+        entry_dir = os.path.join(self.root, video_id)
+        path = os.path.join(entry_dir, variant_name(size, fmt))
+        try:
+            if time.time() - os.path.getmtime(entry_dir) > self.max_age:
+                self._remove(entry_dir)
+                return None
+            if not os.path.exists(path):
+                return None
+            # Directory mtime doubles as the entry's last-used time for LRU eviction
+            os.utime(entry_dir)
+        except OSError:
+            return None
+        return path
+
+    def _fetch(self, source_url):
+        if not source_url or not source_url.startswith(('http://', 'https://')):
+            raise ThumbnailError("No thumbnail URL")
+        request = urllib.request.Request(source_url, headers={'User-Agent': self.user_agent} if self.user_agent else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read(MAX_SOURCE_BYTES + 1)
+        except (OSError, urllib.error.URLError) as e:
+            raise ThumbnailError(f"Fetching thumbnail failed: {e}")
+        if len(data) > MAX_SOURCE_BYTES:
+            raise ThumbnailError("Thumbnail is too large")
+        return data
+
+    def _store(self, video_id, data):
+        """Write every variant of the source image into a fresh entry, replacing any old one"""
+        try:
+            source = Image.open(io.BytesIO(data))
+            source.load()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ThumbnailError(f"Thumbnail is not a readable image: {e}")
+        source = source.convert('RGB')
+
+        # Build the entry beside the cache and move it in whole, so readers never see half of it
+        temp_dir = tempfile.mkdtemp(prefix=f".{video_id}-", dir=self.root)
+        try:
+            for size, width in SIZES.items():
+                image = source
+                if source.width > width:
+                    image = source.resize((width, max(1, round(source.height * width / source.width))),
+                                          Image.LANCZOS)
+                for fmt, (pillow_format, _, _) in FORMATS.items():
+                    image.save(os.path.join(temp_dir, variant_name(size, fmt)), pillow_format,
+                               quality=QUALITY, optimize=True)
+            entry_dir = os.path.join(self.root, video_id)
+            self._remove(entry_dir)
+            os.replace(temp_dir, entry_dir)
+        except BaseException:
+            self._remove(temp_dir)
+            raise
+        log.debug("Thumbnail cached", extra={'video_id': video_id, 'source_bytes': len(data)})
+
+    def evict(self):
+        """Remove expired entries, then least recently used ones until under the size quota
+
+        Returns the bytes left in the cache.
+        """
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            if name.startswith('.'):
+                continue
+            try:
+                used = os.path.getmtime(entry_dir)
+                size = sum(os.path.getsize(os.path.join(entry_dir, variant)) for variant in os.listdir(entry_dir))
+            except OSError:
+                continue
+            if now - used > self.max_age:
+                self._remove(entry_dir)
+            else:
+                entries.append((used, size, entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for used, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(entry_dir)
+            total -= size
+        return total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetch_errors': self.fetch_errors,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remove(self, entry_dir):
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def variant_name(size, fmt):
+    return f"{size}.{FORMATS[fmt][1]}"
+
+
+def negotiate_format(accept, requested=None):
+    """The variant format to serve: the requested one if valid, else WebP when the client accepts it"""
+    if requested in FORMATS:
+        return requested
+    return 'webp' if 'image/webp' in (accept or '') else 'jpeg'
+
+
+def create_thumbnail_cache(download_path, user_agent=None):
+    """Create the cache configured by YTDL_THUMBNAIL_CACHE_DIR and YTDL_THUMBNAIL_CACHE_MAX_MB"""
+    return ThumbnailCache(
+        root=os.environ.get('YTDL_THUMBNAIL_CACHE_DIR') or os.path.join(download_path, 'ytdl-thumbnails'),
+        max_bytes=int(os.environ.get('YTDL_THUMBNAIL_CACHE_MAX_MB', 64)) * 1024 * 1024,
+        user_agent=user_agent,
+    )
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+FFmpeg and yt-dlp discovery
+Binaries are located once per worker, off the boot path, and every probe is cached on disk
+keyed by the binary's path, size and mtime, so later boots skip the `-version` spawns until
+a binary is upgraded
+"""
+
+import importlib.util
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from logs import get_logger
+from metrics import count_spawn
+
+log = get_logger('toolchain')
+
+# Checked (with os.path.exists, no spawn) when ffmpeg is not on PATH
+FFMPEG_CANDIDATES = [
+    "/usr/local/bin/ffmpeg",
+    "/opt/homebrew/bin/ffmpeg",
+    "/usr/bin/ffmpeg",
+]
+if os.name == 'nt':
+    FFMPEG_CANDIDATES += [
+        r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
+        r"C:\ffmpeg\bin\ffmpeg.exe",
+        r"C:\ffmpeg-7.1.1-full_build\bin\ffmpeg.exe",
+        os.path.expandvars(r"%LOCALAPPDATA%\Microsoft\WinGet\Links\ffmpeg.exe"),
+    ]
+
+FFMPEG_VERSION_PATTERN = re.compile(r'version (\S+)')
+MODULE_VERSION_PATTERN = re.compile(r"""__version__\s*=\s*['"]([^'"]+)['"]""")
+
+
+def module_version(package_dir):
+    """yt_dlp's version read from its version.py, without importing the package"""
+    try:
+        with open(os.path.join(package_dir, 'version.py'), encoding='utf-8') as f:
+            match = MODULE_VERSION_PATTERN.search(f.read())
+        return match.group(1) if match else None
+    except OSError:
+        return None
+
+
+class Toolchain:
+    """Where FFmpeg and yt-dlp live, resolved on first use or by start() in the background
+
+    ffmpeg and yt_dlp may name an explicit binary (yt_dlp may be a whole command line);
+    otherwise ffmpeg is looked up on PATH and in common install locations, and yt-dlp
+    runs as this interpreter's module, falling back to a yt-dlp binary on PATH.
+    """
+
+    def __init__(self, cache_file=None, ffmpeg=None, yt_dlp=None, probe_timeout=10):
+        self.cache_file = cache_file
+        self.ffmpeg_setting = ffmpeg
+        self.yt_dlp_setting = yt_dlp
+        self.probe_timeout = probe_timeout
+        self.cache_hits = 0
+        self.probes = 0
+        self.resolve_seconds = None
+        self._probe_cache = {}
+        self._resolved = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Resolve in a background thread so worker boot doesn't wait on the probes"""
+        threading.Thread(target=self.resolve, daemon=True, name='toolchain').start()
+
+    def resolve(self):
+        """Locate both tools (blocking until done); later calls return the same result"""
+        with self._lock:
+            if self._resolved is None:
+                started = time.perf_counter()
+                self._probe_cache = self._load_cache()
+                changed = self.probes
+                resolved = {'ffmpeg': self._resolve_ffmpeg(), 'yt_dlp': self._resolve_yt_dlp()}
+                if self.probes != changed:
+                    self._save_cache()
+                self.resolve_seconds = round(time.perf_counter() - started, 4)
+                self._resolved = resolved
+                self._log_result()
+            return self._resolved
+
+    @property
+    def ffmpeg(self):
+        """Path of a working ffmpeg, or None"""
+        return self.resolve()['ffmpeg']['path']
+
+    @property
+    def yt_dlp(self):
+        """Command prefix that runs yt-dlp"""
+        return list(self.resolve()['yt_dlp']['cmd'])
+
+    def stats(self):
+        resolved = self._resolved
+        return {
+            'resolved': resolved is not None,
+            'ffmpeg': resolved and resolved['ffmpeg'],
+            'yt_dlp': resolved and resolved['yt_dlp'],
+            'resolve_seconds': self.resolve_seconds,
+            'cache_hits': self.cache_hits,
+            'probes': self.probes,
+        }
+
+    def _resolve_ffmpeg(self):
+        if self.ffmpeg_setting:
+            candidates = [shutil.which(self.ffmpeg_setting) or self.ffmpeg_setting]
+        else:
+            candidates = [shutil.which('ffmpeg')] + [path for path in FFMPEG_CANDIDATES if os.path.exists(path)]
+        for path in filter(None, candidates):
+            version = self._probe(path, '-version', 'ffmpeg')
+            if version:
+                return {'path': path, 'version': version}
+        return {'path': None, 'version': None}
+
+    def _resolve_yt_dlp(self):
+        if self.yt_dlp_setting:
+            cmd = shlex.split(self.yt_dlp_setting, posix=os.name != 'nt')
+            binary = shutil.which(cmd[0]) or cmd[0]
+            return {'cmd': [binary] + cmd[1:], 'version': self._probe(binary, '--version', 'yt-dlp', cmd[1:])}
+
+        spec = importlib.util.find_spec('yt_dlp')
+        if spec and spec.submodule_search_locations:
+            version = module_version(list(spec.submodule_search_locations)[0])
+            return {'cmd': [sys.executable, '-m', 'yt_dlp'], 'version': version}
+
+        binary = shutil.which('yt-dlp')
+        if binary:
+            version = self._probe(binary, '--version', 'yt-dlp')
+            if version:
+                return {'cmd': [binary], 'version': version}
+        # Downloads will fail with yt-dlp's own "No module named yt_dlp" error
+        return {'cmd': [sys.executable, '-m', 'yt_dlp'], 'version': None}
+
+    def _probe(self, path, flag, program, prefix=()):
+        """Version reported by `path flag` (None if it doesn't run), cached by size and mtime"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = ' '.join([os.path.realpath(path), *prefix])
+        entry = self._probe_cache.get(key)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            self.cache_hits += 1
+            return entry['version']
+
+        self.probes += 1
+        version = None
+        try:
+            count_spawn(program)
+            result = subprocess.run([path, *prefix, flag], capture_output=True, text=True, timeout=self.probe_timeout)
+            if result.returncode == 0:
+                first_line = (result.stdout.splitlines() or [''])[0]
+                match = FFMPEG_VERSION_PATTERN.search(first_line)
+                version = match.group(1) if match else first_line.strip() or 'unknown'
+        except (OSError, subprocess.SubprocessError):
+            pass
+        self._probe_cache[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'version': version}
+        return version
+
+    def _load_cache(self):
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, encoding='utf-8') as f:
+                return json.load(f).get('probes', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        # Several workers may boot at once; each writes a whole file and renames it into place
+        temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'probes': self._probe_cache}, f)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            log.warning("Could not write the toolchain cache", extra={'path': self.cache_file, 'error': str(e)})
+
+    def _log_result(self):
+        ffmpeg = self._resolved['ffmpeg']
+        if ffmpeg['path']:
+            log.info("FFmpeg found", extra={'path': ffmpeg['path'], 'version': ffmpeg['version'],
+                                            'seconds': self.resolve_seconds, 'cached': self.probes == 0})
+        else:
+            log.warning("FFmpeg not found - merging, MP3 extraction and streaming are unavailable")
+        if not self._resolved['yt_dlp']['version']:
+            log.warning("yt-dlp not found", extra={'cmd': ' '.join(self._resolved['yt_dlp']['cmd'])})
+
+
+def create_toolchain():
+    """Toolchain configured from YTDL_FFMPEG, YTDL_YT_DLP and YTDL_TOOLCHAIN_CACHE"""
+    cache_file = os.environ.get('YTDL_TOOLCHAIN_CACHE',
+                                os.path.join(tempfile.gettempdir(), 'ytdl-toolchain.json'))
+    return Toolchain(cache_file=cache_file or None, ffmpeg=os.environ.get('YTDL_FFMPEG'),
+                     yt_dlp=os.environ.get('YTDL_YT_DLP'))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+YouTube URL parsing
+One precompiled pattern recognises every URL form we accept (watch, youtu.be, embed,
+shorts, live, playlists and channels on www/m/music hosts) and pulls out the canonical
+video or playlist ID in a single match
+"""
+
+import re
+from collections import namedtuple
+
+YouTubeURL = namedtuple('YouTubeURL', ['kind', 'video_id', 'playlist_id', 'channel'])
+
+_ID = r'[\w-]{11}(?![\w-])'
+
+URL_PATTERN = re.compile(rf"""
+    \s*(?:https?://)?
+    (?:(?:www|m|music)\.)?
+    (?:
+        youtu\.be/(?P<short>{_ID})
+      | (?:youtube\.com|youtube-nocookie\.com)/
+        (?:
+            watch/?\?(?:[^#]*?&)?v=(?P<watch>{_ID})
+          | (?:embed|shorts|live|v|e)/(?P<path>{_ID})
+          | playlist/?\?(?:[^#]*?&)?list=(?P<playlist>[\w-]+)
+          | (?P<channel>@[\w.-]+|channel/[\w-]+|c/[\w.-]+|user/[\w.-]+)(?=[/?#]|\s*$)
+        )
+    )
+""", re.VERBOSE | re.IGNORECASE)
+
+LIST_PARAM = re.compile(r'[?&]list=([\w-]+)')
+
+
+def parse_youtube_url(url):
+    """Return a YouTubeURL (kind is 'video', 'playlist' or 'channel') or None if it isn't one we accept"""
+    match = URL_PATTERN.match(url)
+    if match is None:
+        return None
+    video_id = match.group('watch') or match.group('short') or match.group('path')
+    if video_id:
+        # Watch URLs may carry the playlist they were opened from; we still download just the video
+        playlist = LIST_PARAM.search(url) if 'list=' in url else None
+        return YouTubeURL('video', video_id, playlist.group(1) if playlist else None, None)
+    if match.group('playlist'):
+        return YouTubeURL('playlist', None, match.group('playlist'), None)
+    return YouTubeURL('channel', None, None, match.group('channel'))
+
+
+def canonical_url(parsed):
+    """Normalized URL for a parsed YouTube URL (tracking parameters and hosts dropped)"""
+    if parsed.kind == 'video':
+        return f"https://www.youtube.com/watch?v={parsed.video_id}"
+    if parsed.kind == 'playlist':
+        return f"https://www.youtube.com/playlist?list={parsed.playlist_id}"
+    return f"https://www.youtube.com/{parsed.channel}"